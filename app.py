@@ -1,7 +1,9 @@
 import os
-from fastapi import FastAPI, HTTPException, Body, Response
+from fastapi import FastAPI, HTTPException, Body, Depends, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Dict, List, Any, Optional
 import uvicorn
 import pandas as pd
@@ -15,6 +17,9 @@ from dotenv import load_dotenv
 from carbon_footprint_calculator import CarbonFootprintCalculator
 from genai_api import GeminiInsightsGenerator
 from chroma_db_integration import ChromaDBManager
+from collection_pool import MEMORY_BUDGET_BYTES, CollectionPool
+from sqlite_store import open_storage
+from user_history import IndexedPurchases, open_user_history
 
 # Load environment variables from .env file
 load_dotenv()
@@ -47,10 +52,37 @@ except Exception as e:
     print(f"Error loading ML model: {e}")
     ml_model = None
 
+# Get the absolute path to the directory containing app.py
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Columns of the purchase records appended to datasets/df_2.csv by /submit-purchase-choice
+PURCHASE_COLUMNS = ['user_id', 'product_id', 'date', 'category_code', 'brand', 'price', 'cf_score', 'cf_category', 'choice']
+
+# Purchase history and streaks, opened by the startup event (so importing app starts no threads and
+# runs no migration): with STORAGE_BACKEND=files (the default) purchases are appended to df_2.csv by a
+# batched writer and streaks are kept in memory and written back to user_streaks.json; with
+# STORAGE_BACKEND=sqlite both live in an indexed SQLite database (imported from those files on first start).
+# STORAGE_DIR moves those files elsewhere (e.g. for tests).
+# The files backend and the purchase log belong to one process: run a single worker (uvicorn --workers 1);
+# a second worker on the same files fails at startup because it can't take their lock
+purchase_backend = None
+streak_service = None
+
+# Per-user view of the purchase history (for /users/{user_id}/history): SQLite answers from its (user_id, date)
+# index; the CSV history is indexed in memory at startup and every purchase written afterwards is added to it
+purchase_history = None
+
 # Initialize the CF calculator and ChromaDB manager
 calculator = CarbonFootprintCalculator()
 db_manager = ChromaDBManager(collection_name="products", persistence_path="./chroma_db")
 
+# Other catalogs (per region or tenant) are opened from their snapshots on first use and evicted when
+# idle once the loaded ones use more than COLLECTION_MEMORY_BUDGET_MB; the default one stays loaded
+collection_pool = CollectionPool(
+    persistence_path="./chroma_db",
+    memory_budget_bytes=int(os.getenv('COLLECTION_MEMORY_BUDGET_MB', MEMORY_BUDGET_BYTES // 1024 ** 2)) * 1024 ** 2)
+collection_pool.add(db_manager, pinned=True)
+
 # Initialize the Gemini insights generator
 insights_generator = GeminiInsightsGenerator()
 
@@ -68,13 +100,25 @@ class RecommendationInput(BaseModel):
     user_id: str
     product_id: str
 
+class ProductQueryInput(BaseModel):
+    where: Optional[Dict[str, Any]] = None
+    order_by: Optional[str] = None
+    limit: int = 10
+    explain: bool = False
+
 class PurchaseChoiceInput(BaseModel):
     user_id: str
     product_id: str
     choice: str  # "ai_suggested" or "original"
 
-# Get the absolute path to the directory containing app.py
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Maximum number of products accepted by /calculate-cf-batch in one call
+MAX_BATCH_SIZE = 10000
+
+# Maximum page size of JSON product listings (use the cursor or format=ndjson for more)
+MAX_PAGE_SIZE = 1000
+
+# Lines sent per chunk of an NDJSON stream
+NDJSON_CHUNK_LINES = 500
 
 # Root endpoint
 @app.get("/")
@@ -88,9 +132,8 @@ def calculate_cf(product: ProductInput):
         # Convert input to dictionary
         product_dict = product.dict()
         
-        # Calculate CF score
-        cf_score = calculator.calculate_cf_score(product_dict)
-        cf_category = calculator.classify_cf_score(cf_score)
+        # Calculate CF score (repeated products are served from the calculator's cache)
+        cf_score, cf_category = calculator.score_product(product_dict)
         
         return {
             "cf_score": round(cf_score, 2),
@@ -100,11 +143,58 @@ def calculate_cf(product: ProductInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculating CF score: {str(e)}")
 
+# Calculate CF scores for many products at once
+@app.post("/calculate-cf-batch")
+def calculate_cf_batch(products: List[Any] = Body(...)):
+    if len(products) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(products)} products (max {MAX_BATCH_SIZE})")
+    try:
+        # Validate each product on its own so one bad item doesn't fail the batch
+        results = []
+        valid_products = []
+        valid_indexes = []
+        for index, item in enumerate(products):
+            try:
+                valid_products.append(ProductInput.parse_obj(item).dict())
+                valid_indexes.append(index)
+                results.append(None)
+            except ValidationError as e:
+                errors = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+                results.append({"index": index, "error": errors})
+        
+        # Score all valid products in one vectorized pass
+        cf_scores, cf_categories = calculator.score_products(valid_products)
+        for index, cf_score, cf_category in zip(valid_indexes, cf_scores.tolist(), cf_categories.tolist()):
+            results[index] = {
+                "index": index,
+                "cf_score": round(cf_score, 2),
+                "cf_category": cf_category
+            }
+        
+        return {
+            "results": results,
+            "count": len(results),
+            "error_count": len(results) - len(valid_indexes)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculating CF scores: {str(e)}")
+
+# The catalog a request reads, chosen with ?collection=<name> (the default collection otherwise);
+# it stays loaded until the request is done
+def collection_manager(collection: Optional[str] = None):
+    if collection is None or collection == db_manager.collection_name:
+        yield db_manager
+        return
+    if collection not in collection_pool.names():
+        raise HTTPException(status_code=404, detail=f"Unknown collection: {collection}")
+    with collection_pool.collection(collection) as manager:
+        yield manager
+
 # Get product alternatives with lower CF scores
 @app.get("/alternatives/{product_id}")
-def get_alternatives(product_id: str, limit: int = 5):
+def get_alternatives(product_id: str, limit: int = 5, db: ChromaDBManager = Depends(collection_manager)):
     try:
-        alternatives = db_manager.get_sustainable_alternatives(product_id, limit)
+        alternatives = db.get_sustainable_alternatives(product_id, limit)
         return {
             "alternatives": alternatives,
             "count": len(alternatives)
@@ -112,33 +202,156 @@ def get_alternatives(product_id: str, limit: int = 5):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error finding alternatives: {str(e)}")
 
-# Query products by brand
-@app.get("/products/brand/{brand}")
-def query_by_brand(brand: str, limit: int = 10):
+# Get similar products with lower CF scores, ranked by similarity and CF reduction
+@app.get("/similar-alternatives/{product_id}")
+def get_similar_alternatives(product_id: str, limit: int = 5, db: ChromaDBManager = Depends(collection_manager)):
     try:
-        products = db_manager.query_by_brand(brand, limit)
+        alternatives = db.get_similar_alternatives(product_id, limit)
+        return {
+            "alternatives": alternatives,
+            "count": len(alternatives)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error finding alternatives: {str(e)}")
+
+# Stream (record, cursor) pairs as NDJSON, ending with a next_cursor line if the limit cut the results short
+def ndjson_lines(items, limit: Optional[int]):
+    lines = []
+    previous_cursor = None
+    for count, (record, record_cursor) in enumerate(items):
+        if limit is not None and count == limit:
+            lines.append(json.dumps({"next_cursor": previous_cursor}) + "\n")
+            break
+        lines.append(json.dumps(record, default=str) + "\n")
+        previous_cursor = record_cursor
+        if len(lines) == NDJSON_CHUNK_LINES:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+# List products one page (format=json) or as a stream (format=ndjson), resuming from a cursor
+def list_products(page, stream, key: str, limit: Optional[int], cursor: Optional[str], format: str):
+    try:
+        if format == "ndjson":
+            return StreamingResponse(ndjson_lines(stream(key, cursor), limit), media_type="application/x-ndjson")
+        if format != "json":
+            raise HTTPException(status_code=400, detail=f"Unknown format: {format} (use json or ndjson)")
+        limit = 10 if limit is None else limit
+        if limit > MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"limit too large: {limit} (max {MAX_PAGE_SIZE}, use the cursor or format=ndjson)")
+        products, next_cursor = page(key, limit, cursor)
         return {
             "products": products,
-            "count": len(products)
+            "count": len(products),
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying products: {str(e)}")
 
+# Query products by brand
+@app.get("/products/brand/{brand}")
+def query_by_brand(brand: str, limit: Optional[int] = None, cursor: Optional[str] = None, format: str = "json",
+                   db: ChromaDBManager = Depends(collection_manager)):
+    return list_products(db.page_by_brand, db.stream_by_brand, brand, limit, cursor, format)
+
 # Query products by CF category
 @app.get("/products/category/{category}")
-def query_by_cf_category(category: str, limit: int = 10):
+def query_by_cf_category(category: str, limit: Optional[int] = None, cursor: Optional[str] = None, format: str = "json",
+                         db: ChromaDBManager = Depends(collection_manager)):
+    return list_products(db.page_by_cf_category, db.stream_by_cf_category, category, limit, cursor, format)
+
+# Query products with a Chroma-style where clause
+@app.post("/products/query")
+def query_products(query: ProductQueryInput, db: ChromaDBManager = Depends(collection_manager)):
     try:
-        products = db_manager.query_by_cf_category(category, limit)
-        return {
+        products = db.query(query.where, order_by=query.order_by, limit=query.limit)
+        result = {
             "products": products,
             "count": len(products)
         }
+        if query.explain:
+            result["plan"] = db.explain(query.where, order_by=query.order_by, limit=query.limit)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error querying products: {str(e)}")
 
+# Score a product and add it to the catalog (it counts in /stats right away)
+@app.post("/products")
+def add_product(product: ProductInput, db: ChromaDBManager = Depends(collection_manager)):
+    try:
+        product_dict = product.dict()
+        cf_score, cf_category = calculator.score_product(product_dict)
+        product_dict["cf_score"] = round(cf_score, 2)
+        product_dict["cf_category"] = cf_category
+        return {
+            "product_id": db.add_product(product_dict),
+            "product": product_dict
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error adding product: {str(e)}")
+
+# CF score statistics per brand, with the most and least sustainable brands by average CF score
+@app.get("/stats/brands")
+def get_brand_stats(brand: Optional[str] = None, top: int = 10, min_products: int = 1,
+                    db: ChromaDBManager = Depends(collection_manager)):
+    try:
+        if brand is not None:
+            stats = db.get_brand_stats(brand)
+            if stats is None:
+                raise HTTPException(status_code=404, detail=f"No scored products for brand: {brand}")
+            return stats
+        return {
+            "brand_count": db.brand_count,
+            "most_sustainable": db.brand_leaderboard(top, most_sustainable=True, min_products=min_products),
+            "least_sustainable": db.brand_leaderboard(top, most_sustainable=False, min_products=min_products)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading brand statistics: {str(e)}")
+
+# CF score statistics per category_code and CF category distribution
+@app.get("/stats/categories")
+def get_category_stats(db: ChromaDBManager = Depends(collection_manager)):
+    try:
+        return db.get_category_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading category statistics: {str(e)}")
+
+# Get a user's purchase history, newest first
+@app.get("/purchases/user/{user_id}")
+def get_user_purchases(user_id: str, limit: int = 20):
+    try:
+        purchases = db_manager.get_user_purchases(user_id, limit)
+        return {
+            "purchases": purchases,
+            "count": len(purchases)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading purchases: {str(e)}")
+
+# Get a user's streak, latest purchases and CF total over a date window
+# (the streak is the one /user-streak reports; the rest comes from the per-user purchase history)
+@app.get("/users/{user_id}/history")
+def get_user_history(user_id: str, limit: int = 10, start: Optional[str] = None, end: Optional[str] = None):
+    return {
+        "user_id": user_id,
+        "streak": streak_service.get(user_id),
+        "purchase_count": purchase_history.purchase_count_of(user_id),
+        "purchases": purchase_history.last_purchases(user_id, max(limit, 0)),
+        "cf_total": dict(purchase_history.cf_total(user_id, start, end), start=start, end=end)
+    }
+
 # Get personalized recommendations using Gemini
 @app.post("/get-recommendations")
-def get_recommendations(input_data: RecommendationInput):
+async def get_recommendations(input_data: RecommendationInput):
     try:
         user_id = input_data.user_id
         product_id = input_data.product_id
@@ -146,11 +359,7 @@ def get_recommendations(input_data: RecommendationInput):
         # Get product details
         # This would typically come from the database
         # For now, we'll use a mock product if it's not in the DB
-        product = None
-        for i, pid in enumerate(db_manager.ids):
-            if pid == product_id:
-                product = db_manager.products_data[i]
-                break
+        product = await run_in_threadpool(db_manager.get_by_id, product_id)
         
         if not product:
             # Mock product for testing
@@ -167,10 +376,11 @@ def get_recommendations(input_data: RecommendationInput):
             }
         
         # Get alternatives with lower CF
-        alternatives = db_manager.get_sustainable_alternatives(product_id, limit=3)
+        alternatives = await run_in_threadpool(db_manager.get_sustainable_alternatives, product_id, limit=3)
         
-        # Generate insights using Gemini
-        insights = insights_generator.generate_recommendations(
+        # Generate insights using Gemini without holding a worker thread (at most MAX_CONCURRENT_REQUESTS
+        # calls in flight; the generic insights are returned once the deadline passes)
+        insights = await insights_generator.generate_recommendations_async(
             user_id=user_id,
             product=product,
             alternatives=alternatives
@@ -186,6 +396,27 @@ def get_recommendations(input_data: RecommendationInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
 
+# Single-product CF score cache statistics
+@app.get("/admin/cf-cache-stats")
+def get_cf_cache_stats():
+    return calculator.cache_stats()
+
+# Residency, memory and hit statistics of the hosted collections
+@app.get("/admin/collections")
+def get_collection_stats():
+    return collection_pool.stats()
+
+# Register a collection to import from a CSV file on first use (collections with a snapshot need no registration)
+@app.post("/admin/collections/{name}")
+def register_collection(name: str, file_path: str = Body(..., embed=True)):
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    try:
+        collection_pool.register(name, file_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "collection": name}
+
 # Initialize database from CSV file
 @app.post("/admin/init-db")
 def initialize_database(file_path: str = Body(..., embed=True)):
@@ -210,41 +441,34 @@ async def startup_event():
     # Initialize DB with sample data if available
     if os.path.exists('data.csv'):
         try:
-            db_manager.csv_to_chroma('data.csv')
-            print(f"Initialized database with {len(db_manager.products_data)} records from data.csv")
+            # Reuse the saved snapshot unless data.csv changed since it was built
+            from_snapshot = db_manager.load_or_build('data.csv')
+            source = f"snapshot {db_manager.snapshot_version}" if from_snapshot else "data.csv"
+            print(f"Initialized database with {len(db_manager.products_data)} products and "
+                  f"{len(db_manager.purchases)} purchases from {source}")
         except Exception as e:
             print(f"Error initializing database: {e}")
-
-# Load user purchase history from CSV
-def load_user_purchase_history():
-    try:
-        csv_path = os.path.join(BASE_DIR, 'datasets', 'df_2.csv')
-        df = pd.read_csv(csv_path)
-        return df
-    except Exception as e:
-        print(f"Error loading user purchase history from {csv_path}: {e}")
-        return pd.DataFrame()
-
-# Save user purchase history to CSV
-def save_user_purchase_history(df):
+    
+    global purchase_backend, purchase_history, streak_service
+    purchase_backend, streak_service = open_storage(os.getenv('STORAGE_DIR', BASE_DIR), PURCHASE_COLUMNS)
+    
+    # Index the stored purchase history per user (purchases recorded from now on are indexed as they arrive)
     try:
-        csv_path = os.path.join(BASE_DIR, 'datasets', 'df_2.csv')
-        df.to_csv(csv_path, index=False)
+        purchase_history = open_user_history(purchase_backend)
     except Exception as e:
-        print(f"Error saving user purchase history to {csv_path}: {e}")
-
-# Get user's sustainable purchase streak
-def get_user_streak(user_id: str) -> int:
-    df = load_user_purchase_history()
-    user_purchases = df[df['user_id'] == user_id].sort_values('date', ascending=False)
-    
-    streak = 0
-    for _, purchase in user_purchases.iterrows():
-        if purchase['choice'] == 'ai_suggested':
-            streak += 1
-        else:
-            break
-    return streak
+        print(f"Error indexing user purchase history: {e}")
+        purchase_history = IndexedPurchases(purchase_backend)
+
+# App shutdown event
+@app.on_event("shutdown")
+def shutdown_event():
+    # Flush logged purchases that haven't been fsynced yet, in every loaded collection
+    collection_pool.close()
+    # Write the purchases still queued for df_2.csv and the streaks changed since the last flush
+    if purchase_history is not None:
+        purchase_history.close()
+    if streak_service is not None:
+        streak_service.close()
 
 # Add this at the top of your file with other imports and global variables
 latest_product_data = {}
@@ -269,9 +493,10 @@ async def calculate_carbon_footprint(input_data: ProductInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Submit purchase choice and handle incentivization
+# Submit purchase choice and handle incentivization (a plain def, so FastAPI runs it in the threadpool:
+# the storage writes, streak update and purchase log commit block)
 @app.post("/submit-purchase-choice")
-async def submit_purchase_choice(input_data: PurchaseChoiceInput):
+def submit_purchase_choice(input_data: PurchaseChoiceInput):
     try:
         user_id = input_data.user_id
         product_id = input_data.product_id
@@ -293,34 +518,12 @@ async def submit_purchase_choice(input_data: PurchaseChoiceInput):
             'choice': choice
         }
         
-        # Load existing data
-        csv_path = os.path.join(BASE_DIR, 'datasets', 'df_2.csv')
-        try:
-            df = pd.read_csv(csv_path)
-            print(f"Loaded {len(df)} existing records from CSV")
-        except Exception as e:
-            print(f"Creating new CSV file as existing one couldn't be loaded: {e}")
-            df = pd.DataFrame()
-        
-        # Append new purchase
-        df = pd.concat([df, pd.DataFrame([new_purchase])], ignore_index=True)
-        
-        # Save updated data
-        df.to_csv(csv_path, index=False)
-        print(f"Saved {len(df)} records to CSV file")
+        # Write the purchase to the history backend (df_2.csv through the sink's writer thread, or SQLite)
+        # and to the per-user history index
+        purchase_history.append(new_purchase)
         
-        # Load and update user streak
-        user_streaks = load_user_streaks()
-        current_streak = user_streaks.get(user_id, 0)
-        
-        if choice == 'ai_suggested':
-            current_streak += 1
-        else:
-            current_streak = 0
-            
-        # Save updated streak
-        user_streaks[user_id] = current_streak
-        save_user_streaks(user_streaks)
+        # Update user streak (kept by the streak backend)
+        current_streak = streak_service.record_choice(user_id, choice == 'ai_suggested')
         print(f"Updated streak for user {user_id}: {current_streak}")
         
         # Prepare reward message
@@ -338,13 +541,6 @@ async def submit_purchase_choice(input_data: PurchaseChoiceInput):
         except Exception as e:
             print(f"Warning: Could not update ChromaDB: {e}")
         
-        # Verify streak was saved
-        updated_streaks = load_user_streaks()
-        if updated_streaks.get(user_id) != current_streak:
-            print(f"Warning: Streak may not have been saved correctly. Expected: {current_streak}, Found: {updated_streaks.get(user_id)}")
-            # Try saving again
-            save_user_streaks(user_streaks)
-        
         return {
             "success": True,
             "message": f"Purchase choice recorded successfully. {reward_message}",
@@ -357,10 +553,9 @@ async def submit_purchase_choice(input_data: PurchaseChoiceInput):
 
 # Add an endpoint to get user's current streak
 @app.get("/user-streak/{user_id}")
-async def get_user_streak(user_id: str):
+def get_user_streak(user_id: str):
     try:
-        user_streaks = load_user_streaks()
-        streak = user_streaks.get(user_id, 0)
+        streak = streak_service.get(user_id)
         
         # Calculate credits based on streak
         # 100 credits for every 5 sustainable purchases
@@ -376,39 +571,8 @@ async def get_user_streak(user_id: str):
         print(f"Error getting user streak: {e}")
         return {"success": False, "streak": 0, "credits": 0}
 
-def load_user_streaks():
-    try:
-        json_path = os.path.join(BASE_DIR, 'user_streaks.json')
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        print(f"Error loading user streaks from {json_path}: {e}")
-        return {}
-
-def save_user_streaks(streaks):
-    try:
-        json_path = os.path.join(BASE_DIR, 'user_streaks.json')
-        temp_file = os.path.join(BASE_DIR, 'user_streaks.json.tmp')
-        
-        # Ensure the file is written atomically to prevent corruption
-        with open(temp_file, 'w') as f:
-            json.dump(streaks, f)
-        # Atomic rename
-        os.replace(temp_file, json_path)
-        print(f"Successfully saved streaks to {json_path}: {streaks}")
-    except Exception as e:
-        print(f"Error saving user streaks to {json_path}: {e}")
-        if os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-            except:
-                pass
-        raise e
-
 @app.get("/user-streaks-file")
-async def get_user_streaks_file():
+def get_user_streaks_file():
     try:
         json_path = os.path.join(BASE_DIR, 'user_streaks.txt')
         with open(json_path, 'r') as f:
@@ -418,36 +582,10 @@ async def get_user_streaks_file():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/update-streak")
-async def update_streak(user_id: str, is_sustainable: bool):
+def update_streak(user_id: str, is_sustainable: bool):
     try:
-        # Get the absolute path to user_streaks.json
-        json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'user_streaks.json')
-        
-        # Read current streaks
-        try:
-            with open(json_path, 'r') as f:
-                user_streaks = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            user_streaks = {}
-        
-        # Update streak based on choice
-        if is_sustainable:
-            user_streaks[user_id] = user_streaks.get(user_id, 0) + 1
-        else:
-            user_streaks[user_id] = 0
-            
-        # Save updated streaks atomically
-        temp_path = json_path + '.tmp'
-        try:
-            with open(temp_path, 'w') as f:
-                json.dump(user_streaks, f, indent=2)
-            os.replace(temp_path, json_path)
-        except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            raise e
-            
-        return {"success": True, "streak": user_streaks[user_id]}
+        streak = streak_service.record_choice(user_id, is_sustainable)
+        return {"success": True, "streak": streak}
     except Exception as e:
         print(f"Error updating streak: {str(e)}")
         return {"success": False, "error": str(e)}
@@ -1,9 +1,163 @@
+import io
+import os
+import re
+import json
+import importlib.util
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import random
+
+# Lower bounds of the "Medium CF" and "High CF" bands used by classify_cf_score
+CF_CATEGORY_BINS = [40, 70]
+CF_CATEGORY_LABELS = np.array(["Low CF", "Medium CF", "High CF"], dtype=object)
+
+# Usage duration scores and repairability scores covered by the precomputed score table
+MAX_USAGE_DURATION_SCORE = 10
+MAX_REPAIRABILITY_SCORE = 10
+
+# Values used to fill in the sustainability attributes of datasets that don't have them (e.g. df_2.csv)
+PACKAGING_MATERIALS = ['plastic', 'cardboard', 'paper', 'glass', 'metal', 'biodegradable']
+SHIPPING_MODES = ['air', 'road', 'rail', 'sea', 'local']
+USAGE_DURATIONS = ['1 year', '2 years', '3 years', '4 years', '5 years', '6 years', '7 years']
+MAX_GENERATED_REPAIRABILITY = 10
+
+# Synthetic attributes are drawn in fixed-size row blocks, each from its own (seed, block) stream,
+# so the values for a row don't depend on how the dataset is chunked or partitioned
+SYNTHETIC_BLOCK_ROWS = 65536
+
+# Libraries pandas can write parquet output with (either one is enough)
+PARQUET_ENGINES = ('pyarrow', 'fastparquet')
+
+# Column names of packaging_data_full.csv (see csv_proc/generate_packaging_data_full.py)
+PACKAGING_DATA_COLUMNS = {
+    'Packaging Material': 'packaging_material',
+    'Shipping Mode': 'shipping_mode',
+    'Usage Duration': 'usage_duration',
+    'Repairability Score': 'repairability_score'
+}
+
+# Attributes holding the score dictionaries; changing any of them invalidates derived state
+SCORE_TABLE_NAMES = ('packaging_material_scores', 'shipping_mode_scores', 'brand_adjustments', 'category_weights')
+
+
+def _map_unique(values, func, dtype=np.float64):
+    """Apply a scalar function once per distinct value of a column and broadcast the results"""
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    mapped = np.array([func(value) for value in uniques], dtype=dtype)
+    return mapped[codes]
+
+
+def new_seed():
+    """Draw a fresh seed for generate_sustainability_attributes from OS entropy"""
+    return int(np.random.SeedSequence().entropy)
+
+
+def generate_sustainability_attributes(n_rows, seed, start_row=0):
+    """
+    Generate random sustainability attributes for rows start_row .. start_row + n_rows
+    
+    The same seed always gives the same values for the same rows, whatever the chunking.
+    
+    Args:
+        n_rows: Number of rows to generate
+        seed: Integer seed of the NumPy Generator streams
+        start_row: Position of the first row in the whole dataset
+        
+    Returns:
+        Dictionary of packaging_material, shipping_mode, usage_duration and repairability_score columns
+    """
+    choice_counts = [len(PACKAGING_MATERIALS), len(SHIPPING_MODES), len(USAGE_DURATIONS), MAX_GENERATED_REPAIRABILITY]
+    first_block = start_row // SYNTHETIC_BLOCK_ROWS
+    last_block = (start_row + max(n_rows, 1) - 1) // SYNTHETIC_BLOCK_ROWS
+    
+    draws = np.concatenate([
+        np.random.default_rng([seed, block]).integers(0, choice_counts, size=(SYNTHETIC_BLOCK_ROWS, 4))
+        for block in range(first_block, last_block + 1)
+    ])
+    offset = start_row - first_block * SYNTHETIC_BLOCK_ROWS
+    draws = draws[offset:offset + n_rows]
+    
+    return {
+        'packaging_material': pd.Categorical.from_codes(draws[:, 0], PACKAGING_MATERIALS),
+        'shipping_mode': pd.Categorical.from_codes(draws[:, 1], SHIPPING_MODES),
+        'usage_duration': pd.Categorical.from_codes(draws[:, 2], USAGE_DURATIONS),
+        'repairability_score': draws[:, 3] + 1
+    }
+
+
+def load_packaging_attributes(csv_path):
+    """
+    Load per-(category_code, brand) sustainability attributes such as packaging_data_full.csv
+    
+    Column names are normalized to the ones used by the calculator, and usage durations
+    (stored as a number of years) are converted to the "N years" format of data.csv.
+    
+    Args:
+        csv_path: Path to the packaging attributes CSV file
+        
+    Returns:
+        DataFrame indexed (and hashed) on (category_code, brand)
+    """
+    attributes = pd.read_csv(csv_path).rename(columns=PACKAGING_DATA_COLUMNS)
+    attributes['brand'] = attributes['brand'].str.lower()
+    attributes['packaging_material'] = attributes['packaging_material'].str.lower()
+    attributes['shipping_mode'] = attributes['shipping_mode'].str.lower()
+    
+    years = attributes['usage_duration'].astype(int)
+    attributes['usage_duration'] = years.astype(str) + np.where(years == 1, ' year', ' years')
+    
+    attributes = attributes.drop_duplicates(['category_code', 'brand'])
+    return attributes.set_index(['category_code', 'brand'])[list(PACKAGING_DATA_COLUMNS.values())]
+
+
+def _base_cf_score(packaging_score, shipping_score, usage_duration_score, repairability_score):
+    """Weighted sum of the per-attribute scores, before brand and category adjustments"""
+    return (
+        (packaging_score * 2.5) +
+        (shipping_score * 3.0) +
+        (usage_duration_score * 2.5) +
+        (repairability_score * 2.0)
+    )
+
+
+class _ScoreTable(dict):
+    """Score dictionary that notifies its calculator whenever it is modified"""
+    
+    def __init__(self, table, on_change):
+        super().__init__(table)
+        self._on_change = on_change
+    
+    def __reduce__(self):
+        # Pickle as a plain dict; the change callback belongs to this process only
+        return (dict, (dict(self),))
+
+
+def _notify_after(method_name):
+    def method(self, *args, **kwargs):
+        result = getattr(dict, method_name)(self, *args, **kwargs)
+        self._on_change()
+        return result
+    method.__name__ = method_name
+    return method
+
+
+for _method_name in ('__setitem__', '__delitem__', '__ior__', 'clear', 'pop', 'popitem', 'setdefault', 'update'):
+    setattr(_ScoreTable, _method_name, _notify_after(_method_name))
+
 
 class CarbonFootprintCalculator:
-    def __init__(self):
+    def __init__(self, cache_size=10000):
+        # Bounded LRU cache of single-product results, keyed on normalized product attributes
+        self.cache_size = cache_size
+        self._cf_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._score_tables_ready = False
+        
         self.packaging_material_scores = {
             'plastic': 8,
             'cardboard': 4,
@@ -133,6 +287,64 @@ class CarbonFootprintCalculator:
             'electronics.headphone': 0.8,
             'home.appliance': 1.5
         }
+        
+        self._score_tables_ready = True
+        self._on_score_tables_changed()
+    
+    def __setattr__(self, name, value):
+        if name in SCORE_TABLE_NAMES:
+            super().__setattr__(name, _ScoreTable(value, self._on_score_tables_changed))
+            self._on_score_tables_changed()
+        else:
+            super().__setattr__(name, value)
+    
+    def _on_score_tables_changed(self):
+        """Rebuild the precomputed score table and drop cached results after any score table change"""
+        if not self._score_tables_ready:
+            return
+        self.rebuild_score_table()
+        with self._cache_lock:
+            self._cache_generation += 1
+            if self._cf_cache:
+                self._cf_cache.clear()
+                self._cache_stats['invalidations'] += 1
+    
+    def rebuild_score_table(self):
+        """
+        Precompute the base CF score for every packaging x shipping x usage duration x repairability
+        combination, so scoring a product is one table lookup times the brand and category multipliers.
+        Called automatically whenever one of the score dictionaries changes.
+        """
+        # The last packaging/shipping slot holds the default score used for unknown values
+        self._packaging_index = {name: i for i, name in enumerate(self.packaging_material_scores)}
+        self._shipping_index = {name: i for i, name in enumerate(self.shipping_mode_scores)}
+        packaging_scores = np.array(list(self.packaging_material_scores.values()) + [5], dtype=np.float64)
+        shipping_scores = np.array(list(self.shipping_mode_scores.values()) + [5], dtype=np.float64)
+        
+        # Indexed directly by usage duration score and by the raw repairability score
+        usage_duration_scores = np.arange(MAX_USAGE_DURATION_SCORE + 1, dtype=np.float64)
+        repairability_scores = MAX_REPAIRABILITY_SCORE - np.arange(MAX_REPAIRABILITY_SCORE + 1, dtype=np.float64)
+        
+        self._packaging_scores = packaging_scores
+        self._shipping_scores = shipping_scores
+        self._score_table = _base_cf_score(
+            packaging_scores[:, None, None, None],
+            shipping_scores[None, :, None, None],
+            usage_duration_scores[None, None, :, None],
+            repairability_scores[None, None, None, :]
+        )
+    
+    def get_score_tables(self):
+        """Return the score dictionaries that fully determine this calculator's results"""
+        return {name: dict(getattr(self, name)) for name in SCORE_TABLE_NAMES}
+    
+    @classmethod
+    def from_score_tables(cls, score_tables):
+        """Create a calculator that uses the given score dictionaries"""
+        calculator = cls()
+        for name, table in score_tables.items():
+            setattr(calculator, name, table)
+        return calculator
     
     def calculate_usage_duration_score(self, duration_str):
         try:
@@ -142,27 +354,86 @@ class CarbonFootprintCalculator:
             return 5  
     
     def calculate_cf_score(self, row):
-        # Get base scores
-        packaging_score = self.packaging_material_scores.get(row['packaging_material'].lower(), 5)
-        shipping_score = self.shipping_mode_scores.get(row['shipping_mode'].lower(), 5)
+        # Get table coordinates (unknown materials and modes use the default slot)
+        packaging_index = self._packaging_index.get(row['packaging_material'].lower(), -1)
+        shipping_index = self._shipping_index.get(row['shipping_mode'].lower(), -1)
         usage_duration_score = self.calculate_usage_duration_score(row['usage_duration'])
-        repairability_score = 10 - int(row['repairability_score'])  
+        repairability = int(row['repairability_score'])
         
         brand_adjustment = self.brand_adjustments.get(row['brand'], 1.0)
         
         category_weight = self.category_weights.get(row['category_code'], 1.0)
         
-        base_cf_score = (
-            (packaging_score * 2.5) +
-            (shipping_score * 3.0) +
-            (usage_duration_score * 2.5) +
-            (repairability_score * 2.0)
-        ) * brand_adjustment * category_weight
+        if usage_duration_score <= MAX_USAGE_DURATION_SCORE and 0 <= repairability <= MAX_REPAIRABILITY_SCORE:
+            base_score = self._score_table.item(packaging_index, shipping_index, usage_duration_score, repairability)
+        else:
+            # Values outside the table fall back to the formula
+            base_score = _base_cf_score(self._packaging_scores.item(packaging_index),
+                                        self._shipping_scores.item(shipping_index),
+                                        usage_duration_score, 10 - repairability)
+        
+        base_cf_score = base_score * brand_adjustment * category_weight
         
         normalized_score = min(100, max(0, base_cf_score))
         
         return normalized_score
     
+    def score_product(self, product):
+        """
+        Calculate and classify the CF score of a single product, using the LRU cache
+        
+        Args:
+            product: Dictionary with the attributes calculate_cf_score reads
+            
+        Returns:
+            Tuple of (cf_score, cf_category)
+        """
+        key = (
+            product['packaging_material'].lower(),
+            product['shipping_mode'].lower(),
+            self.calculate_usage_duration_score(product['usage_duration']),
+            int(product['repairability_score']),
+            product['brand'],
+            product['category_code']
+        )
+        
+        with self._cache_lock:
+            cached = self._cf_cache.get(key)
+            if cached is not None:
+                self._cf_cache.move_to_end(key)
+                self._cache_stats['hits'] += 1
+                return cached
+            self._cache_stats['misses'] += 1
+            generation = self._cache_generation
+        
+        cf_score = self.calculate_cf_score(product)
+        result = (cf_score, self.classify_cf_score(cf_score))
+        
+        with self._cache_lock:
+            # Don't cache results computed with score tables that have since changed
+            if generation == self._cache_generation and self.cache_size > 0:
+                self._cf_cache[key] = result
+                if len(self._cf_cache) > self.cache_size:
+                    self._cf_cache.popitem(last=False)
+                    self._cache_stats['evictions'] += 1
+        return result
+    
+    def cache_stats(self):
+        """Return hit/miss/eviction counters and the current size of the single-product cache"""
+        with self._cache_lock:
+            stats = dict(self._cache_stats)
+            stats['size'] = len(self._cf_cache)
+        stats['max_size'] = self.cache_size
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+    
+    def clear_cache(self):
+        """Drop all cached single-product results"""
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cf_cache.clear()
+    
     def classify_cf_score(self, score):
         if score >= 70:
             return "High CF"
@@ -171,8 +442,139 @@ class CarbonFootprintCalculator:
         else:
             return "Low CF"
     
-    def process_dataset(self, csv_path):
-        """Process dataset and add CF scores"""
+    def calculate_cf_scores(self, df):
+        """
+        Vectorized equivalent of calculate_cf_score for a whole DataFrame
+        
+        Each input column is mapped to score table coordinates once per distinct value,
+        so the Python work depends on the number of unique values rather than rows.
+        
+        Args:
+            df: DataFrame with the same columns calculate_cf_score reads from a row
+            
+        Returns:
+            NumPy array of CF scores, identical to applying calculate_cf_score row by row
+        """
+        packaging_index = _map_unique(
+            df['packaging_material'], lambda v: self._packaging_index.get(v.lower(), -1), np.intp)
+        shipping_index = _map_unique(
+            df['shipping_mode'], lambda v: self._shipping_index.get(v.lower(), -1), np.intp)
+        usage_duration_score = _map_unique(df['usage_duration'], self.calculate_usage_duration_score, np.intp)
+        repairability = _map_unique(df['repairability_score'], int, np.intp)
+        
+        brand_adjustment = _map_unique(df['brand'], lambda v: self.brand_adjustments.get(v, 1.0))
+        
+        category_weight = _map_unique(df['category_code'], lambda v: self.category_weights.get(v, 1.0))
+        
+        in_table = ((usage_duration_score <= MAX_USAGE_DURATION_SCORE) &
+                    (repairability >= 0) & (repairability <= MAX_REPAIRABILITY_SCORE))
+        if in_table.all():
+            base_score = self._lookup_base_scores(packaging_index, shipping_index, usage_duration_score, repairability)
+        else:
+            # Values outside the table fall back to the formula
+            base_score = _base_cf_score(self._packaging_scores[packaging_index],
+                                        self._shipping_scores[shipping_index],
+                                        usage_duration_score.astype(np.float64),
+                                        10 - repairability.astype(np.float64))
+            base_score[in_table] = self._lookup_base_scores(packaging_index[in_table], shipping_index[in_table],
+                                                            usage_duration_score[in_table], repairability[in_table])
+        
+        base_cf_score = base_score * brand_adjustment * category_weight
+        
+        return np.clip(base_cf_score, 0, 100)
+    
+    def _lookup_base_scores(self, packaging_index, shipping_index, usage_duration_score, repairability):
+        """Gather base scores for arrays of table coordinates with a single flat take"""
+        n_packaging, n_shipping, n_duration, n_repairability = self._score_table.shape
+        flat_index = (packaging_index % n_packaging) * n_shipping + (shipping_index % n_shipping)
+        flat_index = (flat_index * n_duration + usage_duration_score) * n_repairability + repairability
+        return self._score_table.ravel().take(flat_index)
+    
+    def classify_cf_scores(self, scores):
+        """Vectorized equivalent of classify_cf_score, binning all scores in one pass"""
+        return CF_CATEGORY_LABELS[np.digitize(np.asarray(scores, dtype=np.float64), CF_CATEGORY_BINS)]
+    
+    def score_products(self, products):
+        """
+        Calculate and classify CF scores for a list of product dictionaries in one vectorized pass
+        
+        Args:
+            products: List of dictionaries with the attributes calculate_cf_score reads
+            
+        Returns:
+            Tuple of (scores, categories) arrays in input order
+        """
+        if not products:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=object)
+        scores = self.calculate_cf_scores(pd.DataFrame(products))
+        return scores, self.classify_cf_scores(scores)
+    
+    def score_dataframe(self, df):
+        """Add cf_score and cf_category columns to a DataFrame in place and return it"""
+        scores = self.calculate_cf_scores(df)
+        df['cf_score'] = scores
+        df['cf_category'] = self.classify_cf_scores(scores)
+        return df
+    
+    def add_sustainability_columns(self, df, seed, start_row=0, packaging_attributes=None, fallback='synthetic'):
+        """
+        Fill in the sustainability columns for datasets that don't have them (e.g. df_2.csv)
+        
+        With packaging_attributes, each row takes the attributes of its (category_code, brand)
+        pair. Rows whose pair is missing from the table get seeded random values
+        (fallback='synthetic') or are removed (fallback='drop'). Without a table every row
+        gets seeded random values.
+        
+        Args:
+            df: DataFrame without packaging_material/shipping_mode/usage_duration/repairability_score
+            seed: Seed for generate_sustainability_attributes
+            start_row: Position of the DataFrame's first row in the whole dataset
+            packaging_attributes: Optional table returned by load_packaging_attributes
+            fallback: What to do with rows missing from packaging_attributes ('synthetic' or 'drop')
+            
+        Returns:
+            DataFrame with the sustainability columns added and brand lowercased
+        """
+        if fallback not in ('synthetic', 'drop'):
+            raise ValueError(f"Unsupported fallback: {fallback}")
+        
+        # Make sure brand column is lowercase for consistent matching
+        df['brand'] = df['brand'].str.lower()
+        
+        if packaging_attributes is None:
+            # Add the sustainability columns with seeded random values
+            for column, values in generate_sustainability_attributes(len(df), seed, start_row).items():
+                df[column] = values
+            return df
+        
+        # Hash join on (category_code, brand)
+        df = df.join(packaging_attributes, on=['category_code', 'brand'])
+        missing = df['packaging_material'].isna().to_numpy()
+        
+        if missing.any():
+            if fallback == 'drop':
+                df = df.loc[~missing].copy()
+            else:
+                generated = generate_sustainability_attributes(len(df), seed, start_row)
+                for column, values in generated.items():
+                    df.loc[missing, column] = np.asarray(values)[missing]
+        df['repairability_score'] = df['repairability_score'].astype(np.int64)
+        
+        return df
+    
+    def process_dataset(self, csv_path, seed=None, sample_size=None, packaging_data_path=None,
+                        packaging_fallback='synthetic'):
+        """
+        Process dataset and add CF scores
+        
+        Args:
+            csv_path: Path to the CSV file
+            seed: Seed for the attributes generated for datasets without sustainability columns
+            sample_size: Optional number of rows to randomly sample from such datasets
+            packaging_data_path: Optional per-(category_code, brand) attributes file to join
+                                 onto such datasets (e.g. packaging_data_full.csv)
+            packaging_fallback: 'synthetic' or 'drop' for rows missing from that file
+        """
         # Read the CSV file
         df = pd.read_csv(csv_path)
         
@@ -180,44 +582,339 @@ class CarbonFootprintCalculator:
         if 'packaging_material' not in df.columns:
             # For df_2.csv, we need to add the sustainability columns
             print(f"Processing large dataset: {csv_path}")
+            if seed is None:
+                seed = new_seed()
+                print(f"Generating sustainability attributes with seed {seed}")
             
-            # Add random values for the sustainability columns
-            # Define possible values for each column
-            packaging_materials = ['plastic', 'cardboard', 'paper', 'glass', 'metal', 'biodegradable']
-            shipping_modes = ['air', 'road', 'rail', 'sea', 'local']
-            usage_durations = ['1 year', '2 years', '3 years', '4 years', '5 years', '6 years', '7 years']
-            
-            # Sample size - limit to 1000 rows for processing speed
-            sample_size = min(1000, len(df))
-            df_sample = df.sample(sample_size)
-            
-            # Add the sustainability columns with random values
-            df_sample['packaging_material'] = [random.choice(packaging_materials) for _ in range(sample_size)]
-            df_sample['shipping_mode'] = [random.choice(shipping_modes) for _ in range(sample_size)]
-            df_sample['usage_duration'] = [random.choice(usage_durations) for _ in range(sample_size)]
-            df_sample['repairability_score'] = [random.randint(1, 10) for _ in range(sample_size)]
-            
-            # Make sure brand column is lowercase for consistent matching
-            df_sample['brand'] = df_sample['brand'].str.lower()
+            if sample_size is not None and sample_size < len(df):
+                df_sample = df.sample(sample_size, random_state=np.random.default_rng(seed)).reset_index(drop=True)
+            else:
+                df_sample = df
             
-            # Calculate CF score for each product
-            df_sample['cf_score'] = df_sample.apply(self.calculate_cf_score, axis=1)
+            packaging_attributes = load_packaging_attributes(packaging_data_path) if packaging_data_path else None
+            df_sample = self.add_sustainability_columns(df_sample, seed, 0, packaging_attributes, packaging_fallback)
             
-            # Classify CF scores
-            df_sample['cf_category'] = df_sample['cf_score'].apply(self.classify_cf_score)
-            
-            return df_sample
+            # Calculate and classify CF scores for all products at once
+            return self.score_dataframe(df_sample)
         else:
             # For data.csv, we already have all the required columns
             print(f"Processing small dataset: {csv_path}")
             
-            # Calculate CF score for each product
-            df['cf_score'] = df.apply(self.calculate_cf_score, axis=1)
+            # Calculate and classify CF scores for all products at once
+            return self.score_dataframe(df)
+    
+    def process_dataset_streaming(self, csv_path, output_path, chunksize=100000, output_format=None, resume=True,
+                                  seed=None, packaging_data_path=None, packaging_fallback='synthetic'):
+        """
+        Score a dataset of any size chunk by chunk, writing results incrementally
+        
+        Only one chunk is held in memory at a time. After every chunk the output is flushed
+        to disk and a checkpoint is written next to it, so an interrupted run restarts from
+        the last completed chunk. The checkpoint is removed once the whole file is scored.
+        
+        Args:
+            csv_path: Path to the input CSV file (data.csv or df_2.csv layout)
+            output_path: CSV file, or directory of parquet part files, to write results to
+            chunksize: Number of rows to read and score per chunk
+            output_format: 'csv' or 'parquet' (inferred from output_path when omitted)
+            resume: Whether to continue from an existing checkpoint
+            seed: Seed for the attributes generated for datasets without sustainability columns
+                  (a resumed run reuses the seed saved in its checkpoint)
+            packaging_data_path: Optional per-(category_code, brand) attributes file to join
+                                 onto such datasets, loaded once for the whole run
+            packaging_fallback: 'synthetic' or 'drop' for rows missing from that file
             
-            # Classify CF scores
-            df['cf_category'] = df['cf_score'].apply(self.classify_cf_score)
+        Returns:
+            Dictionary with the number of rows and chunks scored, elapsed seconds and rows/sec
+        """
+        output_format = _resolve_output_format(output_path, output_format)
+        
+        checkpoint_path = output_path.rstrip('/\\') + '.checkpoint.json'
+        checkpoint = {'csv_path': os.path.abspath(csv_path), 'chunksize': chunksize, 'output_format': output_format,
+                      'packaging_data_path': packaging_data_path and os.path.abspath(packaging_data_path),
+                      'packaging_fallback': packaging_fallback, 'seed': seed,
+                      'chunks_done': 0, 'rows_done': 0, 'rows_written': 0, 'output_bytes': 0}
+        settings = ('csv_path', 'chunksize', 'output_format', 'packaging_data_path', 'packaging_fallback')
+        
+        if resume and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r') as f:
+                saved = json.load(f)
+            if not (all(saved.get(key) == checkpoint[key] for key in settings)
+                    and seed in (None, saved.get('seed'))):
+                print(f"Ignoring checkpoint {checkpoint_path} written with different settings")
+            elif not _output_is_intact(output_path, output_format, saved):
+                print(f"Ignoring checkpoint {checkpoint_path}: {output_path} is missing or shorter than it records, "
+                      f"starting over")
+            else:
+                checkpoint = saved
+                print(f"Resuming {csv_path} after chunk {checkpoint['chunks_done']} "
+                      f"({checkpoint['rows_done']:,} rows already scored)")
+        
+        if checkpoint['seed'] is None:
+            checkpoint['seed'] = new_seed()
+        
+        sink = _ChunkSink(output_path, output_format, checkpoint)
+        
+        # Skip rows that were already scored; the header is re-applied by name
+        columns = pd.read_csv(csv_path, nrows=0).columns
+        reader = pd.read_csv(csv_path, chunksize=chunksize, header=None, names=columns,
+                             skiprows=checkpoint['rows_done'] + 1)
+        needs_sustainability_columns = 'packaging_material' not in columns
+        packaging_attributes = None
+        if needs_sustainability_columns and packaging_data_path:
+            packaging_attributes = load_packaging_attributes(packaging_data_path)
+        print(f"Streaming {csv_path} in chunks of {chunksize:,} rows to {output_path}")
+        
+        start_time = time.perf_counter()
+        rows_scored = 0
+        with sink:
+            for chunk in reader:
+                rows_read = len(chunk)
+                if needs_sustainability_columns:
+                    chunk = self.add_sustainability_columns(chunk, checkpoint['seed'], checkpoint['rows_done'],
+                                                            packaging_attributes, packaging_fallback)
+                self.score_dataframe(chunk)
+                
+                sink.write(chunk)
+                rows_scored += rows_read
+                checkpoint['chunks_done'] += 1
+                checkpoint['rows_done'] += rows_read
+                checkpoint['rows_written'] += len(chunk)
+                checkpoint['output_bytes'] = sink.output_bytes
+                _write_json_atomic(checkpoint_path, checkpoint)
+                
+                elapsed = time.perf_counter() - start_time
+                print(f"Chunk {checkpoint['chunks_done']}: {checkpoint['rows_done']:,} rows scored "
+                      f"({rows_scored / elapsed:,.0f} rows/sec)")
+        
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        
+        elapsed = time.perf_counter() - start_time
+        return {
+            'rows': checkpoint['rows_done'],
+            'rows_written': checkpoint['rows_written'],
+            'chunks': checkpoint['chunks_done'],
+            'seconds': elapsed,
+            'rows_per_sec': rows_scored / elapsed if elapsed > 0 else 0.0
+        }
+    
+    def process_dataset_parallel(self, csv_path, output_path=None, workers=None, partition_bytes=64 * 1024 * 1024,
+                                 output_format=None, seed=None, packaging_data_path=None,
+                                 packaging_fallback='synthetic'):
+        """
+        Score a dataset on several cores by splitting the CSV into byte ranges
+        
+        Each worker process receives the score tables once when it starts, then reads and
+        scores whole partitions on its own, so only partition offsets and scored results
+        cross process boundaries. Results are merged back in file order. The input must
+        have one record per line (no newlines inside quoted fields).
+        
+        Args:
+            csv_path: Path to the input CSV file (data.csv or df_2.csv layout)
+            output_path: Optional CSV file or parquet directory to write results to
+            workers: Number of worker processes (defaults to the number of CPUs)
+            partition_bytes: Approximate size of each partition read by a worker
+            output_format: 'csv' or 'parquet' (inferred from output_path when omitted)
+            seed: Seed for the attributes generated for datasets without sustainability columns
+            packaging_data_path: Optional per-(category_code, brand) attributes file to join
+                                 onto such datasets, shipped to each worker once
+            packaging_fallback: 'synthetic' or 'drop' for rows missing from that file
             
-            return df
+        Returns:
+            The scored DataFrame, or a summary dictionary like process_dataset_streaming
+            when output_path is given
+        """
+        workers = workers or os.cpu_count() or 1
+        if output_path:
+            output_format = _resolve_output_format(output_path, output_format)
+        columns = list(pd.read_csv(csv_path, nrows=0).columns)
+        partitions = _split_csv(csv_path, partition_bytes)
+        needs_sustainability_columns = 'packaging_material' not in columns
+        if needs_sustainability_columns and seed is None:
+            seed = new_seed()
+            print(f"Generating sustainability attributes with seed {seed}")
+        packaging_attributes = None
+        if needs_sustainability_columns and packaging_data_path:
+            packaging_attributes = load_packaging_attributes(packaging_data_path)
+        worker_state = (self.get_score_tables(), packaging_attributes, packaging_fallback)
+        print(f"Scoring {csv_path} in {len(partitions)} partitions with {workers} workers")
+        
+        start_time = time.perf_counter()
+        if workers == 1:
+            _init_worker(*worker_state)
+            def ordered_results():
+                start_row = 0
+                for start, end in partitions:
+                    yield _score_partition(csv_path, start, end, columns, seed, start_row)
+                    if needs_sustainability_columns:
+                        start_row += _count_rows(csv_path, start, end)
+            scored = self._collect_partitions(ordered_results(), output_path, output_format)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=worker_state) as executor:
+                # Generated attributes depend on each row's position, so count partition rows first
+                start_rows = [0] * len(partitions)
+                if needs_sustainability_columns:
+                    row_counts = list(executor.map(_count_rows, [csv_path] * len(partitions),
+                                                   *zip(*partitions)))
+                    start_rows = np.concatenate([[0], np.cumsum(row_counts)[:-1]]).tolist()
+                
+                # Keep a bounded window of partitions in flight so results are merged in order
+                # without buffering the whole dataset
+                pending = deque()
+                def ordered_results():
+                    for (start, end), start_row in zip(partitions, start_rows):
+                        pending.append(executor.submit(_score_partition, csv_path, start, end, columns,
+                                                       seed, start_row))
+                        if len(pending) >= 2 * workers:
+                            yield pending.popleft().result()
+                    while pending:
+                        yield pending.popleft().result()
+                scored = self._collect_partitions(ordered_results(), output_path, output_format)
+        
+        elapsed = time.perf_counter() - start_time
+        rows = scored['rows'] if output_path else len(scored)
+        print(f"Scored {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/sec)")
+        
+        if output_path:
+            scored.update({'seconds': elapsed, 'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0})
+        return scored
+    
+    def _collect_partitions(self, results, output_path, output_format):
+        """Write ordered partition results to output_path, or concatenate them into one DataFrame"""
+        if not output_path:
+            frames = list(results)
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        
+        summary = {'rows': 0, 'chunks': 0}
+        with _ChunkSink(output_path, output_format, {'chunks_done': 0, 'output_bytes': 0}) as sink:
+            for df in results:
+                sink.write(df)
+                summary['rows'] += len(df)
+                summary['chunks'] += 1
+        return summary
+
+
+# Calculator and packaging attributes used by worker processes, shipped once per process
+_worker_calculator = None
+_worker_packaging_attributes = None
+_worker_packaging_fallback = 'synthetic'
+
+
+def _init_worker(score_tables, packaging_attributes=None, packaging_fallback='synthetic'):
+    global _worker_calculator, _worker_packaging_attributes, _worker_packaging_fallback
+    _worker_calculator = CarbonFootprintCalculator.from_score_tables(score_tables)
+    _worker_packaging_attributes = packaging_attributes
+    _worker_packaging_fallback = packaging_fallback
+
+
+def _split_csv(csv_path, partition_bytes):
+    """Split a CSV file (after its header) into (start, end) byte ranges ending on line boundaries"""
+    size = os.path.getsize(csv_path)
+    partitions = []
+    with open(csv_path, 'rb') as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + partition_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            partitions.append((start, end))
+            start = end
+    return partitions
+
+
+def _count_rows(csv_path, start, end):
+    """Count the records in one byte range of a CSV file"""
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+
+
+def _score_partition(csv_path, start, end, columns, seed=None, start_row=0):
+    """Read and score one byte range of a CSV file in a worker process"""
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    df = pd.read_csv(io.BytesIO(data), header=None, names=columns)
+    if 'packaging_material' not in df.columns:
+        df = _worker_calculator.add_sustainability_columns(df, seed, start_row, _worker_packaging_attributes,
+                                                           _worker_packaging_fallback)
+    return _worker_calculator.score_dataframe(df)
+
+
+# Part files written by _ChunkSink in parquet mode (other files in the output directory are left alone)
+_PART_FILE_NAME = re.compile(r'^part-(\d{5})\.parquet$')
+
+
+class _ChunkSink:
+    """Incremental writer for scored chunks, truncated back to the last checkpoint on resume"""
+    
+    def __init__(self, output_path, output_format, checkpoint):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.part_index = checkpoint['chunks_done']
+        self.output_bytes = checkpoint['output_bytes']
+        self.file = None
+        
+        if output_format == 'csv':
+            # Drop anything written after the last completed chunk
+            self.file = open(output_path, 'a+b' if self.part_index else 'w+b')
+            self.file.truncate(self.output_bytes)
+            self.file.seek(self.output_bytes)
+        else:
+            os.makedirs(output_path, exist_ok=True)
+            for name in os.listdir(output_path):
+                match = _PART_FILE_NAME.match(name)
+                if match and int(match.group(1)) >= self.part_index:
+                    os.remove(os.path.join(output_path, name))
+    
+    def write(self, df):
+        if self.output_format == 'csv':
+            df.to_csv(self.file, header=self.part_index == 0, index=False)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.output_bytes = self.file.tell()
+        else:
+            df.to_parquet(os.path.join(self.output_path, f"part-{self.part_index:05d}.parquet"), index=False)
+        self.part_index += 1
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            self.file.close()
+
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temp file and atomically rename it into place"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _output_is_intact(output_path, output_format, checkpoint):
+    """Whether everything a checkpoint records as written is still in the output"""
+    if output_format == 'csv':
+        return os.path.isfile(output_path) and os.path.getsize(output_path) >= checkpoint['output_bytes']
+    return all(os.path.isfile(os.path.join(output_path, f"part-{index:05d}.parquet"))
+               for index in range(checkpoint['chunks_done']))
+
+
+def _resolve_output_format(output_path, output_format):
+    """Output format of output_path ('csv' or 'parquet'), failing early if parquet can't be written"""
+    if output_format is None:
+        output_format = 'parquet' if output_path.endswith('.parquet') else 'csv'
+    if output_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported output format: {output_format}")
+    if output_format == 'parquet' and not any(importlib.util.find_spec(engine) for engine in PARQUET_ENGINES):
+        raise ImportError(f"Writing parquet output to {output_path} needs pyarrow or fastparquet "
+                          "(pip install pyarrow), or use output_format='csv'")
+    return output_format
 
 if __name__ == "__main__":
     calculator = CarbonFootprintCalculator()
@@ -228,6 +925,10 @@ if __name__ == "__main__":
     # To process the large dataset, uncomment the line below
     # result_df = calculator.process_dataset('df_2.csv')
     
+    # To score the whole large dataset with bounded memory, uncomment the line below
+    # calculator.process_dataset_streaming('df_2.csv', 'df_2_with_cf_scores.csv', chunksize=100000,
+    #                                      packaging_data_path='packaging_data_full.csv')
+    
     result_df.to_csv('data_with_cf_scores.csv', index=False)
     
     print(f"Average CF Score: {result_df['cf_score'].mean():.2f}")
@@ -0,0 +1,155 @@
+import math
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+from columnar_store import grow_array, load_array, save_array
+
+# CF score histograms have HISTOGRAM_BINS equal-width buckets over 0..HISTOGRAM_MAX
+# (scores outside the range fall into the first or last bucket)
+HISTOGRAM_BINS = 10
+HISTOGRAM_MAX = 100.0
+
+
+def _histogram_bins(cf_scores: np.ndarray) -> np.ndarray:
+    bins = np.floor(cf_scores / (HISTOGRAM_MAX / HISTOGRAM_BINS))
+    return np.clip(bins, 0, HISTOGRAM_BINS - 1).astype(np.int64)
+
+
+class CFAggregates:
+    """
+    Running CF score statistics (count, sum, min, max, histogram) per key
+
+    Statistics are kept in arrays with one slot per key, so adding a score is a dictionary
+    lookup and a few array updates, and reading them never touches the records.
+    """
+
+    _ARRAYS = ('counts', 'sums', 'mins', 'maxs', 'histograms')
+
+    def __init__(self):
+        self.keys = []
+        self._key_index = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros(0, dtype=np.float64)
+        self.mins = np.zeros(0, dtype=np.float64)
+        self.maxs = np.zeros(0, dtype=np.float64)
+        self.histograms = np.zeros((0, HISTOGRAM_BINS), dtype=np.int64)
+
+    @classmethod
+    def from_codes(cls, key_codes: np.ndarray, keys: List[Any], cf_scores: np.ndarray) -> 'CFAggregates':
+        """
+        Build the statistics of many records in one vectorized pass
+
+        Args:
+            key_codes: Index into keys for each record (-1 to leave the record out)
+            keys: Distinct keys
+            cf_scores: CF score of each record (NaN to leave the record out)
+        """
+        aggregates = cls()
+        valid = (key_codes >= 0) & ~np.isnan(cf_scores)
+        codes = key_codes[valid].astype(np.int64)
+        scores = cf_scores[valid]
+        counts = np.bincount(codes, minlength=len(keys))
+        present = np.flatnonzero(counts)
+
+        mins = np.full(len(keys), np.inf)
+        maxs = np.full(len(keys), -np.inf)
+        np.minimum.at(mins, codes, scores)
+        np.maximum.at(maxs, codes, scores)
+        histograms = np.bincount(codes * HISTOGRAM_BINS + _histogram_bins(scores),
+                                 minlength=len(keys) * HISTOGRAM_BINS).reshape(len(keys), HISTOGRAM_BINS)
+
+        # Keys without a scored record get no statistics
+        aggregates.keys = [keys[code] for code in present.tolist()]
+        aggregates._key_index = {key: slot for slot, key in enumerate(aggregates.keys)}
+        aggregates.counts = counts[present].astype(np.int64)
+        aggregates.sums = np.bincount(codes, weights=scores, minlength=len(keys))[present]
+        aggregates.mins = mins[present]
+        aggregates.maxs = maxs[present]
+        aggregates.histograms = histograms[present].astype(np.int64)
+        return aggregates
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _slot(self, key) -> int:
+        slot = self._key_index.get(key)
+        if slot is not None:
+            return slot
+        slot = len(self.keys)
+        for name in self._ARRAYS:
+            array = grow_array(getattr(self, name), slot + 1)
+            setattr(self, name, array)
+        self.counts[slot] = 0
+        self.sums[slot] = 0.0
+        self.mins[slot] = math.inf
+        self.maxs[slot] = -math.inf
+        self.histograms[slot] = 0
+        self.keys.append(key)
+        self._key_index[key] = slot
+        return slot
+
+    def add(self, key, cf_score: float):
+        """Count one record with a CF score under a key"""
+        if not all(getattr(self, name).flags.writeable for name in self._ARRAYS):
+            # Loaded from a snapshot: copy the memory-mapped arrays before the first update
+            for name in self._ARRAYS:
+                setattr(self, name, np.array(getattr(self, name)))
+        slot = self._slot(key)
+        self.counts[slot] += 1
+        self.sums[slot] += cf_score
+        self.mins[slot] = min(self.mins[slot], cf_score)
+        self.maxs[slot] = max(self.maxs[slot], cf_score)
+        self.histograms[slot, _histogram_bins(np.float64(cf_score))] += 1
+
+    def _stats(self, slot: int) -> Dict[str, Any]:
+        count = int(self.counts[slot])
+        return {
+            'key': self.keys[slot],
+            'count': count,
+            'sum': float(self.sums[slot]),
+            'mean': float(self.sums[slot]) / count,
+            'min': float(self.mins[slot]),
+            'max': float(self.maxs[slot]),
+            'histogram': self.histograms[slot].tolist(),
+        }
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        """Statistics of one key, or None if no scored record has it"""
+        slot = self._key_index.get(key)
+        return self._stats(slot) if slot is not None else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Statistics of every key, most records first"""
+        slots = np.argsort(-self.counts[:len(self.keys)], kind='stable')
+        return [self._stats(slot) for slot in slots.tolist()]
+
+    def leaderboard(self, n: int = 10, lowest: bool = True, min_count: int = 1) -> List[Dict[str, Any]]:
+        """
+        Keys ranked by mean CF score
+
+        Args:
+            n: Number of keys to return
+            lowest: Lowest mean first (most sustainable) instead of highest
+            min_count: Leave out keys with fewer records
+        """
+        size = len(self.keys)
+        eligible = np.flatnonzero(self.counts[:size] >= min_count)
+        means = self.sums[eligible] / self.counts[eligible]
+        order = np.argsort(means if lowest else -means, kind='stable')[:n]
+        return [self._stats(slot) for slot in eligible[order].tolist()]
+
+    def save(self, directory: str, name: str) -> Dict[str, Any]:
+        size = len(self.keys)
+        entry = {'keys': self.keys}
+        for array_name in self._ARRAYS:
+            entry[array_name] = save_array(directory, f"{name}.{array_name}", getattr(self, array_name)[:size])
+        return entry
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]) -> 'CFAggregates':
+        aggregates = cls()
+        aggregates.keys = list(entry['keys'])
+        aggregates._key_index = {key: slot for slot, key in enumerate(aggregates.keys)}
+        for array_name in cls._ARRAYS:
+            setattr(aggregates, array_name, load_array(directory, entry[array_name]))
+        return aggregates
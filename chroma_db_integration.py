@@ -1,36 +1,334 @@
 import pandas as pd
+import numpy as np
 import os
 import json
-from typing import List, Dict, Any, Optional
+import math
+import base64
+import binascii
+import shutil
+import bisect
+import heapq
+import itertools
+import threading
+import uuid
+from collections.abc import Sequence
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from cf_aggregates import CFAggregates
+from columnar_store import (ColumnarStore, Postings, RecordView, grow_array, load_array, load_postings, save_array,
+                            save_postings)
+from product_embeddings import EMBEDDING_DIM, IVFIndex, embed_record, embed_store, top_k
+from purchase_log import FSYNC_EVERY_RECORDS, FSYNC_INTERVAL_MS, PurchaseLog
+from purchase_store import PurchaseStore
+from product_query import Condition, filter_mask, parse_order_by, parse_where, sort_rows
+
+# Catalogs with at least this many records get an approximate (IVF) vector index instead of exact search
+ANN_INDEX_MIN_RECORDS = 200_000
+
+# Buckets the approximate index searches per query
+ANN_N_PROBE = 8
+
+# Weight of a 100-point CF score reduction relative to similarity (0..1) when ranking alternatives
+ALTERNATIVE_CF_WEIGHT = 0.5
+
+# Version of the on-disk snapshot layout; snapshots written with another version are rebuilt
+SNAPSHOT_FORMAT_VERSION = 3
+
+# Snapshot versions kept on disk (older ones may still be memory-mapped by running workers)
+SNAPSHOTS_KEPT = 2
+
+# Candidate rows filtered per step when a query can stop once it has enough results
+QUERY_BLOCK_ROWS = 65536
+
+# Records read from an index per step when streaming query results
+STREAM_BATCH_ROWS = 1000
+
+# Purchases logged since the current snapshot before a background compaction folds them into a new one
+COMPACT_AFTER_RECORDS = 10_000
 
 # Placeholder for ChromaDB import
 # import chromadb
 
+def _normalize_brand(brand) -> str:
+    """Normalize a brand name for case-insensitive matching (missing brands become '')"""
+    return brand.lower() if isinstance(brand, str) else ''
+
+def _sortable_cf_score(record: Dict[str, Any]) -> Optional[float]:
+    """CF score of a record for ordering, or None if it can't be compared (e.g. NaN)"""
+    try:
+        cf_score = float(record.get('cf_score', 100))
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(cf_score) else cf_score
+
+def _group_rows(key_codes: np.ndarray, *sort_keys: np.ndarray):
+    """
+    Split record positions by key code (codes < 0 are skipped)
+    
+    Args:
+        key_codes: Key code of each record
+        sort_keys: Optional arrays to order positions by within a key (ties keep position order)
+        
+    Returns:
+        Iterator of (key code, positions) pairs
+    """
+    order = np.lexsort(tuple(reversed(sort_keys)) + (key_codes,)) if sort_keys else np.argsort(key_codes, kind='stable')
+    sorted_codes = key_codes[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_codes)) + 1))
+    ends = np.append(starts[1:], len(order))
+    for start, end in zip(starts, ends):
+        if start < end and sorted_codes[start] >= 0:
+            yield int(sorted_codes[start]), order[start:end]
+
+class _CFSortedRows:
+    """Record positions of one category_code kept sorted by CF score (ties in insertion order)"""
+    
+    __slots__ = ('base_scores', 'base_rows', 'scores', 'rows')
+    
+    def __init__(self, base_scores: Optional[np.ndarray] = None, base_rows: Optional[np.ndarray] = None):
+        # Sorted arrays built in bulk, plus sorted lists for records inserted afterwards
+        self.base_scores = base_scores if base_scores is not None else np.empty(0)
+        self.base_rows = base_rows if base_rows is not None else np.empty(0, dtype=np.int64)
+        self.scores = []
+        self.rows = []
+    
+    def insert(self, cf_score: float, row: int):
+        position = bisect.bisect_right(self.scores, cf_score)
+        self.scores.insert(position, cf_score)
+        self.rows.insert(position, row)
+    
+    def merged(self):
+        """All (scores, rows) as sorted arrays, with the inserted records folded in"""
+        if not self.rows:
+            return self.base_scores, self.base_rows
+        pairs = list(heapq.merge(zip(self.base_scores.tolist(), self.base_rows.tolist()), zip(self.scores, self.rows)))
+        return np.array([score for score, _ in pairs], dtype=np.float64), np.array([row for _, row in pairs], dtype=np.int64)
+    
+    def rows_below(self, cf_score: float, limit: int) -> List[int]:
+        """The (at most limit) lowest-scoring rows with a CF score strictly below cf_score"""
+        base_count = min(int(np.searchsorted(self.base_scores, cf_score, side='left')), limit)
+        tail_count = min(bisect.bisect_left(self.scores, cf_score), limit)
+        if not tail_count:
+            return self.base_rows[:base_count].tolist()
+        
+        # Inserted records come after every bulk-built one, so merging on (score, row) keeps ties in insertion order
+        merged = heapq.merge(zip(self.base_scores[:base_count].tolist(), self.base_rows[:base_count].tolist()),
+                             zip(self.scores[:tail_count], self.rows[:tail_count]))
+        return [row for _, row in itertools.islice(merged, limit)]
+    
+    @staticmethod
+    def _range(scores, low, low_inclusive, high, high_inclusive):
+        """Slice bounds of the scores within a range, for the sorted base array or inserted list"""
+        if isinstance(scores, list):
+            left, right = bisect.bisect_left, bisect.bisect_right
+        else:
+            left = lambda values, x: int(np.searchsorted(values, x, side='left'))
+            right = lambda values, x: int(np.searchsorted(values, x, side='right'))
+        start = 0 if low is None else (left if low_inclusive else right)(scores, low)
+        end = len(scores) if high is None else (right if high_inclusive else left)(scores, high)
+        return start, max(start, end)
+    
+    def count_between(self, low=None, low_inclusive=True, high=None, high_inclusive=True) -> int:
+        """Number of rows with a CF score in a range (None leaves that side open)"""
+        base_start, base_end = self._range(self.base_scores, low, low_inclusive, high, high_inclusive)
+        tail_start, tail_end = self._range(self.scores, low, low_inclusive, high, high_inclusive)
+        return base_end - base_start + tail_end - tail_start
+    
+    def rows_between(self, low=None, low_inclusive=True, high=None, high_inclusive=True) -> np.ndarray:
+        """Rows with a CF score in a range, lowest score first (ties in insertion order)"""
+        base_start, base_end = self._range(self.base_scores, low, low_inclusive, high, high_inclusive)
+        tail_start, tail_end = self._range(self.scores, low, low_inclusive, high, high_inclusive)
+        base_rows = np.asarray(self.base_rows[base_start:base_end], dtype=np.int64)
+        if tail_start == tail_end:
+            return base_rows
+        merged = heapq.merge(zip(self.base_scores[base_start:base_end].tolist(), base_rows.tolist()),
+                             zip(self.scores[tail_start:tail_end], self.rows[tail_start:tail_end]))
+        return np.array([row for _, row in merged], dtype=np.int64)
+
+class _RecordIds(Sequence):
+    """IDs of the catalog records: product_<n> for the record at position n"""
+    
+    def __init__(self, manager: 'ChromaDBManager'):
+        self.manager = manager
+    
+    def __len__(self) -> int:
+        return self.manager._catalog_size
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        return f"product_{index}"
+
+class _AccessPath:
+    """A way to fetch the candidate record positions of a query, with the number of rows it yields"""
+    
+    __slots__ = ('plan', 'estimated_rows', 'fetch', 'cf_ordered')
+    
+    def __init__(self, plan: Dict[str, Any], estimated_rows: int, fetch, cf_ordered: bool = False):
+        self.plan = plan
+        self.estimated_rows = estimated_rows
+        # Returns the candidate positions, ascending unless cf_ordered (then by CF score, ties in position order)
+        self.fetch = fetch
+        self.cf_ordered = cf_ordered
+
+class _QueryPlan:
+    """Access path, filter and ordering chosen for a query"""
+    
+    __slots__ = ('path', 'where', 'order_field', 'descending', 'sort', 'limit', 'total_rows')
+    
+    def __init__(self, path: _AccessPath, where, order_field: Optional[str], descending: bool, sort: str,
+                 limit: Optional[int], total_rows: int):
+        self.path = path
+        self.where = where
+        self.order_field = order_field
+        self.descending = descending
+        self.sort = sort
+        self.limit = limit
+        self.total_rows = total_rows
+    
+    def explain(self) -> Dict[str, Any]:
+        return dict(self.path.plan, estimated_rows=self.path.estimated_rows, total_rows=self.total_rows,
+                    filter=self.where.to_dict() if self.where is not None else None,
+                    sort=self.sort, limit=self.limit)
+
+def _cf_range_text(low, low_inclusive, high, high_inclusive) -> str:
+    return (f"{'[' if low_inclusive and low is not None else '('}{'-inf' if low is None else low}, "
+            f"{'inf' if high is None else high}{']' if high_inclusive and high is not None else ')'}")
+
+def _encode_cursor(scope: str, catalog_id: str, row: int) -> str:
+    """Opaque continuation token: resume the query named by scope after a record position"""
+    payload = json.dumps([scope, catalog_id, row], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor: str, scope: str, catalog_id: str) -> int:
+    """
+    Record position a cursor resumes after
+    
+    Raises:
+        ValueError: If the cursor is malformed, belongs to another query or to another catalog
+    """
+    try:
+        decoded_scope, decoded_catalog, row = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if decoded_scope != scope or not isinstance(row, int):
+        raise ValueError("Cursor belongs to a different query")
+    if decoded_catalog != catalog_id:
+        raise ValueError("Cursor belongs to a different catalog version")
+    return row
+
+def _source_fingerprint(csv_path: str, processed: bool) -> Dict[str, Any]:
+    """Identify a CSV file as it is now, so a snapshot built from it can tell when it changed"""
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'processed': processed}
+
+def _write_text_atomic(path: str, text: str):
+    """Write text to a temp file and atomically rename it into place"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def _save_sorted_rows(directory: str, name: str, index: Dict[str, _CFSortedRows]) -> Dict[str, Any]:
+    """Write the per-category CF-sorted rows in CSR form"""
+    keys = list(index)
+    merged = [index[key].merged() for key in keys]
+    return {
+        'keys': keys,
+        'scores': save_array(directory, name + '.scores',
+                             np.concatenate([scores for scores, _ in merged]) if merged else np.empty(0)),
+        'rows': save_array(directory, name + '.rows',
+                           np.concatenate([rows for _, rows in merged]) if merged else np.empty(0, dtype=np.int64)),
+        'offsets': save_array(directory, name + '.offsets',
+                              np.concatenate(([0], np.cumsum([len(rows) for _, rows in merged])))),
+    }
+
+def _load_sorted_rows(directory: str, entry: Dict[str, Any]) -> Dict[str, _CFSortedRows]:
+    scores = load_array(directory, entry['scores'])
+    rows = load_array(directory, entry['rows'])
+    offsets = load_array(directory, entry['offsets'])
+    return {key: _CFSortedRows(scores[offsets[i]:offsets[i + 1]], rows[offsets[i]:offsets[i + 1]])
+            for i, key in enumerate(entry['keys'])}
+
 class ChromaDBManager:
     """
     A class to manage ChromaDB integration for the product data
     """
     
-    def __init__(self, collection_name="products", persistence_path="./chroma_db"):
+    def __init__(self, collection_name="products", persistence_path="./chroma_db",
+                 ann_min_records=ANN_INDEX_MIN_RECORDS, log_fsync_every=FSYNC_EVERY_RECORDS,
+                 log_fsync_interval_ms=FSYNC_INTERVAL_MS, compact_after_records=COMPACT_AFTER_RECORDS,
+                 purchase_backend=None):
         """
         Initialize the ChromaDB manager
         
         Args:
             collection_name: Name of the collection to store products
             persistence_path: Path to store the ChromaDB data
+            ann_min_records: Record count from which similarity search uses an approximate index
+            log_fsync_every: Unsynced purchases that make the purchase log fsync on append (1 = every purchase)
+            log_fsync_interval_ms: Longest time a logged purchase waits for the background fsync
+            compact_after_records: Logged purchases that trigger folding the log into a new snapshot
+            purchase_backend: Durable purchase history that new purchases are also appended to
+                (anything with append(record), e.g. PurchaseSink or SQLitePurchases)
         """
         self.collection_name = collection_name
         self.persistence_path = persistence_path
+        self.log_fsync_every = log_fsync_every
+        self.log_fsync_interval_ms = log_fsync_interval_ms
+        self.compact_after_records = compact_after_records
+        self.purchase_backend = purchase_backend
         
         # Placeholder for actual ChromaDB initialization
         # When ChromaDB is installed, uncomment these lines:
         # self.client = chromadb.PersistentClient(path=persistence_path)
         # self.collection = self.get_or_create_collection()
         
-        # For now, we'll mimic ChromaDB functionality with basic Python structures
-        self.products_data = []
-        self.embeddings_placeholder = []
-        self.ids = []
+        # For now, we'll mimic ChromaDB functionality with an in-memory columnar store
+        self.store = ColumnarStore()
+        
+        # Catalog records have implicit IDs (product_<row>); the catalog ID changes whenever the CSV is reimported
+        self._catalog_size = 0
+        self._catalog_id = None
+        
+        # Purchases live in their own store, so they never show up in (or slow down) catalog queries
+        self.purchases = PurchaseStore()
+        
+        # Hashed feature embedding per record (rows past len(store) are spare capacity)
+        self._embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        self.ann_min_records = ann_min_records
+        self._vector_index = None
+        
+        # The CSV the records were imported from (see _source_fingerprint), recorded in snapshots
+        self._source = None
+        self.snapshot_version = None
+        
+        # Secondary indexes from normalized brand / CF category to record positions, in insertion order
+        self._brand_index = {}
+        self._cf_category_index = {}
+        
+        # Per category_code record positions sorted by CF score, for finding greener alternatives
+        self._category_cf_index = {}
+        
+        # Running CF score statistics per normalized brand, category_code and CF category
+        self._brand_stats = CFAggregates()
+        self._category_stats = CFAggregates()
+        self._cf_category_stats = CFAggregates()
+        
+        # Purchase log (opened by load_or_build), LSN of the last purchase in the store and in the current snapshot
+        self._log = None
+        self._log_lsn = 0
+        self._snapshot_log_lsn = 0
+        
+        # Serializes purchase writes with compaction, which runs on a background thread
+        self._write_lock = threading.RLock()
+        self._compaction = None
         
     def get_or_create_collection(self):
         """
@@ -50,6 +348,21 @@ class ChromaDBManager:
         # return collection
         
         print(f"Placeholder: Would create/get collection {self.collection_name}")
+    
+    @property
+    def products_data(self) -> RecordView:
+        """All stored records as a read-only sequence of dictionaries (materialized on access)"""
+        return RecordView(self.store)
+    
+    @property
+    def ids(self) -> _RecordIds:
+        """IDs of all stored records, in the same order as products_data"""
+        return _RecordIds(self)
+    
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Unit-length float32 embedding of every record, one row per record"""
+        return self._embeddings[:len(self.store)]
         
     def csv_to_chroma(self, csv_path: str, process_with_cf_calculator=True):
         """
@@ -69,29 +382,431 @@ class ChromaDBManager:
         else:
             df = pd.read_csv(csv_path)
         
-        # Convert to list of dictionaries
-        records = df.to_dict(orient='records')
-        
-        # Create IDs, extract metadata, and create placeholder embeddings
-        ids = [f"product_{i}" for i in range(len(records))]
-        metadatas = records
-        
-        # Store in our placeholder structures
-        self.products_data = metadatas
-        self.ids = ids
-        self.embeddings_placeholder = [[0.0] * 10 for _ in range(len(records))]  # Placeholder embeddings
+        self.load_dataframe(df)
+        self._source = _source_fingerprint(csv_path, process_with_cf_calculator)
         
-        print(f"Processed {len(records)} records")
+        print(f"Processed {len(df)} records")
         
         # When ChromaDB is installed, uncomment these lines:
         # # Add data to ChromaDB 
+        # ids = list(self.ids)
+        # metadatas = df.to_dict(orient='records')
         # self.collection.add(
         #     ids=ids,
-        #     embeddings=self.embeddings_placeholder,  # Replace with real embeddings if available
+        #     embeddings=self.embeddings.tolist(),
         #     metadatas=metadatas
         # )
         # 
-        # print(f"Added {len(records)} records to ChromaDB collection '{self.collection_name}'")
+        # print(f"Added {len(metadatas)} records to ChromaDB collection '{self.collection_name}'")
+        
+    def load_dataframe(self, df: pd.DataFrame):
+        """
+        Replace the stored records with the rows of a DataFrame
+        
+        Args:
+            df: Product data, one record per row (IDs become product_<row>)
+        """
+        # Store the columns in our placeholder structures
+        self.store = ColumnarStore.from_dataframe(df)
+        self._catalog_size = len(df)
+        self._catalog_id = uuid.uuid4().hex
+        self._rebuild_indexes()
+        
+        self._embeddings = embed_store(self.store)
+        self._vector_index = IVFIndex.build(self._embeddings) if len(df) >= self.ann_min_records else None
+        self._source = None
+        self.snapshot_version = None
+    
+    @property
+    def snapshot_root(self) -> str:
+        """Directory holding this collection's snapshots"""
+        return os.path.join(self.persistence_path, self.collection_name)
+    
+    @property
+    def log_directory(self) -> str:
+        """Directory holding this collection's purchase log segments"""
+        return os.path.join(self.persistence_path, f"{self.collection_name}.wal")
+    
+    def _snapshot_versions(self) -> List[int]:
+        versions = []
+        if os.path.isdir(self.snapshot_root):
+            for name in os.listdir(self.snapshot_root):
+                if name.startswith('snapshot-') and name[len('snapshot-'):].isdigit():
+                    versions.append(int(name[len('snapshot-'):]))
+        return sorted(versions)
+    
+    def _read_current_manifest(self, any_version=False):
+        """Directory and manifest of the current snapshot, or (None, None) if there is no usable one"""
+        try:
+            with open(os.path.join(self.snapshot_root, 'CURRENT')) as f:
+                directory = os.path.join(self.snapshot_root, f.read().strip())
+            with open(os.path.join(directory, 'manifest.json')) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION and not any_version:
+            print(f"Ignoring snapshot in {directory}: format version {manifest.get('format_version')}")
+            return None, None
+        return directory, manifest
+    
+    def save_snapshot(self) -> str:
+        """
+        Write the records, embeddings and indexes as a new snapshot version and make it current
+        
+        Each version is a directory of .npy files plus a manifest. It is written under a
+        temporary name, renamed into place and then published by atomically replacing the
+        CURRENT pointer, so readers never see a partial snapshot.
+        
+        Returns:
+            Directory of the new snapshot
+        """
+        os.makedirs(self.snapshot_root, exist_ok=True)
+        temp_dir = os.path.join(self.snapshot_root, f".snapshot-{os.getpid()}.tmp")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'collection_name': self.collection_name,
+            'record_count': len(self.store),
+            'catalog_size': self._catalog_size,
+            'catalog_id': self._catalog_id,
+            'purchases': self.purchases.save(os.path.join(temp_dir, 'purchases')),
+            'log_lsn': self._log_lsn,
+            'source': self._source,
+            'columns': self.store.save(temp_dir),
+            'embeddings': save_array(temp_dir, 'embeddings', self.embeddings),
+            'vector_index': self._vector_index.save(temp_dir) if self._vector_index is not None else None,
+            'indexes': {
+                'brand': save_postings(temp_dir, 'brand_index', self._brand_index),
+                'cf_category': save_postings(temp_dir, 'cf_category_index', self._cf_category_index),
+                'category_cf': _save_sorted_rows(temp_dir, 'category_cf_index', self._category_cf_index),
+            },
+            'aggregates': {
+                'brand': self._brand_stats.save(temp_dir, 'brand_stats'),
+                'category_code': self._category_stats.save(temp_dir, 'category_stats'),
+                'cf_category': self._cf_category_stats.save(temp_dir, 'cf_category_stats'),
+            },
+        }
+        
+        # Another process may publish a snapshot at the same time; take the next free version
+        while True:
+            version = (self._snapshot_versions() or [0])[-1] + 1
+            manifest['version'] = version
+            with open(os.path.join(temp_dir, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, default=str)
+            directory = os.path.join(self.snapshot_root, f"snapshot-{version:06d}")
+            try:
+                os.rename(temp_dir, directory)
+                break
+            except OSError:
+                if not os.path.exists(directory):
+                    raise
+        
+        _write_text_atomic(os.path.join(self.snapshot_root, 'CURRENT'), os.path.basename(directory))
+        self.snapshot_version = version
+        self._snapshot_log_lsn = manifest['log_lsn']
+        
+        for old_version in self._snapshot_versions()[:-SNAPSHOTS_KEPT]:
+            shutil.rmtree(os.path.join(self.snapshot_root, f"snapshot-{old_version:06d}"), ignore_errors=True)
+        
+        print(f"Saved snapshot {version} with {len(self.store)} records to {directory}")
+        return directory
+    
+    def load_snapshot(self) -> bool:
+        """
+        Load the current snapshot by memory-mapping its files
+        
+        Loading takes about the same time whatever the catalog size, and processes that
+        load the same snapshot share its pages.
+        
+        Returns:
+            True if a snapshot was loaded, False if there is none
+        """
+        directory, manifest = self._read_current_manifest()
+        if manifest is None:
+            return False
+        
+        self.store = ColumnarStore.load(directory, manifest['columns'], manifest['record_count'])
+        self._catalog_size = manifest['catalog_size']
+        self._catalog_id = manifest['catalog_id']
+        self.purchases = PurchaseStore.load(os.path.join(directory, 'purchases'), manifest['purchases'])
+        
+        indexes = manifest['indexes']
+        self._brand_index = load_postings(directory, indexes['brand'])
+        self._cf_category_index = load_postings(directory, indexes['cf_category'])
+        self._category_cf_index = _load_sorted_rows(directory, indexes['category_cf'])
+        
+        aggregates = manifest['aggregates']
+        self._brand_stats = CFAggregates.load(directory, aggregates['brand'])
+        self._category_stats = CFAggregates.load(directory, aggregates['category_code'])
+        self._cf_category_stats = CFAggregates.load(directory, aggregates['cf_category'])
+        
+        self._embeddings = load_array(directory, manifest['embeddings'])
+        vector_index = manifest['vector_index']
+        self._vector_index = IVFIndex.load(directory, vector_index) if vector_index is not None else None
+        
+        self._source = manifest['source']
+        self.snapshot_version = manifest['version']
+        self._log_lsn = self._snapshot_log_lsn = manifest.get('log_lsn', 0)
+        return True
+    
+    def _snapshot_purchases(self, directory: str, manifest: Dict[str, Any]) -> PurchaseStore:
+        """The purchases held by a snapshot (format 1 snapshots kept them after the catalog records)"""
+        if 'purchases' in manifest:
+            return PurchaseStore.load(os.path.join(directory, 'purchases'), manifest['purchases'])
+        store = ColumnarStore.load(directory, manifest['columns'], manifest['record_count'])
+        purchases = PurchaseStore()
+        for record_id, row in zip(manifest['added_ids'], range(manifest['catalog_size'], manifest['record_count'])):
+            purchases.append(record_id, store.get_record(row))
+        return purchases
+    
+    def open_snapshot(self) -> bool:
+        """
+        Load the current snapshot, whatever CSV it was built from, and replay the purchase log on top
+        
+        Returns:
+            True if a snapshot was loaded, False if there is none
+        """
+        if not self.load_snapshot():
+            return False
+        replayed = self._replay_log()
+        print(f"Replayed {replayed} logged records on top of snapshot {self.snapshot_version}")
+        if replayed >= self.compact_after_records:
+            self.compact_in_background()
+        return True
+    
+    def load_or_build(self, csv_path: str, process_with_cf_calculator=True) -> bool:
+        """
+        Load the current snapshot if it was built from this CSV as it is now, otherwise
+        import the CSV and save a new snapshot
+        
+        Either way the purchase log is opened and the purchases logged after the snapshot
+        are replayed on top. Purchases held by a snapshot of an older CSV (or an older
+        snapshot format) are carried over to the new one; products added to the older
+        catalog with add_product() are not.
+        
+        Args:
+            csv_path: Path to the CSV file
+            process_with_cf_calculator: Whether to process the data with CF calculator first
+            
+        Returns:
+            True if the snapshot was used, False if the CSV was imported
+        """
+        directory, manifest = self._read_current_manifest(any_version=True)
+        if (manifest is not None and manifest['format_version'] == SNAPSHOT_FORMAT_VERSION
+                and manifest['source'] == _source_fingerprint(csv_path, process_with_cf_calculator)):
+            if self.open_snapshot():
+                return True
+        
+        if manifest is not None:
+            self.purchases = self._snapshot_purchases(directory, manifest)
+        self.csv_to_chroma(csv_path, process_with_cf_calculator)
+        self._log_lsn = manifest.get('log_lsn', 0) if manifest is not None else 0
+        self._replay_log(products=False)
+        self.compact()
+        return False
+    
+    def open_purchase_log(self) -> PurchaseLog:
+        """Open the purchase log so that added purchases survive a restart (done by load_or_build)"""
+        if self._log is None:
+            self._log = PurchaseLog(self.log_directory, self.log_fsync_every, self.log_fsync_interval_ms,
+                                    first_lsn=self._log_lsn + 1)
+        return self._log
+    
+    def _replay_log(self, products=True) -> int:
+        """
+        Add the logged purchases and products the store doesn't hold yet
+        
+        Args:
+            products: Whether to replay products (entries with a product_<n> ID); they are
+                skipped when the log belongs to an older catalog
+        
+        Returns:
+            Number of records replayed
+        """
+        log = self.open_purchase_log()
+        replayed = 0
+        with self._write_lock:
+            for lsn, record_id, record in log.replay(self._log_lsn):
+                if not record_id.startswith('product_'):
+                    self.purchases.append(record_id, record)
+                    replayed += 1
+                elif products:
+                    self._append_product(record)
+                    replayed += 1
+                self._log_lsn = lsn
+        return replayed
+    
+    def compact(self) -> str:
+        """
+        Fold the purchase log into a new snapshot and delete the log segments it covers
+        
+        Purchases wait while the snapshot is written.
+        
+        Returns:
+            Directory of the new snapshot
+        """
+        with self._write_lock:
+            if self._log is not None:
+                self._log.rotate()
+            directory = self.save_snapshot()
+            log_lsn = self._log_lsn
+        if self._log is not None:
+            removed = self._log.discard_through(log_lsn)
+            print(f"Compacted purchase log through LSN {log_lsn} ({removed} segments removed)")
+        return directory
+    
+    def compact_in_background(self) -> bool:
+        """
+        Start compact() on a background thread unless a compaction is already running
+        
+        Returns:
+            True if a compaction was started
+        """
+        with self._write_lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return False
+            self._compaction = threading.Thread(target=self._run_compaction, name='purchase-log-compaction',
+                                                 daemon=True)
+            self._compaction.start()
+            return True
+    
+    def _run_compaction(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"Error compacting purchase log: {e}")
+    
+    def close(self):
+        """Wait for a running compaction, then sync and close the purchase log"""
+        if self._compaction is not None:
+            self._compaction.join()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+    
+    def nbytes(self) -> int:
+        """Approximate memory used by the records, purchases, embeddings and indexes (memory-mapped files included)"""
+        postings_bytes = sum(postings.base.nbytes + 8 * len(postings.tail)
+                             for index in (self._brand_index, self._cf_category_index) for postings in index.values())
+        sorted_rows_bytes = sum(rows.base_scores.nbytes + rows.base_rows.nbytes + 16 * len(rows.rows)
+                                for rows in self._category_cf_index.values())
+        return (self.store.nbytes() + self.purchases.store.nbytes() + self._embeddings.nbytes
+                + postings_bytes + sorted_rows_bytes)
+    
+    def _row_keys(self, column: str, normalize, missing=''):
+        """
+        Index key code of every stored record for a column
+        
+        Args:
+            column: Column to index
+            normalize: Maps a stored value to its index key (None to leave the record out)
+            missing: Key for records without a value
+            
+        Returns:
+            Tuple of (key code per record, -1 if not indexed; list of keys)
+        """
+        codes, values = self.store.factorize(column)
+        # The missing-value key goes last so that code -1 picks it up
+        keys = np.empty(len(values) + 1, dtype=object)
+        keys[:-1] = [normalize(value) for value in values]
+        keys[-1] = missing
+        key_codes, unique_keys = pd.factorize(keys)
+        return key_codes[codes], list(unique_keys)
+    
+    def _cf_scores(self) -> np.ndarray:
+        """CF score of every stored record as floats (NaN where it can't be compared)"""
+        values = self.store.column_values('cf_score')
+        if values is None:
+            return np.full(len(self.store), 100.0)
+        if values.dtype == object:
+            values = pd.to_numeric(pd.Series(values).fillna(100), errors='coerce').to_numpy(dtype=np.float64)
+            return values
+        # Records without a score read back as 100, like record.get('cf_score', 100)
+        return np.where(np.isnan(values), 100.0, values.astype(np.float64))
+    
+    def _rebuild_indexes(self):
+        """Build the secondary indexes for everything in the store"""
+        brand_codes, brands = self._row_keys('brand', _normalize_brand)
+        self._brand_index = {brands[code]: Postings(rows) for code, rows in _group_rows(brand_codes)}
+        
+        cf_category_codes, cf_categories = self._row_keys('cf_category', lambda value: value)
+        self._cf_category_index = {cf_categories[code]: Postings(rows)
+                                   for code, rows in _group_rows(cf_category_codes)}
+        
+        # Sort each category once rather than inserting records one by one
+        category_codes, categories = self._row_keys(
+            'category_code', lambda value: value if isinstance(value, str) else None)
+        cf_scores = self._cf_scores()
+        category_codes = np.where(np.isnan(cf_scores), -1, category_codes)
+        self._category_cf_index = {categories[code]: _CFSortedRows(cf_scores[rows], rows)
+                                   for code, rows in _group_rows(category_codes, cf_scores)}
+        
+        # Statistics leave out records without a brand / category, so every key names one
+        self._brand_stats = CFAggregates.from_codes(
+            *self._row_keys('brand', lambda value: _normalize_brand(value) or None, missing=None), cf_scores)
+        self._category_stats = CFAggregates.from_codes(category_codes, categories, cf_scores)
+        self._cf_category_stats = CFAggregates.from_codes(
+            *self._row_keys('cf_category', lambda value: value if isinstance(value, str) else None, missing=None),
+            cf_scores)
+    
+    def _index_product(self, row: int, record: Dict[str, Any]):
+        """Add the stored catalog record at the given position to the secondary indexes and statistics"""
+        brand = _normalize_brand(record.get('brand', ''))
+        cf_category = record.get('cf_category', '')
+        category_code = record.get('category_code', '')
+        self._brand_index.setdefault(brand, Postings()).append(row)
+        self._cf_category_index.setdefault(cf_category, Postings()).append(row)
+        
+        cf_score = _sortable_cf_score(record)
+        if cf_score is None:
+            return
+        if isinstance(category_code, str):
+            self._category_cf_index.setdefault(category_code, _CFSortedRows()).insert(cf_score, row)
+            self._category_stats.add(category_code, cf_score)
+        if brand:
+            self._brand_stats.add(brand, cf_score)
+        if isinstance(cf_category, str):
+            self._cf_category_stats.add(cf_category, cf_score)
+    
+    def _row_for_id(self, record_id: str) -> Optional[int]:
+        """Position of a catalog record in the store, or None if the ID isn't a known product ID"""
+        if isinstance(record_id, str) and record_id.startswith('product_'):
+            suffix = record_id[len('product_'):]
+            if suffix.isdigit() and str(int(suffix)) == suffix and int(suffix) < self._catalog_size:
+                return int(suffix)
+        return None
+    
+    def get_by_id(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a single product or purchase record by ID
+        
+        Args:
+            record_id: ID of the record to look up
+            
+        Returns:
+            The record, or None if the ID is unknown
+        """
+        row = self._row_for_id(record_id)
+        return self.store.get_record(row) if row is not None else self.purchases.get_by_id(record_id)
+        
+        # When ChromaDB is installed, uncomment these lines:
+        # result = self.collection.get(ids=[record_id])
+        # return result['metadatas'][0] if result and result['metadatas'] else None
+    
+    def get_many(self, record_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Get several records by ID
+        
+        Args:
+            record_ids: IDs of the records to look up
+            
+        Returns:
+            List with the record (or None if unknown) for each ID, in the same order
+        """
+        return [self.get_by_id(record_id) for record_id in record_ids]
         
     def query_by_brand(self, brand: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -104,9 +819,9 @@ class ChromaDBManager:
         Returns:
             List of matching products
         """
-        # Placeholder implementation - filter by brand
-        results = [p for p in self.products_data if p.get('brand', '').lower() == brand.lower()]
-        return results[:limit]
+        # Placeholder implementation - look up the brand index
+        postings = self._brand_index.get(_normalize_brand(brand))
+        return self.store.get_records(postings.first(limit)) if postings is not None else []
         
         # When ChromaDB is installed, uncomment these lines:
         # results = self.collection.query(
@@ -127,9 +842,9 @@ class ChromaDBManager:
         Returns:
             List of matching products
         """
-        # Placeholder implementation - filter by CF category
-        results = [p for p in self.products_data if p.get('cf_category', '') == category]
-        return results[:limit]
+        # Placeholder implementation - look up the CF category index
+        postings = self._cf_category_index.get(category)
+        return self.store.get_records(postings.first(limit)) if postings is not None else []
         
         # When ChromaDB is installed, uncomment these lines:
         # results = self.collection.query(
@@ -139,6 +854,230 @@ class ChromaDBManager:
         # )
         # return results
     
+    def _page(self, scope: str, postings: Optional[Postings], limit: int,
+              cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        after = _decode_cursor(cursor, scope, self._catalog_id) if cursor else -1
+        rows = postings.rows_after(after, limit + 1) if postings is not None else []
+        next_cursor = _encode_cursor(scope, self._catalog_id, rows[limit - 1]) if len(rows) > limit else None
+        return self.store.get_records(rows[:limit]), next_cursor
+    
+    def _stream(self, scope: str, postings: Optional[Postings],
+                cursor: Optional[str]) -> Iterator[Tuple[Dict[str, Any], str]]:
+        # Decode the cursor now, so a bad one fails before the caller starts consuming results
+        after = _decode_cursor(cursor, scope, self._catalog_id) if cursor else -1
+        catalog_id = self._catalog_id
+        
+        def records():
+            position = after
+            while postings is not None:
+                rows = postings.rows_after(position, STREAM_BATCH_ROWS)
+                if not rows:
+                    return
+                for row in rows:
+                    yield self.store.get_record(row), _encode_cursor(scope, catalog_id, row)
+                position = rows[-1]
+        
+        return records()
+    
+    def page_by_brand(self, brand: str, limit: int = 10,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of the products of a brand
+        
+        Args:
+            brand: Brand name to search for (case-insensitive)
+            limit: Maximum number of products on the page
+            cursor: next_cursor of the previous page, or None for the first page
+            
+        Returns:
+            Tuple of (products, cursor for the next page or None on the last page)
+            
+        Raises:
+            ValueError: If the cursor is invalid for this query
+        """
+        key = _normalize_brand(brand)
+        return self._page(f"brand:{key}", self._brand_index.get(key), limit, cursor)
+    
+    def page_by_cf_category(self, category: str, limit: int = 10,
+                            cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of the products of a CF category (see page_by_brand)"""
+        return self._page(f"cf_category:{category}", self._cf_category_index.get(category), limit, cursor)
+    
+    def stream_by_brand(self, brand: str, cursor: Optional[str] = None) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """
+        Iterate over every product of a brand, reading the index a batch at a time
+        
+        Args:
+            brand: Brand name to search for (case-insensitive)
+            cursor: Cursor to resume after, or None to start at the beginning
+            
+        Returns:
+            Iterator of (product, cursor resuming after that product)
+            
+        Raises:
+            ValueError: If the cursor is invalid for this query
+        """
+        key = _normalize_brand(brand)
+        return self._stream(f"brand:{key}", self._brand_index.get(key), cursor)
+    
+    def stream_by_cf_category(self, category: str,
+                              cursor: Optional[str] = None) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """Iterate over every product of a CF category (see stream_by_brand)"""
+        return self._stream(f"cf_category:{category}", self._cf_category_index.get(category), cursor)
+    
+    def _postings_path(self, name: str, index: Dict[Any, Postings], keys: List[Any]) -> _AccessPath:
+        """Access path through the postings of some keys in a secondary index"""
+        postings = [index[key] for key in keys if key in index]
+        
+        def fetch():
+            rows = [item.rows() for item in postings]
+            if len(rows) == 1:
+                return rows[0]
+            return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+        
+        return _AccessPath({'access': 'index', 'index': name, 'keys': keys}, sum(len(item) for item in postings), fetch)
+    
+    def _cf_range_path(self, category_code: str, bounds: List[Condition]) -> _AccessPath:
+        """Access path through one category of the CF-sorted index, narrowed to the CF score bounds"""
+        low, low_inclusive, high, high_inclusive = None, True, None, True
+        for condition in bounds:
+            value = float(condition.operand)
+            if condition.op in ('$gt', '$gte', '$eq') and (low is None or value > low or (value == low and condition.op == '$gt')):
+                low, low_inclusive = value, condition.op != '$gt'
+            if condition.op in ('$lt', '$lte', '$eq') and (high is None or value < high or (value == high and condition.op == '$lt')):
+                high, high_inclusive = value, condition.op != '$lt'
+        
+        plan = {'access': 'index', 'index': 'category_cf', 'keys': [category_code],
+                'cf_score_range': _cf_range_text(low, low_inclusive, high, high_inclusive)}
+        category_rows = self._category_cf_index.get(category_code)
+        if category_rows is None:
+            return _AccessPath(plan, 0, lambda: np.empty(0, dtype=np.int64), cf_ordered=True)
+        return _AccessPath(plan, category_rows.count_between(low, low_inclusive, high, high_inclusive),
+                           lambda: category_rows.rows_between(low, low_inclusive, high, high_inclusive),
+                           cf_ordered=True)
+    
+    def _condition_paths(self, conditions: List[Condition]) -> List[_AccessPath]:
+        """Index access paths for records that satisfy all of the conditions"""
+        cf_bounds = [condition for condition in conditions
+                     if condition.field == 'cf_score' and condition.op in ('$eq', '$lt', '$lte', '$gt', '$gte')
+                     and isinstance(condition.operand, (int, float)) and not isinstance(condition.operand, bool)]
+        paths = []
+        for condition in conditions:
+            values = [condition.operand] if condition.op == '$eq' else condition.operand if condition.op == '$in' else None
+            # The indexes are keyed by strings; other operands fall back to a scan
+            if values is None or not all(isinstance(value, str) for value in values):
+                continue
+            if condition.field == 'brand':
+                keys = list(dict.fromkeys(_normalize_brand(value) for value in values))
+                paths.append(self._postings_path('brand', self._brand_index, keys))
+            elif condition.field == 'cf_category':
+                paths.append(self._postings_path('cf_category', self._cf_category_index, list(dict.fromkeys(values))))
+            elif condition.field == 'category_code' and condition.op == '$eq' and cf_bounds:
+                # Records without a numeric CF score aren't in this index, so it needs a CF score bound
+                paths.append(self._cf_range_path(condition.operand, cf_bounds))
+        return paths
+    
+    def _best_path(self, node) -> Optional[_AccessPath]:
+        """The index access path yielding the fewest candidates for a where clause, or None if it needs a scan"""
+        if isinstance(node, Condition):
+            paths = self._condition_paths([node])
+        elif node.op == '$and':
+            paths = self._condition_paths([child for child in node.children if isinstance(child, Condition)])
+            paths += [path for path in (self._best_path(child) for child in node.children
+                                        if not isinstance(child, Condition)) if path is not None]
+        else:
+            # $or: every branch needs an index, and the candidates are the union of theirs
+            branches = [self._best_path(child) for child in node.children]
+            if any(branch is None for branch in branches):
+                return None
+            paths = [_AccessPath({'access': 'union', 'inputs': [branch.plan for branch in branches]},
+                                 sum(branch.estimated_rows for branch in branches),
+                                 lambda: np.unique(np.concatenate([branch.fetch() for branch in branches])))]
+        return min(paths, key=lambda path: path.estimated_rows) if paths else None
+    
+    def _plan_query(self, where: Optional[Dict[str, Any]], order_by: Optional[str], limit: Optional[int]) -> _QueryPlan:
+        node = parse_where(where)
+        order_field, descending = parse_order_by(order_by)
+        total_rows = len(self.store)
+        
+        path = self._best_path(node) if node is not None else None
+        if path is None or path.estimated_rows >= total_rows:
+            path = _AccessPath({'access': 'scan'}, total_rows, lambda: np.arange(total_rows, dtype=np.int64))
+        
+        if order_field is None:
+            sort = 'position' if path.cf_ordered else 'none'
+        elif order_field == 'cf_score' and not descending and path.cf_ordered:
+            sort = 'index order'
+        else:
+            sort = f"{order_field} {'desc' if descending else 'asc'}"
+        return _QueryPlan(path, node, order_field, descending, sort, limit, total_rows)
+    
+    def query(self, where: Optional[Dict[str, Any]] = None, order_by: Optional[str] = None,
+              limit: Optional[int] = 10) -> List[Dict[str, Any]]:
+        """
+        Query records with a Chroma-style where clause
+        
+        The planner reads candidates from the most selective usable index (brand,
+        cf_category, or category_code with a cf_score bound) and checks the full where
+        clause on them with vectorized column comparisons; without a usable index it
+        scans every record. Use explain() to see the chosen plan.
+        
+        Args:
+            where: Filter such as {"$and": [{"brand": "apple"}, {"cf_score": {"$lt": 40}}]}
+                   (operators $eq, $ne, $lt, $lte, $gt, $gte, $in, $nin, $and, $or)
+            order_by: Field to sort by, prefixed with '-' for descending (default: insertion order)
+            limit: Maximum number of records to return (None for all)
+            
+        Returns:
+            List of matching records
+            
+        Raises:
+            ValueError: If the where clause is malformed
+        """
+        plan = self._plan_query(where, order_by, limit)
+        candidates = plan.path.fetch()
+        
+        if plan.sort in ('none', 'index order') and limit is not None:
+            # Candidates are already in result order, so stop filtering once there are enough matches
+            blocks = []
+            found = 0
+            for start in range(0, len(candidates), QUERY_BLOCK_ROWS):
+                block = candidates[start:start + QUERY_BLOCK_ROWS]
+                block = block[filter_mask(self.store, plan.where, block)]
+                blocks.append(block)
+                found += len(block)
+                if found >= limit:
+                    break
+            rows = np.concatenate(blocks) if blocks else candidates
+        else:
+            rows = candidates[filter_mask(self.store, plan.where, candidates)]
+            if plan.sort == 'position':
+                rows = np.sort(rows)
+            elif plan.sort != 'none' and plan.sort != 'index order':
+                rows = sort_rows(self.store, rows, plan.order_field, plan.descending)
+        
+        if limit is not None:
+            rows = rows[:limit]
+        return self.store.get_records(rows.tolist())
+        
+        # When ChromaDB is installed, uncomment these lines:
+        # results = self.collection.get(where=where, limit=limit)
+        # return results['metadatas'] if results and 'metadatas' in results else []
+    
+    def explain(self, where: Optional[Dict[str, Any]] = None, order_by: Optional[str] = None,
+                limit: Optional[int] = 10) -> Dict[str, Any]:
+        """
+        Describe how query() would run, without running it
+        
+        Returns:
+            Dictionary with the access path ('scan', 'index' with the index name and keys,
+            or 'union' of index paths), estimated and total rows, the parsed filter, how the
+            results are sorted and the limit
+        """
+        return self._plan_query(where, order_by, limit).explain()
+    
     def get_sustainable_alternatives(self, product_id: str, limit: int = 5) -> List[Dict[str, Any]]:
         """
         Find more sustainable alternatives to a product
@@ -151,29 +1090,18 @@ class ChromaDBManager:
             List of alternative products with lower CF scores
         """
         # Find the product
-        product_index = None
-        for i, product_id_val in enumerate(self.ids):
-            if product_id_val == product_id:
-                product_index = i
-                break
-        
-        if product_index is None:
+        product = self.get_by_id(product_id)
+        if product is None:
             return []
         
-        product = self.products_data[product_index]
         category_code = product.get('category_code', '')
-        cf_score = product.get('cf_score', 100)
-        
-        # Find alternatives with same category but lower CF score
-        alternatives = [
-            p for p in self.products_data 
-            if p.get('category_code', '') == category_code and p.get('cf_score', 100) < cf_score
-        ]
-        
-        # Sort by CF score (lowest first)
-        alternatives.sort(key=lambda x: x.get('cf_score', 100))
+        cf_score = _sortable_cf_score(product)
+        category_rows = self._category_cf_index.get(category_code) if isinstance(category_code, str) else None
+        if cf_score is None or category_rows is None:
+            return []
         
-        return alternatives[:limit]
+        # Alternatives in the same category with a lower CF score, lowest first
+        return self.store.get_records(category_rows.rows_below(cf_score, limit))
         
         # When ChromaDB is installed, uncomment these lines:
         # # Get the product metadata
@@ -197,6 +1125,177 @@ class ChromaDBManager:
         # 
         # return results['metadatas'] if results and 'metadatas' in results else []
 
+    def _nearest_rows(self, vector: np.ndarray, k: int):
+        """Rows and similarities of the (approximately, for large catalogs) k most similar records"""
+        if self._vector_index is not None:
+            return self._vector_index.search(self.embeddings, vector, k, n_probe=ANN_N_PROBE)
+        rows, scores = top_k(self.embeddings, vector, k)
+        return rows[0], scores[0]
+    
+    def _query_vector(self, record_id: str):
+        """
+        Catalog row (None for a purchase), record and embedding of the record to search around,
+        or (None, None, None) if the ID is unknown
+        """
+        row = self._row_for_id(record_id)
+        if row is not None:
+            return row, self.store.get_record(row), self.embeddings[row]
+        record = self.purchases.get_by_id(record_id)
+        if record is None:
+            return None, None, None
+        return None, record, embed_record(record)
+    
+    def find_similar(self, product_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Find the products most similar to a product
+        
+        Args:
+            product_id: ID of the product (or purchase) to compare against
+            limit: Maximum number of products to return
+            
+        Returns:
+            List of products, most similar first, each with a 'similarity' between -1 and 1
+        """
+        row, _, vector = self._query_vector(product_id)
+        if vector is None:
+            return []
+        
+        rows, scores = self._nearest_rows(vector, limit + 1)
+        return [dict(self.store.get_record(other), similarity=score)
+                for other, score in zip(rows.tolist(), scores.tolist()) if other != row][:limit]
+        
+        # When ChromaDB is installed, uncomment these lines:
+        # results = self.collection.query(
+        #     query_embeddings=[vector.tolist()],
+        #     n_results=limit + 1
+        # )
+        # return results['metadatas'][0] if results and 'metadatas' in results else []
+    
+    def get_similar_alternatives(self, product_id: str, limit: int = 5, candidates: int = 100,
+                                 cf_weight: float = ALTERNATIVE_CF_WEIGHT) -> List[Dict[str, Any]]:
+        """
+        Find similar products with a lower CF score
+        
+        Args:
+            product_id: ID of the product (or purchase) to find alternatives for
+            limit: Maximum number of alternatives to return
+            candidates: Number of nearest neighbours to consider
+            cf_weight: Weight of the CF score reduction (per 100 points) against similarity
+            
+        Returns:
+            List of alternatives ranked by similarity plus weighted CF reduction, each with
+            'similarity' and 'cf_reduction' added
+        """
+        row, product, vector = self._query_vector(product_id)
+        if vector is None:
+            return []
+        cf_score = _sortable_cf_score(product)
+        if cf_score is None:
+            return []
+        
+        rows, scores = self._nearest_rows(vector, max(candidates, limit) + 1)
+        ranked = []
+        for other, similarity in zip(rows.tolist(), scores.tolist()):
+            record = self.store.get_record(other)
+            other_score = _sortable_cf_score(record)
+            if other == row or other_score is None or other_score >= cf_score:
+                continue
+            cf_reduction = cf_score - other_score
+            ranked.append((similarity + cf_weight * cf_reduction / 100,
+                           dict(record, similarity=similarity, cf_reduction=cf_reduction)))
+        
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [alternative for _, alternative in ranked[:limit]]
+    
+    def _append_product(self, product_data: Dict[str, Any]) -> str:
+        """Add a record to the catalog, its indexes, statistics and embeddings, returning its ID"""
+        row = self.store.append(product_data)
+        self._catalog_size += 1
+        record = self.store.get_record(row)
+        self._index_product(row, record)
+        
+        vector = embed_record(record)
+        self._embeddings = grow_array(self._embeddings, row + 1)
+        self._embeddings[row] = vector
+        if self._vector_index is not None:
+            self._vector_index.add(row, vector)
+        return f"product_{row}"
+    
+    def add_product(self, product_data: Dict[str, Any]) -> str:
+        """
+        Add a product to the catalog
+        
+        The product is indexed and counted in the brand and category statistics right
+        away, and logged like a purchase so that it survives a restart.
+        
+        Args:
+            product_data: Dictionary containing product information
+            
+        Returns:
+            ID of the new product (product_<n>)
+        """
+        with self._write_lock:
+            new_id = self._append_product(product_data)
+            log = self._log
+            if log is not None:
+                lsn = self._log_lsn = log.append(new_id, product_data)
+        
+        if log is not None:
+            log.commit(lsn)
+            if self._log_lsn - self._snapshot_log_lsn >= self.compact_after_records:
+                self.compact_in_background()
+        
+        # When ChromaDB is installed, uncomment these lines:
+        # self.collection.add(
+        #     ids=[new_id],
+        #     embeddings=[self.embeddings[-1].tolist()],
+        #     metadatas=[product_data]
+        # )
+        
+        return new_id
+    
+    def get_brand_stats(self, brand: str) -> Optional[Dict[str, Any]]:
+        """
+        CF score statistics of one brand's products
+        
+        Args:
+            brand: Brand name (case-insensitive)
+            
+        Returns:
+            Dictionary with 'key', 'count', 'sum', 'mean', 'min', 'max' and 'histogram'
+            (product counts per 10-point CF score bucket), or None for an unknown brand
+        """
+        return self._brand_stats.get(_normalize_brand(brand))
+    
+    def brand_leaderboard(self, limit: int = 10, most_sustainable: bool = True,
+                          min_products: int = 1) -> List[Dict[str, Any]]:
+        """
+        Brands ranked by average CF score, read from the running statistics
+        
+        Args:
+            limit: Number of brands to return
+            most_sustainable: Lowest average first (otherwise highest first)
+            min_products: Leave out brands with fewer scored products
+            
+        Returns:
+            List of brand statistics (see get_brand_stats)
+        """
+        return self._brand_stats.leaderboard(limit, lowest=most_sustainable, min_count=min_products)
+    
+    @property
+    def brand_count(self) -> int:
+        """Number of brands with at least one scored product"""
+        return len(self._brand_stats)
+    
+    def get_category_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        CF score statistics per category_code and per CF category, most products first
+        
+        Returns:
+            Dictionary with 'category_code' and 'cf_category' lists (see get_brand_stats)
+        """
+        return {'category_code': self._category_stats.all(), 'cf_category': self._cf_category_stats.all()}
+    
     def add_purchase_record(self, purchase_data: Dict[str, Any]) -> str:
         """
         Add a new purchase record to the database
@@ -207,22 +1306,45 @@ class ChromaDBManager:
         Returns:
             ID of the new purchase record
         """
-        # Generate new ID
-        new_id = f"purchase_{len(self.ids)}"
+        with self._write_lock:
+            # Generate new ID
+            new_id = self.purchases.next_id()
+            self.purchases.append(new_id, purchase_data)
+            
+            # Log the purchase once it is stored, so the log only holds records that replay cleanly
+            log = self._log
+            if log is not None:
+                lsn = self._log_lsn = log.append(new_id, purchase_data)
+        
+        if log is not None:
+            log.commit(lsn)
+            if self._log_lsn - self._snapshot_log_lsn >= self.compact_after_records:
+                self.compact_in_background()
         
-        # Add to our placeholder structures
-        self.products_data.append(purchase_data)
-        self.ids.append(new_id)
-        self.embeddings_placeholder.append([0.0] * 10)  # Placeholder embedding
+        if self.purchase_backend is not None:
+            self.purchase_backend.append(dict(purchase_data, purchase_id=new_id))
         
         # When ChromaDB is installed, uncomment these lines:
         # self.collection.add(
         #     ids=[new_id],
-        #     embeddings=[self.embeddings_placeholder[-1]],  # Replace with real embedding if available
+        #     embeddings=[embed_record(purchase_data).tolist()],
         #     metadatas=[purchase_data]
         # )
         
         return new_id
+    
+    def get_user_purchases(self, user_id, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Purchase history of a user, newest first
+        
+        Args:
+            user_id: ID of the user
+            limit: Maximum number of purchases to return (None for all)
+            
+        Returns:
+            List of purchase records, each with its 'purchase_id'
+        """
+        return self.purchases.get_user_purchases(user_id, limit)
 
 if __name__ == "__main__":
     # Example usage
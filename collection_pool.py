@@ -0,0 +1,270 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional
+
+from chroma_db_integration import ChromaDBManager
+
+# Default memory budget for the collections a pool keeps loaded at once
+MEMORY_BUDGET_BYTES = 2 * 1024 ** 3
+
+
+class _Collection:
+    """Registration, loaded manager and usage counters of one collection in a pool"""
+
+    __slots__ = ('name', 'csv_path', 'process_with_cf_calculator', 'pinned', 'manager', 'memory_bytes',
+                 'active', 'hits', 'loads', 'evictions', 'load_seconds', 'last_used', 'lock')
+
+    def __init__(self, name: str, csv_path: Optional[str] = None, process_with_cf_calculator: bool = True,
+                 pinned: bool = False):
+        self.name = name
+        self.csv_path = csv_path
+        self.process_with_cf_calculator = process_with_cf_calculator
+        self.pinned = pinned
+        self.manager = None
+        self.memory_bytes = 0
+        # Requests currently using the manager (collections in use are never evicted)
+        self.active = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = None
+        self.last_used = None
+        # Held while the manager is loaded or closed, so a collection is never open twice
+        self.lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'resident': self.manager is not None,
+            'pinned': self.pinned,
+            'in_use': self.active,
+            'memory_bytes': self.memory_bytes if self.manager is not None else 0,
+            'record_count': len(self.manager.products_data) if self.manager is not None else None,
+            'hits': self.hits,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'last_load_seconds': self.load_seconds,
+            'idle_seconds': time.monotonic() - self.last_used if self.last_used is not None else None,
+            'source': self.csv_path,
+        }
+
+
+class CollectionPool:
+    """
+    Several product collections hosted by one process
+
+    Collections are loaded on first use, from their snapshot under persistence_path or
+    from a registered CSV, and the least recently used idle ones are evicted (their
+    purchase log closed and their manager dropped) whenever the loaded collections use
+    more than the memory budget. A collection is never evicted while a request uses it
+    or if it is pinned.
+    """
+
+    def __init__(self, persistence_path: str = "./chroma_db", memory_budget_bytes: int = MEMORY_BUDGET_BYTES,
+                 **manager_options):
+        """
+        Initialize the pool
+
+        Args:
+            persistence_path: Directory holding the collections' snapshots and purchase logs
+            memory_budget_bytes: Memory the loaded collections may use before idle ones are evicted
+            manager_options: Further ChromaDBManager arguments for the collections the pool loads
+        """
+        self.persistence_path = persistence_path
+        self.memory_budget_bytes = memory_budget_bytes
+        self.manager_options = manager_options
+        self._collections = {}
+        # Loaded collections, least recently used first
+        self._resident = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name: str, csv_path: Optional[str] = None, process_with_cf_calculator: bool = True,
+                 pinned: bool = False):
+        """
+        Make a collection available, to be loaded on first use
+
+        Args:
+            name: Collection name
+            csv_path: CSV to import when the collection has no snapshot of it (None to only open its snapshot)
+            process_with_cf_calculator: Whether to process the CSV with the CF calculator first
+            pinned: Keep the collection loaded once it is
+        """
+        self._check_name(name)
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                self._collections[name] = _Collection(name, csv_path, process_with_cf_calculator, pinned)
+            else:
+                collection.csv_path = csv_path
+                collection.process_with_cf_calculator = process_with_cf_calculator
+                collection.pinned = pinned
+
+    def add(self, manager: ChromaDBManager, pinned: bool = True):
+        """
+        Host an already loaded manager under its collection name
+
+        Args:
+            manager: Loaded (or about to be loaded) manager
+            pinned: Keep it loaded; an evicted manager is closed and can't be reloaded by the pool
+                unless its collection has a snapshot
+        """
+        with self._lock:
+            collection = self._collections.setdefault(manager.collection_name,
+                                                      _Collection(manager.collection_name, pinned=pinned))
+            collection.pinned = pinned
+            collection.manager = manager
+            collection.memory_bytes = manager.nbytes()
+            self._resident[manager.collection_name] = collection
+
+    @staticmethod
+    def _check_name(name: str):
+        if not name or name in ('.', '..') or '/' in name or os.sep in name:
+            raise ValueError(f"Invalid collection name: {name!r}")
+
+    def _has_snapshot(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.persistence_path, name, 'CURRENT'))
+
+    def names(self) -> List[str]:
+        """Registered collections plus those with a snapshot under persistence_path"""
+        names = set(self._collections)
+        if os.path.isdir(self.persistence_path):
+            names.update(name for name in os.listdir(self.persistence_path) if self._has_snapshot(name))
+        return sorted(names)
+
+    def _collection(self, name: str) -> _Collection:
+        collection = self._collections.get(name)
+        if collection is None:
+            self._check_name(name)
+            if not self._has_snapshot(name):
+                raise KeyError(name)
+            collection = self._collections[name] = _Collection(name)
+        return collection
+
+    def _load(self, collection: _Collection) -> ChromaDBManager:
+        manager = ChromaDBManager(collection_name=collection.name, persistence_path=self.persistence_path,
+                                  **self.manager_options)
+        start = time.perf_counter()
+        if collection.csv_path is not None:
+            manager.load_or_build(collection.csv_path, collection.process_with_cf_calculator)
+        elif not manager.open_snapshot():
+            raise KeyError(collection.name)
+        collection.load_seconds = time.perf_counter() - start
+        collection.loads += 1
+        print(f"Loaded collection {collection.name} in {collection.load_seconds:.2f}s")
+        return manager
+
+    @contextmanager
+    def collection(self, name: str) -> Iterator[ChromaDBManager]:
+        """
+        Use a collection, loading it first if needed
+
+        The collection can't be evicted until the with block ends.
+
+        Args:
+            name: Collection name
+
+        Yields:
+            The collection's manager
+
+        Raises:
+            KeyError: If the collection isn't registered and has no snapshot
+            ValueError: If the name isn't a valid collection name
+        """
+        with self._lock:
+            collection = self._collection(name)
+            collection.active += 1
+        try:
+            with collection.lock:
+                if collection.manager is None:
+                    manager = self._load(collection)
+                    with self._lock:
+                        collection.manager = manager
+                        collection.memory_bytes = manager.nbytes()
+                else:
+                    collection.hits += 1
+            with self._lock:
+                collection.last_used = time.monotonic()
+                self._resident[name] = collection
+                self._resident.move_to_end(name)
+                victims = self._choose_victims()
+            self._close(victims)
+            yield collection.manager
+        finally:
+            with self._lock:
+                collection.active -= 1
+                collection.last_used = time.monotonic()
+
+    def _choose_victims(self) -> List[tuple]:
+        """Take the least recently used idle collections out of the pool until the rest fit the budget"""
+        for collection in self._resident.values():
+            collection.memory_bytes = collection.manager.nbytes()
+        resident_bytes = sum(collection.memory_bytes for collection in self._resident.values())
+        victims = []
+        for collection in list(self._resident.values()):
+            if resident_bytes <= self.memory_budget_bytes:
+                break
+            if collection.pinned or collection.active:
+                continue
+            # Nobody loads an idle collection, so this doesn't wait; it makes the next user wait for the close
+            collection.lock.acquire()
+            victims.append((collection, collection.manager))
+            collection.manager = None
+            collection.evictions += 1
+            resident_bytes -= collection.memory_bytes
+            del self._resident[collection.name]
+        return victims
+
+    def _close(self, victims: List[tuple]):
+        for collection, manager in victims:
+            try:
+                manager.close()
+                print(f"Evicted collection {collection.name} ({collection.memory_bytes / 1024 ** 2:.1f} MB)")
+            except Exception as e:
+                print(f"Error closing collection {collection.name}: {e}")
+            finally:
+                collection.lock.release()
+
+    def evict(self, name: str) -> bool:
+        """
+        Unload an idle collection now
+
+        Returns:
+            True if it was evicted, False if it isn't loaded, is pinned or in use
+        """
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None or collection.manager is None or collection.pinned or collection.active:
+                return False
+            collection.lock.acquire()
+            victims = [(collection, collection.manager)]
+            collection.manager = None
+            collection.evictions += 1
+            del self._resident[name]
+        self._close(victims)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory budget, memory in use and per-collection residency and hit statistics"""
+        with self._lock:
+            for collection in self._resident.values():
+                collection.memory_bytes = collection.manager.nbytes()
+            collections = {name: self._collections[name].stats() if name in self._collections
+                           else _Collection(name).stats() for name in self.names()}
+            return {
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'resident_bytes': sum(collection.memory_bytes for collection in self._resident.values()),
+                'collections': collections,
+            }
+
+    def close(self):
+        """Close every loaded collection (waiting for requests still using them is up to the caller)"""
+        with self._lock:
+            victims = []
+            for collection in self._resident.values():
+                collection.lock.acquire()
+                victims.append((collection, collection.manager))
+                collection.manager = None
+            self._resident.clear()
+        self._close(victims)
@@ -0,0 +1,505 @@
+import os
+import sys
+import math
+import bisect
+import numpy as np
+import pandas as pd
+from collections.abc import Sequence
+from typing import List, Dict, Any, Optional, Tuple
+
+# Returned by column lookups for rows that have no value (the key is left out of the record)
+MISSING = object()
+
+# String columns with fewer distinct values than this fraction of rows are dictionary-encoded,
+# the rest are stored as one packed UTF-8 buffer
+DICTIONARY_ENCODING_MAX_RATIO = 0.5
+
+
+def grow_array(array: np.ndarray, size: int) -> np.ndarray:
+    """Return an array with room for at least size items (rows), doubling the capacity when full"""
+    if size <= len(array):
+        return array
+    grown = np.empty((max(size, 2 * len(array), 16),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def save_array(directory: str, name: str, array: np.ndarray) -> str:
+    """Save an array as an .npy file in directory and return the file name"""
+    filename = name + '.npy'
+    np.save(os.path.join(directory, filename), np.ascontiguousarray(array))
+    return filename
+
+
+def load_array(directory: str, filename: str) -> np.ndarray:
+    """Memory-map an .npy file read-only (pages are shared between processes)"""
+    return np.load(os.path.join(directory, filename), mmap_mode='r')
+
+
+def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode strings into one UTF-8 buffer plus offsets (string i is data[offsets[i]:offsets[i + 1]])"""
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class PackedStrings(Sequence):
+    """Read-only list of strings decoded on access from a (memory-mapped) UTF-8 buffer"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string index out of range")
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class _NumericColumn:
+    """Typed NumPy array for int, float and bool values (NaN marks missing values)"""
+
+    kind = 'numeric'
+
+    def __init__(self, data: np.ndarray, size: int):
+        self.data = data
+        self.size = size
+
+    @classmethod
+    def from_values(cls, values: np.ndarray):
+        if values.dtype.kind in 'iu' and len(values):
+            # Store integers in the smallest type that holds them
+            low, high = values.min(), values.max()
+            for dtype in (np.int8, np.int16, np.int32):
+                info = np.iinfo(dtype)
+                if info.min <= low and high <= info.max:
+                    values = values.astype(dtype)
+                    break
+        return cls(np.array(values), len(values))
+
+    def _promote(self, dtype):
+        self.data = self.data.astype(dtype)
+
+    def append(self, value) -> bool:
+        """Append a value, widening the dtype if needed; False if the value isn't numeric"""
+        if _is_missing(value):
+            if self.data.dtype.kind != 'f':
+                self._promote(np.float64)
+            value = np.nan
+        elif isinstance(value, (bool, np.bool_)):
+            if self.data.dtype.kind != 'b':
+                value = int(value)
+        elif isinstance(value, (int, np.integer)):
+            if self.data.dtype.kind == 'b':
+                self._promote(np.int64)
+            if self.data.dtype.kind in 'iu':
+                info = np.iinfo(self.data.dtype)
+                if not info.min <= value <= info.max:
+                    self._promote(np.int64 if -2**63 <= value < 2**63 else np.float64)
+        elif isinstance(value, (float, np.floating)):
+            if self.data.dtype.kind != 'f':
+                self._promote(np.float64)
+        else:
+            return False
+
+        self.data = grow_array(self.data, self.size + 1)
+        self.data[self.size] = value
+        self.size += 1
+        return True
+
+    def get(self, row: int):
+        value = self.data[row].item()
+        return MISSING if isinstance(value, float) and math.isnan(value) else value
+
+    def values(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def factorize(self) -> Tuple[np.ndarray, List[Any]]:
+        codes, uniques = pd.factorize(self.values())
+        return codes, uniques.tolist()
+
+    def nbytes(self) -> int:
+        return self.size * self.data.itemsize
+
+    def save(self, directory: str, name: str) -> Dict[str, Any]:
+        return {'kind': self.kind, 'data': save_array(directory, name, self.values())}
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]):
+        data = load_array(directory, entry['data'])
+        return cls(data, len(data))
+
+
+class _DictionaryColumn:
+    """Dictionary-encoded values: one int32 code per row pointing into a list of distinct values"""
+
+    kind = 'dictionary'
+
+    def __init__(self, codes: np.ndarray, dictionary: List[Any], size: int):
+        self.codes = codes
+        self.dictionary = dictionary
+        self.size = size
+        self._lookup = None
+
+    @classmethod
+    def from_values(cls, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        return cls(codes.astype(np.int32), list(uniques.tolist()), len(codes))
+
+    def append(self, value) -> bool:
+        if _is_missing(value):
+            code = -1
+        else:
+            # The reverse lookup is only needed for appends, so build it on first use
+            if self._lookup is None:
+                self.dictionary = list(self.dictionary)
+                self._lookup = {item: code for code, item in enumerate(self.dictionary)}
+            code = self._lookup.get(value)
+            if code is None:
+                code = len(self.dictionary)
+                self.dictionary.append(value)
+                self._lookup[value] = code
+
+        self.codes = grow_array(self.codes, self.size + 1)
+        self.codes[self.size] = code
+        self.size += 1
+        return True
+
+    def get(self, row: int):
+        code = self.codes[row]
+        return MISSING if code < 0 else self.dictionary[code]
+
+    def values(self) -> np.ndarray:
+        dictionary = np.empty(len(self.dictionary) + 1, dtype=object)
+        dictionary[:-1] = list(self.dictionary)
+        dictionary[-1] = None
+        return dictionary[self.codes[:self.size]]
+
+    def factorize(self) -> Tuple[np.ndarray, List[Any]]:
+        return self.codes[:self.size], self.dictionary
+
+    def nbytes(self) -> int:
+        if isinstance(self.dictionary, PackedStrings):
+            dictionary_bytes = self.dictionary.nbytes()
+        else:
+            dictionary_bytes = sys.getsizeof(self.dictionary) + sum(sys.getsizeof(item) for item in self.dictionary)
+        return self.size * self.codes.itemsize + dictionary_bytes
+
+    def save(self, directory: str, name: str) -> Dict[str, Any]:
+        entry = {'kind': self.kind, 'codes': save_array(directory, name + '.codes', self.codes[:self.size])}
+        if all(isinstance(value, str) for value in self.dictionary):
+            # String dictionaries are packed so that loading them is a memory map, not a parse
+            data, offsets = _pack_strings(list(self.dictionary))
+            entry['dictionary_data'] = save_array(directory, name + '.dictionary', data)
+            entry['dictionary_offsets'] = save_array(directory, name + '.dictionary_offsets', offsets)
+        else:
+            entry['dictionary'] = [value.item() if isinstance(value, np.generic) else value
+                                   for value in self.dictionary]
+        return entry
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]):
+        codes = load_array(directory, entry['codes'])
+        if 'dictionary' in entry:
+            dictionary = list(entry['dictionary'])
+        else:
+            dictionary = PackedStrings(load_array(directory, entry['dictionary_data']),
+                                       load_array(directory, entry['dictionary_offsets']))
+        return cls(codes, dictionary, len(codes))
+
+
+class _StringColumn:
+    """High-cardinality strings packed into one UTF-8 buffer with per-row offsets"""
+
+    kind = 'string'
+
+    def __init__(self, data: bytearray, offsets: np.ndarray, size: int, missing=None):
+        self.data = data
+        self.offsets = offsets
+        self.size = size
+        self.missing = missing or set()
+
+    @classmethod
+    def from_values(cls, values):
+        missing = {row for row, value in enumerate(values) if _is_missing(value)}
+        data, offsets = _pack_strings(['' if row in missing else value for row, value in enumerate(values)])
+        return cls(bytearray(data), offsets, len(offsets) - 1, missing)
+
+    def append(self, value) -> bool:
+        if _is_missing(value):
+            self.missing.add(self.size)
+        elif isinstance(value, str):
+            if not isinstance(self.data, bytearray):
+                # Loaded from a snapshot: copy the memory-mapped buffer before growing it
+                self.data = bytearray(self.data)
+            self.data += value.encode('utf-8')
+        else:
+            return False
+
+        self.offsets = grow_array(self.offsets, self.size + 2)
+        self.offsets[self.size + 1] = len(self.data)
+        self.size += 1
+        return True
+
+    def get(self, row: int):
+        if row in self.missing:
+            return MISSING
+        return bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+
+    def values(self) -> np.ndarray:
+        result = np.empty(self.size, dtype=object)
+        for row in range(self.size):
+            value = self.get(row)
+            result[row] = None if value is MISSING else value
+        return result
+
+    def factorize(self) -> Tuple[np.ndarray, List[Any]]:
+        codes, uniques = pd.factorize(self.values())
+        return codes, uniques.tolist()
+
+    def nbytes(self) -> int:
+        return len(self.data) + (self.size + 1) * self.offsets.itemsize + sys.getsizeof(self.missing)
+
+    def save(self, directory: str, name: str) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'data': save_array(directory, name, np.frombuffer(self.data, dtype=np.uint8)),
+            'offsets': save_array(directory, name + '.offsets', self.offsets[:self.size + 1]),
+            'missing': save_array(directory, name + '.missing', np.array(sorted(self.missing), dtype=np.int64)),
+        }
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]):
+        offsets = load_array(directory, entry['offsets'])
+        missing = set(np.load(os.path.join(directory, entry['missing'])).tolist())
+        return cls(load_array(directory, entry['data']), offsets, len(offsets) - 1, missing)
+
+
+_COLUMN_TYPES = {column_type.kind: column_type for column_type in (_NumericColumn, _DictionaryColumn, _StringColumn)}
+
+
+def _column_from_series(series: pd.Series):
+    """Pick the most compact column type for a DataFrame column"""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype):
+        if isinstance(dtype, np.dtype):
+            return _NumericColumn.from_values(series.to_numpy())
+        # Nullable extension types: missing values become NaN
+        return _NumericColumn.from_values(series.to_numpy(dtype=np.float64, na_value=np.nan))
+
+    values = series.to_numpy(dtype=object)
+    non_missing = series.dropna()
+    if (len(non_missing) and series.nunique() > DICTIONARY_ENCODING_MAX_RATIO * len(series)
+            and all(isinstance(value, str) for value in non_missing)):
+        return _StringColumn.from_values(values)
+    return _DictionaryColumn.from_values(values)
+
+
+def _column_from_value(value, size: int):
+    """Create an empty column for a key first seen in an appended record, padded with size missing rows"""
+    if isinstance(value, (bool, int, float, np.number)) and not isinstance(value, np.datetime64):
+        column = _NumericColumn(np.full(size, np.nan), size)
+    else:
+        column = _DictionaryColumn(np.full(size, -1, dtype=np.int32), [], size)
+    return column
+
+
+class ColumnarStore:
+    """
+    Column-oriented record store
+
+    Numeric fields live in typed NumPy arrays and string fields are dictionary-encoded
+    (or packed into a UTF-8 buffer when nearly every value is distinct), so a record costs
+    a few bytes per field instead of a Python dict. Records are only materialized as
+    dictionaries when they are read.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        self.size = 0
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> 'ColumnarStore':
+        """Build a store holding every row of a DataFrame"""
+        store = cls()
+        store.columns = {str(name): _column_from_series(df[name]) for name in df.columns}
+        store.size = len(df)
+        return store
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Append a record, adding columns for keys not seen before
+
+        Returns:
+            Position of the new record
+        """
+        for name, value in record.items():
+            if name not in self.columns:
+                self.columns[name] = _column_from_value(value, self.size)
+
+        for name, column in self.columns.items():
+            value = record.get(name)
+            if not column.append(value):
+                # A value the column type can't hold (e.g. text in a numeric column)
+                self.columns[name] = column = _DictionaryColumn.from_values(
+                    [None if item is MISSING else item for item in (column.get(row) for row in range(self.size))])
+                column.append(value)
+
+        self.size += 1
+        return self.size - 1
+
+    def get_record(self, row: int) -> Dict[str, Any]:
+        """Materialize the record at a position as a dictionary (missing values are left out)"""
+        record = {}
+        for name, column in self.columns.items():
+            value = column.get(row)
+            if value is not MISSING:
+                record[name] = value
+        return record
+
+    def get_records(self, rows) -> List[Dict[str, Any]]:
+        return [self.get_record(row) for row in rows]
+
+    def get_value(self, row: int, name: str, default=None):
+        column = self.columns.get(name)
+        if column is None:
+            return default
+        value = column.get(row)
+        return default if value is MISSING else value
+
+    def column_values(self, name: str) -> Optional[np.ndarray]:
+        """All values of a column as an array (object array for strings), or None if there is no such column"""
+        column = self.columns.get(name)
+        return column.values() if column is not None else None
+
+    def factorize(self, name: str) -> Tuple[np.ndarray, List[Any]]:
+        """Integer codes per row (-1 for missing) and the distinct values they refer to"""
+        column = self.columns.get(name)
+        if column is None:
+            return np.full(self.size, -1, dtype=np.int32), []
+        return column.factorize()
+
+    def nbytes(self) -> int:
+        """Approximate memory used by the stored values"""
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def save(self, directory: str) -> List[Dict[str, Any]]:
+        """
+        Write every column to .npy files in a directory
+
+        Args:
+            directory: Existing directory to write to
+
+        Returns:
+            Manifest entries describing the column files, for load()
+        """
+        entries = []
+        for position, (name, column) in enumerate(self.columns.items()):
+            entry = column.save(directory, f"column_{position}")
+            entry['name'] = name
+            entries.append(entry)
+        return entries
+
+    @classmethod
+    def load(cls, directory: str, entries: List[Dict[str, Any]], size: int) -> 'ColumnarStore':
+        """
+        Open a store written by save(), memory-mapping the column files
+
+        Columns stay read-only on disk until a record is appended to them, which copies
+        that column into memory.
+        """
+        store = cls()
+        store.columns = {entry['name']: _COLUMN_TYPES[entry['kind']].load(directory, entry) for entry in entries}
+        store.size = size
+        return store
+
+
+class Postings:
+    """Record positions for one index key: an array built in bulk plus the positions appended since"""
+
+    __slots__ = ('base', 'tail')
+
+    def __init__(self, base: Optional[np.ndarray] = None):
+        self.base = base if base is not None else np.empty(0, dtype=np.int64)
+        self.tail = []
+
+    def __len__(self) -> int:
+        return len(self.base) + len(self.tail)
+
+    def append(self, row: int):
+        self.tail.append(row)
+
+    def first(self, limit: int) -> List[int]:
+        rows = self.base[:limit].tolist()
+        if len(rows) < limit:
+            rows.extend(self.tail[:limit - len(rows)])
+        return rows
+
+    def rows_after(self, row: int, limit: int) -> List[int]:
+        """Up to limit positions after row, in order (positions are appended in ascending order)"""
+        start = int(np.searchsorted(self.base, row, side='right'))
+        rows = self.base[start:start + limit].tolist()
+        if len(rows) < limit:
+            tail_start = bisect.bisect_right(self.tail, row)
+            rows.extend(self.tail[tail_start:tail_start + limit - len(rows)])
+        return rows
+
+    def rows(self) -> np.ndarray:
+        """All positions in order as one array"""
+        if not self.tail:
+            return np.asarray(self.base, dtype=np.int64)
+        return np.concatenate((self.base, np.asarray(self.tail, dtype=np.int64)))
+
+
+def save_postings(directory: str, name: str, index: Dict[Any, Postings]) -> Dict[str, Any]:
+    """Write a postings index in CSR form: all rows back to back, plus where each key's rows start"""
+    keys = list(index)
+    rows = [index[key].rows() for key in keys]
+    return {
+        'keys': keys,
+        'rows': save_array(directory, name + '.rows', np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)),
+        'offsets': save_array(directory, name + '.offsets', np.concatenate(([0], np.cumsum([len(r) for r in rows])))),
+    }
+
+
+def load_postings(directory: str, entry: Dict[str, Any]) -> Dict[Any, Postings]:
+    rows = load_array(directory, entry['rows'])
+    offsets = load_array(directory, entry['offsets'])
+    return {key: Postings(rows[offsets[i]:offsets[i + 1]]) for i, key in enumerate(entry['keys'])}
+
+
+class RecordView(Sequence):
+    """Read-only list-like view that materializes store records on access"""
+
+    def __init__(self, store: ColumnarStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.store.get_records(range(*index.indices(len(self.store))))
+        if index < 0:
+            index += len(self.store)
+        if not 0 <= index < len(self.store):
+            raise IndexError("record index out of range")
+        return self.store.get_record(index)
@@ -1,6 +1,7 @@
 import os
 import json
 import random
+import asyncio
 import time  # Add time module for sleep
 from typing import Dict, List, Any, Optional
 
@@ -30,6 +31,58 @@ if api_key and GENAI_AVAILABLE:
     except Exception as e:
         print(f"Error listing Gemini models: {e}")
 
+# Gemini calls allowed in flight at once on the async path (further requests wait for a slot)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Seconds an async recommendation may take in total (waiting for a slot, attempts and backoff included)
+REQUEST_DEADLINE_S = 15.0
+
+# Seconds a single generation attempt may take
+ATTEMPT_TIMEOUT_S = 8.0
+
+# Attempts per recommendation when Gemini fails with a retryable error
+MAX_ATTEMPTS = 3
+
+# Backoff before retry n is a random delay of up to BACKOFF_BASE_S * 2**n seconds, capped at BACKOFF_MAX_S
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 4.0
+
+# HTTP status codes of Gemini errors worth retrying (rate limited, server errors, upstream timeouts)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def fallback_recommendations() -> Dict[str, str]:
+    """Generic insights returned when Gemini isn't available or doesn't answer in time"""
+    return {
+        "product_assessment": "This product has a high carbon footprint score, indicating significant environmental impact.",
+        "user_impact": "This purchase would increase your overall carbon footprint.",
+        "alternatives_recommendation": "Consider more sustainable alternatives from brands with better environmental practices.",
+        "sustainability_tips": "Extend the product's lifespan through proper maintenance. Recycle responsibly at end-of-life.",
+        "brand_info": "This brand has moderate sustainability practices compared to industry standards."
+    }
+
+
+def error_recommendations(error: Exception) -> Dict[str, str]:
+    """Insights returned when Gemini fails with an error that isn't retried"""
+    return {
+        "product_assessment": f"Error: {str(error)}",
+        "user_impact": "Could not generate insights due to an error.",
+        "alternatives_recommendation": "Please try again later.",
+        "sustainability_tips": "Service temporarily unavailable.",
+        "brand_info": "Could not retrieve brand information."
+    }
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed Gemini call is worth retrying (google.api_core errors carry the HTTP status as .code)"""
+    return isinstance(error, asyncio.TimeoutError) or getattr(error, 'code', None) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retrying after the given (0-based) attempt, with full jitter"""
+    return random.uniform(0, min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt))
+
+
 class GeminiInsightsGenerator:
     """Class to generate personalized sustainability insights using Google's Gemini API"""
     
@@ -39,6 +92,10 @@ class GeminiInsightsGenerator:
         self.api_key = api_key
         self.genai_available = GENAI_AVAILABLE
         self.request_count = 0  # Add counter for rate limiting
+        # Created on first async use, so it belongs to the server's event loop
+        self._semaphore = None
+        self.fallback_count = 0
+        self.retry_count = 0
         
         # Mock data for user - in a real application, this would come from a database
         self.mock_user_data = {
@@ -164,13 +221,7 @@ Keep your response focused and concise, with each section around 2-3 sentences.
         
         if not model:
             # Return mock data if model isn't available
-            return {
-                "product_assessment": "This product has a high carbon footprint score, indicating significant environmental impact.",
-                "user_impact": "This purchase would increase your overall carbon footprint.",
-                "alternatives_recommendation": "Consider more sustainable alternatives from brands with better environmental practices.",
-                "sustainability_tips": "Extend the product's lifespan through proper maintenance. Recycle responsibly at end-of-life.",
-                "brand_info": "This brand has moderate sustainability practices compared to industry standards."
-            }
+            return fallback_recommendations()
         
         # Generate the prompt
         prompt = self.generate_prompt(user_id, product, alternatives)
@@ -178,43 +229,111 @@ Keep your response focused and concise, with each section around 2-3 sentences.
         try:
             # Generate response from Gemini
             response = model.generate_content(prompt)
-            
-            # Parse the response - expecting JSON format
-            try:
-                # Try to extract JSON from the response
-                response_text = response.text
-                
-                # Sometimes Gemini adds ```json and ``` around the response
-                if "```json" in response_text:
-                    response_text = response_text.split("```json")[1].split("```")[0].strip()
-                elif "```" in response_text:
-                    response_text = response_text.split("```")[1].strip()
-                
-                insights = json.loads(response_text)
-                return insights
-            except json.JSONDecodeError:
-                # Fallback to text parsing if JSON extraction fails
-                print("Warning: Failed to parse JSON from Gemini response")
-                response_text = response.text
-                
-                # Create a structured response
-                return {
-                    "product_assessment": "Unable to parse structured response from AI model.",
-                    "user_impact": "Please check your API configuration.",
-                    "alternatives_recommendation": response_text[:100] + "...",
-                    "sustainability_tips": "Try again later.",
-                    "brand_info": "Service temporarily unavailable in structured format."
-                }
-                
+            return self.parse_response(response)
         except Exception as e:
             print(f"Error generating Gemini insights: {e}")
+            return error_recommendations(e)
+    
+    def parse_response(self, response) -> Dict[str, str]:
+        """Parse the insights out of a Gemini response - expecting JSON format"""
+        try:
+            # Try to extract JSON from the response
+            response_text = response.text
+            
+            # Sometimes Gemini adds ```json and ``` around the response
+            if "```json" in response_text:
+                response_text = response_text.split("```json")[1].split("```")[0].strip()
+            elif "```" in response_text:
+                response_text = response_text.split("```")[1].strip()
+            
+            insights = json.loads(response_text)
+            return insights
+        except json.JSONDecodeError:
+            # Fallback to text parsing if JSON extraction fails
+            print("Warning: Failed to parse JSON from Gemini response")
+            response_text = response.text
+            
+            # Create a structured response
             return {
-                "product_assessment": f"Error: {str(e)}",
-                "user_impact": "Could not generate insights due to an error.",
-                "alternatives_recommendation": "Please try again later.",
-                "sustainability_tips": "Service temporarily unavailable.",
-                "brand_info": "Could not retrieve brand information."
+                "product_assessment": "Unable to parse structured response from AI model.",
+                "user_impact": "Please check your API configuration.",
+                "alternatives_recommendation": response_text[:100] + "...",
+                "sustainability_tips": "Try again later.",
+                "brand_info": "Service temporarily unavailable in structured format."
             }
+    
+    async def _generate_content_async(self, model, prompt: str):
+        # Native async call when the installed client has one, else the blocking call on a worker thread
+        # (a timed-out worker thread finishes in the background, but its result is dropped)
+        if hasattr(model, 'generate_content_async'):
+            return await model.generate_content_async(prompt)
+        return await asyncio.to_thread(model.generate_content, prompt)
+    
+    async def generate_recommendations_async(self, user_id: str, product: Dict[str, Any],
+                                             alternatives: List[Dict[str, Any]] = None,
+                                             deadline_s: float = REQUEST_DEADLINE_S,
+                                             attempt_timeout_s: float = ATTEMPT_TIMEOUT_S,
+                                             max_attempts: int = MAX_ATTEMPTS) -> Dict[str, str]:
+        """
+        Generate sustainability recommendations without blocking the event loop
+        
+        At most MAX_CONCURRENT_REQUESTS calls are in flight; the others wait for a slot.
+        Each attempt is cut off after attempt_timeout_s, and attempts failing with a
+        retryable error (rate limits, server errors, timeouts) are retried after a
+        jittered exponential backoff. Once deadline_s has passed the generic fallback
+        insights are returned instead of waiting any longer.
+        
+        Args:
+            user_id: ID of the user
+            product: Product being considered
+            alternatives: Lower-CF alternatives to mention
+            deadline_s: Seconds the whole call may take
+            attempt_timeout_s: Seconds a single attempt may take
+            max_attempts: Most attempts made
+        """
+        if alternatives is None:
+            alternatives = []
+        
+        model = self.get_model()
+        if not model:
+            return fallback_recommendations()
+        
+        prompt = self.generate_prompt(user_id, product, alternatives)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            self.fallback_count += 1
+            print(f"Gemini request for user {user_id} timed out waiting for a free slot")
+            return fallback_recommendations()
+        try:
+            self.request_count += 1
+            for attempt in range(max_attempts):
+                remaining = deadline - loop.time()
+                try:
+                    response = await asyncio.wait_for(self._generate_content_async(model, prompt),
+                                                      min(attempt_timeout_s, remaining))
+                    return self.parse_response(response)
+                except Exception as e:
+                    if not is_retryable(e):
+                        print(f"Error generating Gemini insights: {e}")
+                        return error_recommendations(e)
+                    delay = backoff_delay(attempt)
+                    if attempt + 1 == max_attempts or loop.time() + delay >= deadline:
+                        break
+                    print(f"Retrying Gemini request after {type(e).__name__} in {delay:.2f}s")
+                    self.retry_count += 1
+                    await asyncio.sleep(delay)
+        finally:
+            self._semaphore.release()
+        
+        self.fallback_count += 1
+        print(f"Gemini request for user {user_id} gave up after its deadline or retries; returning fallback insights")
+        return fallback_recommendations()
 
 # Example usage
 if __name__ == "__main__":
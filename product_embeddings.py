@@ -0,0 +1,273 @@
+import math
+import zlib
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from columnar_store import load_array, save_array
+
+# Length of the product embedding vectors
+EMBEDDING_DIM = 32
+
+# Record fields that feed the embedding, with the weight of their features
+EMBEDDING_FIELDS = {
+    'category_code': 1.0,
+    'brand': 1.0,
+    'price': 0.75,
+    'packaging_material': 0.5,
+    'shipping_mode': 0.5,
+    'usage_duration': 0.5,
+    'repairability_score': 0.5,
+}
+
+# Rows scored per matrix multiplication in brute-force search
+SEARCH_BLOCK_ROWS = 65536
+
+
+def _value_features(field: str, value) -> List[Tuple[str, float]]:
+    """
+    Hashed features (name, weight) for one field value
+
+    Prices fall into log2 bands, split linearly between the two nearest bands so that
+    similar prices get similar vectors. Category paths contribute every level, so sibling
+    categories share features.
+    """
+    if field == 'price':
+        try:
+            price = float(value)
+        except (TypeError, ValueError):
+            return []
+        if math.isnan(price) or price < 0:
+            return []
+        position = math.log2(price + 1)
+        band = math.floor(position)
+        fraction = position - band
+        return [(f"price_band={band}", 1.0 - fraction), (f"price_band={band + 1}", fraction)]
+
+    if field == 'category_code':
+        if not isinstance(value, str):
+            return []
+        parts = value.strip().lower().split('.')
+        return [(f"category={'.'.join(parts[:level + 1])}", 1.0) for level in range(len(parts))]
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return [(f"{field}={str(value).strip().lower()}", 1.0)]
+
+
+def _feature_slot(feature: str, dim: int) -> Tuple[int, float]:
+    """Vector position and sign of a feature (crc32 is stable across processes, unlike hash())"""
+    digest = zlib.crc32(feature.encode('utf-8'))
+    return digest % dim, (1.0 if digest & 0x80000000 else -1.0)
+
+
+def _feature_table(field: str, values: List[Any], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Slots and signed weights of every distinct value of a field
+
+    Returns:
+        Tuple of (slots, weights) arrays with one row per value plus an all-zero last row
+        for missing values
+    """
+    field_weight = EMBEDDING_FIELDS[field]
+    features = [_value_features(field, value) for value in values]
+    width = max((len(value_features) for value_features in features), default=0)
+    slots = np.zeros((len(values) + 1, width), dtype=np.int64)
+    weights = np.zeros((len(values) + 1, width), dtype=np.float32)
+    for code, value_features in enumerate(features):
+        for position, (feature, weight) in enumerate(value_features):
+            slot, sign = _feature_slot(feature, dim)
+            slots[code, position] = slot
+            weights[code, position] = sign * weight * field_weight
+    return slots, weights
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place (all-zero rows stay zero)"""
+    norms = np.sqrt(np.einsum('ij,ij->i', matrix, matrix))
+    norms[norms == 0] = 1.0
+    matrix /= norms[:, None]
+    return matrix
+
+
+def embed_store(store, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed every record of a ColumnarStore
+
+    Args:
+        store: Records to embed
+        dim: Length of the vectors
+
+    Returns:
+        float32 matrix with one unit-length row per record
+    """
+    matrix = np.zeros((len(store), dim), dtype=np.float32)
+    rows = np.arange(len(store))
+    for field in EMBEDDING_FIELDS:
+        if field not in store.columns:
+            continue
+        # Hash each distinct value once, then scatter by code (code -1 hits the all-zero row)
+        codes, values = store.factorize(field)
+        slots, weights = _feature_table(field, values, dim)
+        for position in range(slots.shape[1]):
+            matrix[rows, slots[codes, position]] += weights[codes, position]
+    return _normalize_rows(matrix)
+
+
+def embed_record(record: Dict[str, Any], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embed a single record the same way as embed_store"""
+    vector = np.zeros((1, dim), dtype=np.float32)
+    for field, field_weight in EMBEDDING_FIELDS.items():
+        value = record.get(field)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        for feature, weight in _value_features(field, value):
+            slot, sign = _feature_slot(feature, dim)
+            vector[0, slot] += np.float32(sign * weight * field_weight)
+    return _normalize_rows(vector)[0]
+
+
+def _best_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k highest scores of each query row (unordered)"""
+    if scores.shape[1] <= k:
+        return scores, rows
+    keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(scores, keep, axis=1), np.take_along_axis(rows, keep, axis=1)
+
+
+def top_k(matrix: np.ndarray, queries: np.ndarray, k: int,
+          block_rows: int = SEARCH_BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact nearest neighbours by inner product, for a batch of queries
+
+    Args:
+        matrix: Vectors to search, one per row
+        queries: Query vectors, one per row
+        k: Number of neighbours per query
+        block_rows: Matrix rows scored at once (bounds the memory used)
+
+    Returns:
+        Tuple of (rows, scores) arrays of shape (queries, k), best first
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    k = min(k, len(matrix))
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    if k <= 0:
+        return best_rows, best_scores
+
+    for start in range(0, len(matrix), block_rows):
+        scores = queries @ matrix[start:start + block_rows].T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best_scores, best_rows = _best_k(np.concatenate((best_scores, scores), axis=1),
+                                         np.concatenate((best_rows, rows), axis=1), k)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _nearest_centroids(matrix: np.ndarray, centroids: np.ndarray, block_rows: int = SEARCH_BLOCK_ROWS) -> np.ndarray:
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), block_rows):
+        assignments[start:start + block_rows] = np.argmax(matrix[start:start + block_rows] @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index
+
+    Vectors are bucketed by their nearest k-means centroid, and a search only scores
+    the buckets whose centroids are closest to the query. The index keeps row numbers
+    only; the vectors themselves are passed in at search time.
+    """
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        # Rows grouped by bucket: bucket i holds order[offsets[i]:offsets[i + 1]]
+        self.order = order
+        self.offsets = offsets
+        # Rows added after the index was built, per bucket
+        self.tail = [[] for _ in range(len(centroids))]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, n_lists: Optional[int] = None, iterations: int = 10,
+              seed: int = 0) -> 'IVFIndex':
+        """
+        Cluster the rows of a matrix with spherical k-means
+
+        Args:
+            matrix: Unit-length vectors, one per row
+            n_lists: Number of buckets (defaults to about the square root of the row count)
+            iterations: k-means iterations
+            seed: Seed for the training sample and initial centroids
+
+        Returns:
+            The index
+        """
+        rng = np.random.default_rng(seed)
+        n_lists = min(n_lists or int(np.clip(math.sqrt(len(matrix)), 1, 4096)), max(len(matrix), 1))
+
+        # Train on a sample; 64 points per centroid is plenty for these low-dimensional vectors
+        sample_size = min(len(matrix), 64 * n_lists)
+        sample = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))] if len(matrix) else matrix
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy() if len(sample) else \
+            np.zeros((n_lists, matrix.shape[1]), dtype=np.float32)
+        for _ in range(iterations):
+            assignments = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize_rows(sums)
+
+        assignments = _nearest_centroids(matrix, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=n_lists))))
+        return cls(centroids, order, offsets)
+
+    def save(self, directory: str) -> Dict[str, Any]:
+        """Write the index to .npy files (folding in added rows) and return its manifest entry"""
+        buckets = [np.concatenate((self.order[self.offsets[bucket]:self.offsets[bucket + 1]],
+                                   np.asarray(self.tail[bucket], dtype=np.int64)))
+                   for bucket in range(len(self.centroids))]
+        offsets = np.concatenate(([0], np.cumsum([len(rows) for rows in buckets])))
+        order = np.concatenate(buckets) if buckets else np.empty(0, dtype=np.int64)
+        return {
+            'centroids': save_array(directory, 'ivf_centroids', self.centroids),
+            'order': save_array(directory, 'ivf_order', order),
+            'offsets': save_array(directory, 'ivf_offsets', offsets),
+        }
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]) -> 'IVFIndex':
+        """Open an index written by save(), memory-mapping its files"""
+        return cls(load_array(directory, entry['centroids']), load_array(directory, entry['order']),
+                   load_array(directory, entry['offsets']))
+
+    def add(self, row: int, vector: np.ndarray):
+        """Add a row to the bucket of its nearest centroid"""
+        self.tail[int(np.argmax(self.centroids @ vector))].append(row)
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int, n_probe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate nearest neighbours of one query vector
+
+        Args:
+            matrix: Vectors the index was built over (plus any added rows)
+            query: Query vector
+            k: Number of neighbours
+            n_probe: Number of buckets to search
+
+        Returns:
+            Tuple of (rows, scores), best first
+        """
+        n_probe = min(n_probe, len(self.centroids))
+        buckets = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        candidates = np.concatenate(
+            [self.order[self.offsets[bucket]:self.offsets[bucket + 1]] for bucket in buckets]
+            + [np.asarray(self.tail[bucket], dtype=np.int64) for bucket in buckets])
+        scores = matrix[candidates] @ query
+        k = min(k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k] if 0 < k < len(candidates) else np.arange(k)
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return candidates[best], scores[best]
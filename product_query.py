@@ -0,0 +1,232 @@
+import math
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from columnar_store import ColumnarStore, MISSING
+
+# Operators accepted in where clauses, following Chroma's metadata filters
+COMPARISON_OPERATORS = ('$eq', '$ne', '$lt', '$lte', '$gt', '$gte', '$in', '$nin')
+LOGICAL_OPERATORS = ('$and', '$or')
+ORDERING_OPERATORS = ('$lt', '$lte', '$gt', '$gte')
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def _is_missing(value) -> bool:
+    return value is None or value is MISSING or (isinstance(value, float) and math.isnan(value))
+
+
+class Condition:
+    """A comparison of one record field with an operand, e.g. cf_score $lt 40"""
+
+    __slots__ = ('field', 'op', 'operand')
+
+    def __init__(self, field: str, op: str, operand):
+        self.field = field
+        self.op = op
+        self.operand = operand
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {self.field: {self.op: self.operand}}
+
+
+class Logical:
+    """$and / $or over a list of conditions and nested logical clauses"""
+
+    __slots__ = ('op', 'children')
+
+    def __init__(self, op: str, children: List[Any]):
+        self.op = op
+        self.children = children
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {self.op: [child.to_dict() for child in self.children]}
+
+
+def _parse_condition(field: str, spec) -> Condition:
+    if not isinstance(spec, dict):
+        # {"brand": "apple"} is shorthand for {"brand": {"$eq": "apple"}}
+        spec = {'$eq': spec}
+    if len(spec) != 1:
+        raise ValueError(f"Expected one operator for field '{field}', got {list(spec)}")
+    (op, operand), = spec.items()
+    if op not in COMPARISON_OPERATORS:
+        raise ValueError(f"Unknown operator '{op}' for field '{field}'")
+    if op in ('$in', '$nin'):
+        if not isinstance(operand, (list, tuple)):
+            raise ValueError(f"{op} for field '{field}' needs a list of values")
+        operand = list(operand)
+    elif op in ORDERING_OPERATORS and not _is_number(operand):
+        raise ValueError(f"{op} for field '{field}' needs a number, got {operand!r}")
+    return Condition(field, op, operand)
+
+
+def parse_where(where: Optional[Dict[str, Any]]):
+    """
+    Parse a Chroma-style where clause
+
+    Supports {"field": value}, {"field": {"$op": value}} with the operators in
+    COMPARISON_OPERATORS, and {"$and": [...]} / {"$or": [...]}. Several fields in
+    one dictionary are combined with $and.
+
+    Returns:
+        Condition or Logical tree, or None for an empty clause (every record matches)
+
+    Raises:
+        ValueError: If the clause is malformed
+    """
+    if not where:
+        return None
+    if not isinstance(where, dict):
+        raise ValueError(f"where must be a dictionary, got {type(where).__name__}")
+
+    clauses = []
+    for key, spec in where.items():
+        if key in LOGICAL_OPERATORS:
+            if not isinstance(spec, (list, tuple)) or not spec:
+                raise ValueError(f"{key} needs a non-empty list of clauses")
+            children = [parse_where(child) for child in spec]
+            if any(child is None for child in children):
+                raise ValueError(f"{key} clauses can't be empty")
+            clauses.append(children[0] if len(children) == 1 else Logical(key, children))
+        elif key.startswith('$'):
+            raise ValueError(f"Unknown logical operator '{key}'")
+        else:
+            clauses.append(_parse_condition(key, spec))
+    return clauses[0] if len(clauses) == 1 else Logical('$and', clauses)
+
+
+def _value_matches(value, op: str, operand) -> bool:
+    """Whether one stored value satisfies a comparison (missing values never do)"""
+    if _is_missing(value):
+        return False
+    if op == '$eq':
+        return value == operand
+    if op == '$ne':
+        return value != operand
+    if op == '$in':
+        return value in operand
+    if op == '$nin':
+        return value not in operand
+    if not _is_number(value):
+        return False
+    if op == '$lt':
+        return value < operand
+    if op == '$lte':
+        return value <= operand
+    if op == '$gt':
+        return value > operand
+    return value >= operand
+
+
+def _numeric_mask(values: np.ndarray, op: str, operand) -> np.ndarray:
+    """Vectorized comparison over a numeric column (NaN is missing and never matches)"""
+    present = ~np.isnan(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=bool)
+    if op in ('$eq', '$ne'):
+        equal = values == operand if _is_number(operand) or isinstance(operand, bool) else np.zeros(len(values), dtype=bool)
+        return equal if op == '$eq' else present & ~equal
+    if op in ('$in', '$nin'):
+        numbers = [item for item in operand if _is_number(item) or isinstance(item, bool)]
+        found = np.isin(values, numbers) if numbers else np.zeros(len(values), dtype=bool)
+        return found if op == '$in' else present & ~found
+    if op == '$lt':
+        return values < operand
+    if op == '$lte':
+        return values <= operand
+    if op == '$gt':
+        return values > operand
+    return values >= operand
+
+
+def condition_mask(store: ColumnarStore, condition: Condition, rows: np.ndarray) -> np.ndarray:
+    """Which of the given record positions satisfy one condition"""
+    column = store.columns.get(condition.field)
+    if column is None:
+        return np.zeros(len(rows), dtype=bool)
+    if column.kind == 'numeric':
+        with np.errstate(invalid='ignore'):
+            return _numeric_mask(column.values()[rows], condition.op, condition.operand)
+    if column.kind == 'dictionary':
+        # Compare each distinct value once, then look the result up by code (code -1, missing, hits the final False)
+        codes, dictionary = column.factorize()
+        matches = np.zeros(len(dictionary) + 1, dtype=bool)
+        matches[:-1] = [_value_matches(value, condition.op, condition.operand) for value in dictionary]
+        return matches[codes[rows]]
+    return np.fromiter((_value_matches(store.get_value(row, condition.field), condition.op, condition.operand)
+                        for row in rows.tolist()), dtype=bool, count=len(rows))
+
+
+def filter_mask(store: ColumnarStore, node, rows: np.ndarray) -> np.ndarray:
+    """Which of the given record positions satisfy a parsed where clause"""
+    if node is None:
+        return np.ones(len(rows), dtype=bool)
+    if isinstance(node, Condition):
+        return condition_mask(store, node, rows)
+    if node.op == '$and':
+        mask = np.ones(len(rows), dtype=bool)
+        for child in node.children:
+            # Only evaluate the next clause on rows that still match
+            remaining = np.flatnonzero(mask)
+            if not len(remaining):
+                break
+            mask[remaining] = filter_mask(store, child, rows[remaining])
+        return mask
+    mask = np.zeros(len(rows), dtype=bool)
+    for child in node.children:
+        remaining = np.flatnonzero(~mask)
+        if not len(remaining):
+            break
+        mask[remaining] = filter_mask(store, child, rows[remaining])
+    return mask
+
+
+def _sort_key(value) -> Tuple[int, Any]:
+    """Order numbers before other values, so mixed columns still sort"""
+    return (0, value) if _is_number(value) or isinstance(value, bool) else (1, str(value))
+
+
+def _ranks(values: List[Any]) -> np.ndarray:
+    """Rank of each value in sorted order (equal values share a rank)"""
+    distinct = sorted(set(values), key=_sort_key)
+    rank_of = {value: rank for rank, value in enumerate(distinct)}
+    return np.array([rank_of[value] for value in values], dtype=np.int64)
+
+
+def parse_order_by(order_by: Optional[str]) -> Tuple[Optional[str], bool]:
+    """Split "field" / "-field" into (field, descending)"""
+    if not order_by:
+        return None, False
+    if order_by.startswith('-'):
+        return order_by[1:], True
+    return order_by, False
+
+
+def sort_rows(store: ColumnarStore, rows: np.ndarray, field: str, descending: bool = False) -> np.ndarray:
+    """
+    Order record positions by a field, keeping ties in their given order
+
+    Records without a value for the field come last in either direction.
+    """
+    column = store.columns.get(field)
+    if column is None or not len(rows):
+        return rows
+    if column.kind == 'numeric':
+        keys = column.values()[rows].astype(np.float64)
+        missing = np.isnan(keys)
+    else:
+        if column.kind == 'dictionary':
+            codes, dictionary = column.factorize()
+            codes = codes[rows]
+            dictionary_ranks = np.append(_ranks(list(dictionary)), -1) if len(dictionary) else np.array([-1])
+            keys = dictionary_ranks[codes].astype(np.float64)
+            missing = codes < 0
+        else:
+            values = [store.get_value(row, field) for row in rows.tolist()]
+            missing = np.array([_is_missing(value) for value in values], dtype=bool)
+            keys = np.zeros(len(values))
+            present = np.flatnonzero(~missing)
+            keys[present] = _ranks([values[i] for i in present.tolist()])
+    keys = np.where(missing, 0, -keys if descending else keys)
+    return rows[np.lexsort((keys, missing))]
@@ -0,0 +1,293 @@
+import os
+import json
+import zlib
+import threading
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows: the one-process rule of the files below is then not enforced
+    fcntl = None
+
+# Unsynced records that make an append fsync the log right away (1 makes every record durable before it is acknowledged)
+FSYNC_EVERY_RECORDS = 64
+
+# Longest time in milliseconds a written record waits for the background fsync (0 disables the flusher)
+FSYNC_INTERVAL_MS = 100
+
+SEGMENT_PREFIX = 'purchases-'
+SEGMENT_SUFFIX = '.log'
+
+# Lock file a PurchaseLog holds in its directory while it is open
+LOCK_NAME = 'LOCK'
+
+
+def _segment_name(first_lsn: int) -> str:
+    return f"{SEGMENT_PREFIX}{first_lsn:012d}{SEGMENT_SUFFIX}"
+
+
+def _json_default(value):
+    """Encode NumPy scalars as Python values and anything else (e.g. timestamps) as text"""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def _encode_entry(lsn: int, record_id: str, record: Dict[str, Any]) -> bytes:
+    """One log line: CRC32 of the JSON payload in hex, a space, the payload and a newline"""
+    payload = json.dumps({'lsn': lsn, 'id': record_id, 'record': record},
+                         default=_json_default, separators=(',', ':')).encode('utf-8')
+    return b'%08x %s\n' % (zlib.crc32(payload), payload)
+
+
+def _decode_entry(line: bytes) -> Optional[Dict[str, Any]]:
+    """The entry stored in a log line, or None if the line is torn or corrupt"""
+    if len(line) < 10 or not line.endswith(b'\n') or line[8:9] != b' ':
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _read_segment(path: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Entries of a segment file up to the first bad line, and the length of that valid prefix"""
+    entries = []
+    valid_length = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            entry = _decode_entry(line)
+            if entry is None:
+                break
+            entries.append(entry)
+            valid_length += len(line)
+    return entries, valid_length
+
+
+def _fsync_directory(directory: str):
+    """Make file creations and deletions in a directory durable (not supported everywhere)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _lock_exclusively(path: str, owner: str) -> Optional[IO]:
+    """
+    Take an exclusive flock on a lock file, failing at once if it is held
+
+    The lock belongs to the open file, so it is released when the file is closed or
+    the process exits, and a second open in the same process fails too.
+
+    Returns:
+        The open lock file (close it to release the lock), or None where flock isn't available
+    """
+    if fcntl is None:
+        return None
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(f"{owner} is already open ({path} is locked by another process or an unclosed "
+                           f"instance); only one process may use it at a time")
+    return lock_file
+
+
+class PurchaseLog:
+    """
+    Append-only, fsync-batched log of purchase records
+
+    Records are numbered with increasing log sequence numbers (LSNs) and written to
+    segment files named after the first LSN they hold. Appends only write to the file;
+    fsync happens once fsync_every_records records are unsynced, or after at most
+    fsync_interval_ms on a background thread. Concurrent writers share one fsync
+    (group commit), so lowering the durability window costs less than one fsync per
+    record. Segments that a snapshot already covers are deleted with discard_through().
+
+    Only one process may write to a log directory at a time: the log holds an exclusive
+    lock on a LOCK file there while it is open, and opening it again fails.
+    """
+
+    def __init__(self, directory: str, fsync_every_records: int = FSYNC_EVERY_RECORDS,
+                 fsync_interval_ms: float = FSYNC_INTERVAL_MS, first_lsn: int = 1):
+        """
+        Open (or create) the log in a directory, dropping a torn record at its end
+
+        Args:
+            directory: Directory holding the segment files
+            fsync_every_records: Unsynced records that trigger an fsync on append (0 to rely on the interval)
+            fsync_interval_ms: Longest time a record stays unsynced (0 to only fsync on count or sync())
+            first_lsn: LSN of the first record if the log is empty (continues numbering after a snapshot)
+        """
+        self.directory = directory
+        self.fsync_every_records = fsync_every_records
+        self.fsync_interval_ms = fsync_interval_ms
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = _lock_exclusively(os.path.join(directory, LOCK_NAME), f"Purchase log {directory}")
+
+        # _lock orders writes and segment switches; _sync_lock lets one fsync run while appends continue
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+        segments = self._segments()
+        if segments:
+            segment_lsn, path = segments[-1]
+            entries, valid_length = _read_segment(path)
+            if valid_length < os.path.getsize(path):
+                print(f"Truncating torn record at the end of {path}")
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_length)
+                    os.fsync(f.fileno())
+            self.last_lsn = entries[-1]['lsn'] if entries else segment_lsn - 1
+        else:
+            self.last_lsn = first_lsn - 1
+            path = os.path.join(directory, _segment_name(first_lsn))
+        self._file = open(path, 'ab')
+        _fsync_directory(directory)
+        self.synced_lsn = self.last_lsn
+        self.fsync_count = 0
+
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync_interval_ms:
+            self._flusher = threading.Thread(target=self._flush_periodically, name='purchase-log-flusher', daemon=True)
+            self._flusher.start()
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(first LSN, path) of every segment file, oldest first"""
+        segments = []
+        for name in os.listdir(self.directory):
+            number = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX) and number.isdigit():
+                segments.append((int(number), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    @property
+    def unsynced_count(self) -> int:
+        """Records written but not yet fsynced"""
+        return self.last_lsn - self.synced_lsn
+
+    def append(self, record_id: str, record: Dict[str, Any]) -> int:
+        """
+        Write a record to the log without waiting for it to be durable (see commit())
+
+        Returns:
+            LSN of the record
+        """
+        with self._lock:
+            lsn = self.last_lsn + 1
+            self._file.write(_encode_entry(lsn, record_id, record))
+            self.last_lsn = lsn
+        return lsn
+
+    def commit(self, lsn: int):
+        """Apply the fsync policy after an append: fsync now if enough records are unsynced"""
+        if self.fsync_every_records and lsn - self.synced_lsn >= self.fsync_every_records:
+            self.sync(lsn)
+
+    def sync(self, lsn: Optional[int] = None):
+        """
+        Make every record up to lsn (default: all written records) durable
+
+        Callers waiting here while another thread fsyncs return as soon as that fsync
+        covered their record.
+        """
+        with self._sync_lock:
+            if lsn is not None and self.synced_lsn >= lsn:
+                return
+            with self._lock:
+                if self.synced_lsn == self.last_lsn:
+                    return
+                self._file.flush()
+                target = self.last_lsn
+                fd = self._file.fileno()
+            os.fsync(fd)
+            self.synced_lsn = target
+            self.fsync_count += 1
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.fsync_interval_ms / 1000):
+            if self.synced_lsn < self.last_lsn:
+                try:
+                    self.sync()
+                except Exception as e:
+                    print(f"Error syncing purchase log in {self.directory}: {e}")
+
+    def rotate(self) -> int:
+        """
+        Sync the current segment and start writing to a new one
+
+        Returns:
+            LSN of the last record in the finished segments
+        """
+        with self._sync_lock, self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.synced_lsn = self.last_lsn
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._file.close()
+                self._file = open(os.path.join(self.directory, _segment_name(self.last_lsn + 1)), 'ab')
+                _fsync_directory(self.directory)
+            return self.last_lsn
+
+    def discard_through(self, lsn: int) -> int:
+        """
+        Delete finished segments whose records all have an LSN of at most lsn
+
+        Returns:
+            Number of segments deleted
+        """
+        with self._lock:
+            active_path = self._file.name
+        segments = self._segments()
+        removed = 0
+        for (_, path), (next_lsn, _) in zip(segments, segments[1:]):
+            if path != active_path and next_lsn - 1 <= lsn:
+                os.remove(path)
+                removed += 1
+        if removed:
+            _fsync_directory(self.directory)
+        return removed
+
+    def replay(self, after_lsn: int = 0) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+        """
+        Read back the logged records
+
+        Args:
+            after_lsn: Skip records up to and including this LSN (e.g. the ones a snapshot holds)
+
+        Returns:
+            Iterator of (LSN, record ID, record), oldest first
+        """
+        with self._lock:
+            self._file.flush()
+        segments = self._segments()
+        for position, (_, path) in enumerate(segments):
+            if position + 1 < len(segments) and segments[position + 1][0] - 1 <= after_lsn:
+                continue
+            entries, _ = _read_segment(path)
+            for entry in entries:
+                if entry['lsn'] > after_lsn:
+                    yield entry['lsn'], entry['id'], entry['record']
+
+    def close(self):
+        """Stop the background flusher, fsync what is left and close the file"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.sync()
+        with self._lock:
+            self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
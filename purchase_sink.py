@@ -0,0 +1,339 @@
+import io
+import os
+import csv
+import json
+import queue
+import threading
+import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from purchase_log import LOCK_NAME, _fsync_directory, _lock_exclusively
+
+# Most records written to the CSV per batch (the writer takes whatever is queued, up to this many)
+BATCH_RECORDS = 1000
+
+# Size at which the writer starts a new segment file
+ROTATE_BYTES = 16 * 1024 ** 2
+
+# Seconds between background compactions (0 disables them; compact() can still be called)
+COMPACT_INTERVAL_S = 300
+
+SEGMENT_PREFIX = 'purchases-'
+SEGMENT_SUFFIX = '.csv'
+
+# Queue item that makes the writer exit once everything before it is written
+_STOP = object()
+
+
+def _segment_name(sequence: int) -> str:
+    return f"{SEGMENT_PREFIX}{sequence:06d}{SEGMENT_SUFFIX}"
+
+
+def _complete_text(path: str) -> str:
+    """Contents of a segment, leaving out a row torn by a crash while it was written"""
+    with open(path, newline='') as f:
+        text = f.read()
+    return text[:text.rfind('\n') + 1]
+
+
+def _read_header(path: str) -> Optional[List[str]]:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, newline='') as f:
+        return next(csv.reader(f), None)
+
+
+class PurchaseSink:
+    """
+    Append-only CSV sink for purchase records, with a single writer thread
+
+    append() only queues the record, so a request costs the same however long the
+    purchase history is. The writer thread writes whatever is queued as one batch to
+    the current segment file (a small CSV of its own) and starts a new segment once
+    it reaches rotate_bytes. Compaction appends finished segments to the main CSV and
+    deletes them; when the main CSV lacks some of the sink's columns it is rewritten
+    once with them added.
+
+    Queued records that aren't written yet are lost if the process dies (flush() waits
+    for them). Merges are recorded in a state file next to the main CSV, so a merge
+    interrupted by a crash is rolled back and redone rather than duplicated.
+    Only one process may use a sink's files at a time: the sink holds an exclusive lock
+    on a LOCK file in its segment directory while it is open, and opening it again fails.
+    """
+
+    def __init__(self, csv_path: str, columns: List[str], batch_records: int = BATCH_RECORDS,
+                 rotate_bytes: int = ROTATE_BYTES, compact_interval_s: float = COMPACT_INTERVAL_S):
+        """
+        Open the sink and start its writer (and compaction) threads
+
+        Args:
+            csv_path: Main purchase history CSV
+            columns: Columns written for each record (other keys are left out)
+            batch_records: Most records written per batch
+            rotate_bytes: Segment size that starts a new segment
+            compact_interval_s: Seconds between background compactions (0 to disable)
+        """
+        self.csv_path = csv_path
+        self.columns = list(columns)
+        self.batch_records = batch_records
+        self.rotate_bytes = rotate_bytes
+        self.directory = f"{csv_path}.segments"
+        self.state_path = f"{csv_path}.sink.json"
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = _lock_exclusively(os.path.join(self.directory, LOCK_NAME), f"Purchase sink {csv_path}")
+
+        # _file_lock guards the current segment; _compact_lock lets one compaction (or history read) run at a time
+        self._file_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        with self._compact_lock:
+            self._recover()
+        segments = self._segments()
+        self._sequence = segments[-1][0] + 1 if segments else self._state()['merged_through'] + 1
+        self._file = None
+        self._open_segment()
+        self.written_count = 0
+        self.batch_count = 0
+
+        self._closed = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name='purchase-sink-writer', daemon=True)
+        self._writer.start()
+        self._compactor = None
+        if compact_interval_s:
+            self._compactor = threading.Thread(target=self._compact_periodically, args=(compact_interval_s,),
+                                               name='purchase-sink-compaction', daemon=True)
+            self._compactor.start()
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(sequence, path) of the segments not yet merged into the main CSV, oldest first"""
+        merged_through = self._state()['merged_through']
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                sequence = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+                if sequence.isdigit() and int(sequence) > merged_through:
+                    segments.append((int(sequence), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'merged_through': 0, 'pending': None}
+
+    def _write_state(self, state: Dict[str, Any]):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, _segment_name(self._sequence))
+        self._file = open(path, 'a', newline='')
+        self._segment_writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore',
+                                              restval='', lineterminator='\n')
+        self._segment_writer.writeheader()
+        self._file.flush()
+        _fsync_directory(self.directory)
+
+    def append(self, record: Dict[str, Any]):
+        """Queue a purchase record for the writer thread"""
+        if self._closed.is_set():
+            raise RuntimeError("Purchase sink is closed")
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the records appended so far are written to the segment file
+
+        Returns:
+            True if they were written within the timeout
+        """
+        if not self._writer.is_alive():
+            return self._queue.empty()
+        written = threading.Event()
+        self._queue.put(written)
+        return written.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            items = [self._queue.get()]
+            # Take whatever else is already queued, so a burst of purchases is one write
+            while len(items) < self.batch_records:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [item for item in items if isinstance(item, dict)]
+            try:
+                if records:
+                    self._write_batch(records)
+            except Exception as e:
+                print(f"Error writing {len(records)} purchase records: {e}")
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is _STOP for item in items):
+                return
+
+    def _write_batch(self, records: List[Dict[str, Any]]):
+        with self._file_lock:
+            self._segment_writer.writerows(records)
+            self._file.flush()
+            self.written_count += len(records)
+            self.batch_count += 1
+            if self._file.tell() >= self.rotate_bytes:
+                self._rotate_locked()
+
+    def _rotate_locked(self):
+        self._file.close()
+        self._sequence += 1
+        self._open_segment()
+
+    def rotate(self) -> int:
+        """
+        Start a new segment, so the current one can be compacted
+
+        Returns:
+            Sequence number of the last finished segment
+        """
+        with self._file_lock:
+            self._rotate_locked()
+            return self._sequence - 1
+
+    def _recover(self):
+        """Roll back a merge interrupted by a crash (it is redone by the next compaction)"""
+        state = self._state()
+        pending = state.get('pending')
+        if pending is not None and os.path.exists(self.csv_path):
+            print(f"Rolling back an interrupted merge into {self.csv_path}")
+            with open(self.csv_path, 'r+b') as f:
+                f.truncate(pending['offset'])
+                os.fsync(f.fileno())
+        if pending is not None:
+            self._write_state({'merged_through': state['merged_through'], 'pending': None})
+
+    def _add_columns(self, header: List[str]) -> List[str]:
+        """Rewrite the main CSV once with the sink's columns it lacks (existing rows get empty values)"""
+        full_header = header + [column for column in self.columns if column not in header]
+        temp_path = f"{self.csv_path}.tmp"
+        with open(self.csv_path, newline='') as source, open(temp_path, 'w', newline='') as target:
+            reader = csv.reader(source)
+            next(reader)
+            writer = csv.writer(target, lineterminator='\n')
+            writer.writerow(full_header)
+            padding = [''] * (len(full_header) - len(header))
+            for row in reader:
+                writer.writerow(row + padding)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temp_path, self.csv_path)
+        print(f"Added columns {full_header[len(header):]} to {self.csv_path}")
+        return full_header
+
+    def compact(self) -> int:
+        """
+        Append the finished segments to the main CSV and delete them
+
+        Returns:
+            Number of records merged
+        """
+        self.flush()
+        with self._compact_lock:
+            through = self.rotate()
+            segments = [(sequence, path) for sequence, path in self._segments() if sequence <= through]
+            if not segments:
+                return 0
+
+            header = _read_header(self.csv_path)
+            if header is None:
+                with open(self.csv_path, 'w', newline='') as f:
+                    csv.writer(f, lineterminator='\n').writerow(self.columns)
+                header = list(self.columns)
+            elif not set(self.columns) <= set(header):
+                header = self._add_columns(header)
+
+            state = self._state()
+            with open(self.csv_path, 'rb') as f:
+                offset = f.seek(0, os.SEEK_END)
+            self._write_state({'merged_through': state['merged_through'],
+                               'pending': {'offset': offset, 'through': through}})
+            merged = 0
+            with open(self.csv_path, 'a', newline='') as f:
+                if offset and not self._ends_with_newline(offset):
+                    f.write('\n')
+                writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore', restval='', lineterminator='\n')
+                for _, path in segments:
+                    rows = list(csv.DictReader(io.StringIO(_complete_text(path))))
+                    writer.writerows(rows)
+                    merged += len(rows)
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_state({'merged_through': through, 'pending': None})
+
+            for _, path in segments:
+                os.remove(path)
+            _fsync_directory(self.directory)
+        print(f"Compacted {merged} purchase records from {len(segments)} segments into {self.csv_path}")
+        return merged
+
+    def _ends_with_newline(self, offset: int) -> bool:
+        with open(self.csv_path, 'rb') as f:
+            f.seek(offset - 1)
+            return f.read(1) in (b'\n', b'\r')
+
+    def _compact_periodically(self, interval_s: float):
+        while not self._closed.wait(interval_s):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting purchase segments: {e}")
+
+    def read_history(self) -> pd.DataFrame:
+        """All purchase records: the main CSV followed by the segments not merged into it yet"""
+        self.flush()
+        with self._compact_lock:
+            frames = []
+            if _read_header(self.csv_path) is not None:
+                frames.append(pd.read_csv(self.csv_path))
+            with self._file_lock:
+                texts = [_complete_text(path) for _, path in self._segments()]
+            frames.extend(pd.read_csv(io.StringIO(text)) for text in texts if text.count('\n') > 1)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def iter_history(self, columns: List[str], chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        The purchase records in the same order as read_history(), chunk_rows rows at a time
+
+        Args:
+            columns: Columns to read (those missing from the files are left out of the chunks)
+            chunk_rows: Rows per chunk
+        """
+        self.flush()
+        wanted = set(columns)
+        with self._compact_lock:
+            sources = [self.csv_path] if _read_header(self.csv_path) is not None else []
+            with self._file_lock:
+                texts = [_complete_text(path) for _, path in self._segments()]
+            sources.extend(io.StringIO(text) for text in texts if text.count('\n') > 1)
+            for source in sources:
+                yield from pd.read_csv(source, usecols=lambda column: column in wanted, chunksize=chunk_rows)
+
+    def close(self):
+        """Write the queued records, stop the threads and close the current segment"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        # Stop the compactor first: it waits for the writer
+        if self._compactor is not None:
+            self._compactor.join()
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._file_lock:
+            self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
@@ -0,0 +1,115 @@
+import os
+import numpy as np
+from typing import List, Dict, Any, Optional
+
+from columnar_store import ColumnarStore, Postings, RecordView, load_postings, save_postings
+
+
+def user_key(user_id) -> Optional[str]:
+    """Key of a user in the per-user index (IDs read from CSV as numbers match the same ID sent as text)"""
+    if user_id is None or (isinstance(user_id, float) and np.isnan(user_id)):
+        return None
+    if isinstance(user_id, (float, np.floating)) and float(user_id).is_integer():
+        user_id = int(user_id)
+    return str(user_id)
+
+
+class PurchaseStore:
+    """
+    Purchase events, kept apart from the product catalog
+
+    Records are stored in arrival (time) order in their own columnar store, with a hash
+    index on purchase ID and the positions of each user's purchases, so reading a
+    user's history touches only that user's records.
+    """
+
+    def __init__(self):
+        self.store = ColumnarStore()
+        self.ids = []
+        self._id_index = {}
+        self._user_index = {}
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def records(self) -> RecordView:
+        """All purchases, oldest first"""
+        return RecordView(self.store)
+
+    def next_id(self) -> str:
+        """An unused ID for the next purchase (purchase_<n>)"""
+        number = len(self.ids)
+        while f"purchase_{number}" in self._id_index:
+            number += 1
+        return f"purchase_{number}"
+
+    def append(self, record_id: str, record: Dict[str, Any]) -> int:
+        """
+        Add a purchase after the existing ones
+
+        Returns:
+            Position of the purchase
+        """
+        row = self.store.append(record)
+        self.ids.append(record_id)
+        self._id_index[record_id] = row
+        key = user_key(record.get('user_id'))
+        if key is not None:
+            self._user_index.setdefault(key, Postings()).append(row)
+        return row
+
+    def get_by_id(self, record_id: str) -> Optional[Dict[str, Any]]:
+        row = self._id_index.get(record_id)
+        return self.store.get_record(row) if row is not None else None
+
+    def user_purchase_count(self, user_id) -> int:
+        postings = self._user_index.get(user_key(user_id))
+        return len(postings) if postings is not None else 0
+
+    def get_user_purchases(self, user_id, limit: Optional[int] = None, newest_first: bool = True) -> List[Dict[str, Any]]:
+        """
+        Purchases of one user
+
+        Args:
+            user_id: ID of the user
+            limit: Maximum number of purchases to return (None for all)
+            newest_first: Return the latest purchases first
+
+        Returns:
+            List of purchase records, each with its 'purchase_id'
+        """
+        postings = self._user_index.get(user_key(user_id))
+        if postings is None:
+            return []
+        rows = postings.rows()
+        if newest_first:
+            rows = rows[::-1]
+        if limit is not None:
+            rows = rows[:limit]
+        return [dict(self.store.get_record(row), purchase_id=self.ids[row]) for row in rows.tolist()]
+
+    def save(self, directory: str) -> Dict[str, Any]:
+        """
+        Write the purchases and the per-user index to a new directory
+
+        Returns:
+            Manifest entry for load()
+        """
+        os.makedirs(directory)
+        return {
+            'count': len(self.store),
+            'ids': self.ids,
+            'columns': self.store.save(directory),
+            'user_index': save_postings(directory, 'user_index', self._user_index),
+        }
+
+    @classmethod
+    def load(cls, directory: str, entry: Dict[str, Any]) -> 'PurchaseStore':
+        """Open purchases written by save(), memory-mapping their files"""
+        purchases = cls()
+        purchases.store = ColumnarStore.load(directory, entry['columns'], entry['count'])
+        purchases.ids = list(entry['ids'])
+        purchases._id_index = {record_id: row for row, record_id in enumerate(purchases.ids)}
+        purchases._user_index = load_postings(directory, entry['user_index'])
+        return purchases
@@ -0,0 +1,388 @@
+import os
+import csv
+import json
+import queue
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Connections kept open per database
+POOL_SIZE = 4
+
+# Milliseconds a connection waits for another writer before failing with "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# Purchase rows inserted per transaction when migrating the CSV history
+MIGRATION_BATCH_ROWS = 10_000
+
+# Storage used for purchases and streaks when STORAGE_BACKEND isn't set ('files' or 'sqlite')
+DEFAULT_BACKEND = 'files'
+
+# Purchase fields stored in their own columns (anything else goes to the JSON 'extra' column)
+PURCHASE_FIELDS = ['purchase_id', 'user_id', 'product_id', 'date', 'category_code', 'brand', 'price', 'cf_score',
+                   'cf_category', 'choice']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchases (
+    id INTEGER PRIMARY KEY,
+    purchase_id TEXT,
+    user_id TEXT,
+    product_id TEXT,
+    date TEXT,
+    category_code TEXT,
+    brand TEXT,
+    price REAL,
+    cf_score REAL,
+    cf_category TEXT,
+    choice TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS purchases_user_date ON purchases (user_id, date, id);
+CREATE TABLE IF NOT EXISTS streaks (
+    user_id TEXT PRIMARY KEY,
+    streak INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Statements are module constants, so each pooled connection prepares them once (sqlite3 caches them per connection)
+INSERT_PURCHASE = ("INSERT INTO purchases (purchase_id, user_id, product_id, date, category_code, brand, price, "
+                   "cf_score, cf_category, choice, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+SELECT_USER_PURCHASES = "SELECT * FROM purchases WHERE user_id = ? ORDER BY date DESC, id DESC LIMIT ?"
+SELECT_USER_PURCHASES_OLDEST_FIRST = "SELECT * FROM purchases WHERE user_id = ? ORDER BY date, id LIMIT ?"
+SELECT_USER_LAST_PURCHASES = ("SELECT product_id, date, cf_score, choice FROM purchases WHERE user_id = ? "
+                              "ORDER BY date DESC, id DESC LIMIT ?")
+COUNT_USER_PURCHASES = "SELECT COUNT(*) FROM purchases WHERE user_id = ?"
+# Purchases without a date count only when the window is unbounded on both sides
+SELECT_USER_CF_TOTAL = ("SELECT TOTAL(cf_score), COUNT(*) FROM purchases WHERE user_id = ? "
+                        "AND (date >= ? OR ? IS NULL AND ? IS NULL) AND (? IS NULL OR date <= ?)")
+SELECT_STREAK = "SELECT streak FROM streaks WHERE user_id = ?"
+UPSERT_STREAK = ("INSERT INTO streaks (user_id, streak, updated_at) VALUES (?, ?, ?) "
+                 "ON CONFLICT (user_id) DO UPDATE SET streak = excluded.streak, updated_at = excluded.updated_at")
+EXTEND_STREAK = ("INSERT INTO streaks (user_id, streak, updated_at) VALUES (?, 1, ?) "
+                 "ON CONFLICT (user_id) DO UPDATE SET streak = streak + 1, updated_at = excluded.updated_at")
+
+
+def _text(value) -> Optional[str]:
+    if value is None or (isinstance(value, float) and value != value) or value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # User IDs read from CSV as numbers match the same ID sent as text
+        value = int(value)
+    return str(value)
+
+
+def _number(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number
+
+
+def _purchase_row(record: Dict[str, Any]) -> tuple:
+    """Values for INSERT_PURCHASE (the date falls back to the day of event_time)"""
+    date = _text(record.get('date')) or (_text(record.get('event_time')) or '')[:10] or None
+    extra = {key: value for key, value in record.items() if key not in PURCHASE_FIELDS and key != 'date'
+             and _text(value) is not None}
+    return (_text(record.get('purchase_id')), _text(record.get('user_id')), _text(record.get('product_id')), date,
+            _text(record.get('category_code')), _text(record.get('brand')), _number(record.get('price')),
+            _number(record.get('cf_score')), _text(record.get('cf_category')), _text(record.get('choice')),
+            json.dumps(extra, default=str) if extra else None)
+
+
+def _record(row: sqlite3.Row) -> Dict[str, Any]:
+    record = {key: row[key] for key in PURCHASE_FIELDS if row[key] is not None}
+    if row['extra']:
+        record.update(json.loads(row['extra']))
+    return record
+
+
+class SQLiteDatabase:
+    """
+    Purchases and streaks in an embedded SQLite database
+
+    The database runs in WAL mode, so readers don't block the writer (and the other
+    way round), and purchases are indexed by (user_id, date) so a user's history is
+    an index range scan. Connections come from a small pool and are shared between
+    threads one request at a time.
+    """
+
+    def __init__(self, path: str, pool_size: int = POOL_SIZE):
+        """
+        Open (or create) the database
+
+        Args:
+            path: Database file
+            pool_size: Connections kept open
+        """
+        self.path = path
+        self._closed = False
+        self._pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are started explicitly with BEGIN IMMEDIATE
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                     timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=64)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection"""
+        if self._closed:
+            raise RuntimeError(f"Database {self.path} is closed")
+        connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection inside a write transaction, committed when the block ends"""
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.connection() as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row is not None else None
+
+    def migrate_from_files(self, purchases_csv: Optional[str] = None, streaks_json: Optional[str] = None,
+                           streaks_txt: Optional[str] = None) -> bool:
+        """
+        Import the flat-file state once (later calls do nothing)
+
+        Args:
+            purchases_csv: Purchase history CSV (e.g. datasets/df_2.csv)
+            streaks_json: JSON file mapping user IDs to streaks
+            streaks_txt: "user_id,streak" lines, used for users missing from the JSON file
+
+        Returns:
+            True if the files were imported by this call
+        """
+        with self.transaction() as connection:
+            if connection.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_files'").fetchone():
+                return False
+
+            purchase_count = 0
+            if purchases_csv and os.path.exists(purchases_csv):
+                with open(purchases_csv, newline='') as f:
+                    batch = []
+                    for record in csv.DictReader(f):
+                        batch.append(_purchase_row(record))
+                        if len(batch) == MIGRATION_BATCH_ROWS:
+                            connection.executemany(INSERT_PURCHASE, batch)
+                            purchase_count += len(batch)
+                            batch = []
+                    connection.executemany(INSERT_PURCHASE, batch)
+                    purchase_count += len(batch)
+
+            streaks = {}
+            if streaks_txt and os.path.exists(streaks_txt):
+                with open(streaks_txt) as f:
+                    for line in f:
+                        user_id, _, streak = line.strip().partition(',')
+                        if user_id and streak.strip().lstrip('-').isdigit():
+                            streaks[user_id] = int(streak)
+            if streaks_json and os.path.exists(streaks_json):
+                with open(streaks_json) as f:
+                    streaks.update({str(user_id): int(streak) for user_id, streak in json.load(f).items()})
+            now = datetime.now().isoformat()
+            connection.executemany(UPSERT_STREAK, [(user_id, streak, now) for user_id, streak in streaks.items()])
+
+            connection.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_files', ?)", (now,))
+        print(f"Migrated {purchase_count} purchases and {len(streaks)} streaks into {self.path}")
+        return True
+
+    def close(self):
+        """Close the pooled connections (the purchase and streak views share them, so either may call this)"""
+        self._closed = True
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+class SQLitePurchases:
+    """Purchase history in SQLite, with the same append() / read_history() / close() as PurchaseSink"""
+
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Store a purchase record
+
+        Returns:
+            Row ID of the purchase
+        """
+        with self.database.connection() as connection:
+            return connection.execute(INSERT_PURCHASE, _purchase_row(record)).lastrowid
+
+    def get_user_purchases(self, user_id, limit: Optional[int] = None, newest_first: bool = True) -> List[Dict[str, Any]]:
+        """
+        Purchases of one user, read through the (user_id, date) index
+
+        Args:
+            user_id: ID of the user
+            limit: Maximum number of purchases to return (None for all)
+            newest_first: Return the latest purchases first
+        """
+        statement = SELECT_USER_PURCHASES if newest_first else SELECT_USER_PURCHASES_OLDEST_FIRST
+        with self.database.connection() as connection:
+            rows = connection.execute(statement, (_text(user_id), -1 if limit is None else limit)).fetchall()
+        return [_record(row) for row in rows]
+
+    def purchase_count_of(self, user_id) -> int:
+        with self.database.connection() as connection:
+            return connection.execute(COUNT_USER_PURCHASES, (_text(user_id),)).fetchone()[0]
+
+    def last_purchases(self, user_id, limit: int = 10) -> List[Dict[str, Any]]:
+        """The user's latest purchases, newest first (product_id, date, cf_score and choice of each)"""
+        if limit <= 0:
+            return []
+        with self.database.connection() as connection:
+            rows = connection.execute(SELECT_USER_LAST_PURCHASES, (_text(user_id), limit)).fetchall()
+        return [{key: row[key] for key in row.keys() if row[key] is not None} for row in rows]
+
+    def cf_total(self, user_id, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sum of the CF scores of the user's purchases in a date window (see UserHistoryIndex.cf_total)
+
+        Args:
+            user_id: ID of the user
+            start: First day of the window (YYYY-MM-DD, None for no lower bound)
+            end: Last day of the window, inclusive (YYYY-MM-DD, None for no upper bound)
+        """
+        # Without a start, '' is below every stored date
+        low = start or ''
+        with self.database.connection() as connection:
+            total, count = connection.execute(SELECT_USER_CF_TOTAL,
+                                              (_text(user_id), low, start, end, end, end)).fetchone()
+        return {'total': round(total, 2), 'count': count, 'average': round(total / count, 2) if count else None}
+
+    def read_history(self):
+        """All purchase records as a DataFrame, oldest first"""
+        # pandas is only needed here, so the streak and per-user paths don't load it
+        import pandas as pd
+        with self.database.connection() as connection:
+            rows = connection.execute("SELECT * FROM purchases ORDER BY id").fetchall()
+        return pd.DataFrame([_record(row) for row in rows])
+
+    def close(self):
+        self.database.close()
+
+
+class SQLiteStreaks:
+    """Streaks in SQLite, with the same get() / record_choice() / set() / flush() / close() as StreakService"""
+
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    def get(self, user_id: str) -> int:
+        """Current streak of a user (0 if unknown)"""
+        with self.database.connection() as connection:
+            row = connection.execute(SELECT_STREAK, (user_id,)).fetchone()
+        return row['streak'] if row is not None else 0
+
+    def record_choice(self, user_id: str, sustainable: bool) -> int:
+        """
+        Extend the user's streak after a sustainable choice, or reset it after any other
+
+        Returns:
+            The new streak
+        """
+        now = datetime.now().isoformat()
+        with self.database.transaction() as connection:
+            if sustainable:
+                connection.execute(EXTEND_STREAK, (user_id, now))
+                return connection.execute(SELECT_STREAK, (user_id,)).fetchone()['streak']
+            connection.execute(UPSERT_STREAK, (user_id, 0, now))
+            return 0
+
+    def set(self, user_id: str, streak: int):
+        """Overwrite a user's streak"""
+        with self.database.connection() as connection:
+            connection.execute(UPSERT_STREAK, (user_id, streak, datetime.now().isoformat()))
+
+    def flush(self) -> bool:
+        # Every update is committed as it happens
+        return False
+
+    def close(self):
+        self.database.close()
+
+
+def _open_database(base_dir: str) -> SQLiteDatabase:
+    """Open the SQLite database, importing the flat files the first time"""
+    database = SQLiteDatabase(os.getenv('SQLITE_PATH', os.path.join(base_dir, 'ecosmart.db')))
+    if database.get_meta('migrated_from_files') is None:
+        csv_path = os.path.join(base_dir, 'datasets', 'df_2.csv')
+        if os.path.isdir(f"{csv_path}.segments"):
+            # Merge the purchases a PurchaseSink hadn't folded into the CSV yet
+            from purchase_sink import PurchaseSink
+            sink = PurchaseSink(csv_path, [field for field in PURCHASE_FIELDS if field != 'purchase_id'],
+                                compact_interval_s=0)
+            sink.compact()
+            sink.close()
+        database.migrate_from_files(csv_path, os.path.join(base_dir, 'user_streaks.json'),
+                                    os.path.join(base_dir, 'user_streaks.txt'))
+    return database
+
+
+def _backend(backend: Optional[str]) -> str:
+    backend = backend or os.getenv('STORAGE_BACKEND', DEFAULT_BACKEND)
+    if backend not in ('files', 'sqlite'):
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return backend
+
+
+def open_storage(base_dir: str, purchase_columns: List[str], backend: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    Open the purchase history and streak storage
+
+    Both backends offer the same interface: append() / read_history() / close() for
+    purchases and get() / record_choice() / set() / flush() / close() for streaks.
+    The first time the SQLite backend is opened it imports datasets/df_2.csv (after
+    merging any unmerged sink segments), user_streaks.json and user_streaks.txt.
+
+    Args:
+        base_dir: Directory holding user_streaks.json, user_streaks.txt and datasets/df_2.csv
+        purchase_columns: Columns of the purchase CSV (files backend)
+        backend: 'files' or 'sqlite' (defaults to the STORAGE_BACKEND environment variable)
+
+    Returns:
+        Tuple of (purchases, streaks)
+    """
+    if _backend(backend) == 'files':
+        from purchase_sink import PurchaseSink
+        from streak_service import StreakService
+        return (PurchaseSink(os.path.join(base_dir, 'datasets', 'df_2.csv'), purchase_columns),
+                StreakService(os.path.join(base_dir, 'user_streaks.json')))
+    database = _open_database(base_dir)
+    return SQLitePurchases(database), SQLiteStreaks(database)
+
+
+def open_streaks(base_dir: str, backend: Optional[str] = None):
+    """Open only the streak storage (see open_storage)"""
+    if _backend(backend) == 'files':
+        from streak_service import StreakService
+        return StreakService(os.path.join(base_dir, 'user_streaks.json'))
+    return SQLiteStreaks(_open_database(base_dir))
@@ -0,0 +1,159 @@
+import os
+import json
+import threading
+from typing import Dict, Optional
+
+from purchase_log import _lock_exclusively
+
+# Seconds between write-behind flushes of changed streaks
+FLUSH_INTERVAL_S = 1.0
+
+# Changed users that trigger a flush before the interval is up
+FLUSH_DIRTY_USERS = 10_000
+
+# Locks shared by all users (a user's lock is picked by hashing the user ID)
+LOCK_STRIPES = 256
+
+
+class StreakService:
+    """
+    Sustainable purchase streaks held in memory, with write-behind persistence
+
+    Reads are dictionary lookups. Updates take the lock of the user's stripe, so two
+    requests for the same user can't lose an increment, while requests for different
+    users rarely wait on each other. Changed users are counted, and a background thread
+    rewrites the JSON file (temp file plus atomic rename) once flush_interval_s has
+    passed or flush_dirty_users users have changed, whichever comes first.
+
+    Updates made after the last flush are lost if the process dies. Only one process
+    may own a streak file, since it doesn't see changes others make to it: the service
+    holds an exclusive lock on json_path + '.lock' while it is open, and opening it again fails.
+    """
+
+    def __init__(self, json_path: str, flush_interval_s: float = FLUSH_INTERVAL_S,
+                 flush_dirty_users: int = FLUSH_DIRTY_USERS):
+        """
+        Load the streaks and start the flusher thread
+
+        Args:
+            json_path: JSON file mapping user IDs to streaks
+            flush_interval_s: Longest time a change stays only in memory (0 to flush only on close() / flush())
+            flush_dirty_users: Changed users that make the flusher write right away
+        """
+        self.json_path = json_path
+        self.flush_interval_s = flush_interval_s
+        self.flush_dirty_users = flush_dirty_users
+        self._lock_file = _lock_exclusively(f"{json_path}.lock", f"Streak file {json_path}")
+        self._streaks = self._load()
+        self._dirty = set()
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # _dirty_lock guards the set of changed users; _flush_lock lets one flush write the file at a time
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.flush_count = 0
+
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = None
+        if flush_interval_s:
+            self._flusher = threading.Thread(target=self._flush_periodically, name='streak-flusher', daemon=True)
+            self._flusher.start()
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            if os.path.exists(self.json_path):
+                with open(self.json_path, 'r') as f:
+                    return {str(user_id): int(streak) for user_id, streak in json.load(f).items()}
+        except Exception as e:
+            print(f"Error loading user streaks from {self.json_path}: {e}")
+        return {}
+
+    def __len__(self) -> int:
+        return len(self._streaks)
+
+    @property
+    def dirty_count(self) -> int:
+        """Users changed since the last flush"""
+        return len(self._dirty)
+
+    def get(self, user_id: str) -> int:
+        """Current streak of a user (0 if unknown)"""
+        return self._streaks.get(user_id, 0)
+
+    def record_choice(self, user_id: str, sustainable: bool) -> int:
+        """
+        Extend the user's streak after a sustainable choice, or reset it after any other
+
+        Returns:
+            The new streak
+        """
+        with self._locks[hash(user_id) % LOCK_STRIPES]:
+            streak = self._streaks.get(user_id, 0) + 1 if sustainable else 0
+            self._streaks[user_id] = streak
+        self._mark_dirty(user_id)
+        return streak
+
+    def set(self, user_id: str, streak: int):
+        """Overwrite a user's streak"""
+        with self._locks[hash(user_id) % LOCK_STRIPES]:
+            self._streaks[user_id] = streak
+        self._mark_dirty(user_id)
+
+    def _mark_dirty(self, user_id: str):
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+            if len(self._dirty) >= self.flush_dirty_users:
+                self._wake.set()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Copy of all streaks"""
+        return self._streaks.copy()
+
+    def flush(self) -> bool:
+        """
+        Write the streaks to the JSON file if any changed since the last flush
+
+        Returns:
+            True if the file was written
+        """
+        with self._flush_lock:
+            with self._dirty_lock:
+                if not self._dirty:
+                    return False
+                dirty, self._dirty = self._dirty, set()
+                # dict.copy() runs without releasing the GIL, so the copy is consistent
+                streaks = self._streaks.copy()
+            temp_path = f"{self.json_path}.tmp"
+            try:
+                # Ensure the file is written atomically to prevent corruption
+                with open(temp_path, 'w') as f:
+                    json.dump(streaks, f)
+                os.replace(temp_path, self.json_path)
+            except Exception:
+                # Keep the users dirty so the next flush retries them
+                with self._dirty_lock:
+                    self._dirty |= dirty
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self.flush_count += 1
+            return True
+
+    def _flush_periodically(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error saving user streaks to {self.json_path}: {e}")
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the flusher and write the remaining changes"""
+        self._closed.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout)
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
@@ -0,0 +1,46 @@
+"""Benchmark CF scoring throughput. Run from the repository root: python -m testing.benchmark_cf_scoring [sizes...]"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from carbon_footprint_calculator import CarbonFootprintCalculator
+
+from testing.test_cf_vectorized import make_products
+
+def make_categorical_products(n):
+    """Same data as make_products, stored as categoricals so 10M rows fit in memory"""
+    sample = make_products(10_000)
+    rng = np.random.default_rng(1)
+    columns = {}
+    for column in sample.columns:
+        values = pd.Categorical(sample[column]).categories
+        columns[column] = pd.Categorical.from_codes(rng.integers(0, len(values), n), values)
+    return pd.DataFrame(columns)
+
+def benchmark(sizes, row_limit=100_000):
+    """Compare row-by-row and vectorized CF scoring throughput"""
+    calculator = CarbonFootprintCalculator()
+    
+    for n in sizes:
+        df = make_products(n) if n <= row_limit else make_categorical_products(n)
+        
+        start = time.perf_counter()
+        vectorized = calculator.classify_cf_scores(calculator.calculate_cf_scores(df))
+        vectorized_time = time.perf_counter() - start
+        
+        line = f"{n:>12,} rows | vectorized: {n / vectorized_time:>14,.0f} rows/sec"
+        
+        # The per-row path is far too slow to run on the largest sizes
+        if n <= row_limit:
+            start = time.perf_counter()
+            row_scores = df.apply(calculator.calculate_cf_score, axis=1)
+            row_scores.apply(calculator.classify_cf_score)
+            row_time = time.perf_counter() - start
+            line += f" | row apply: {n / row_time:>12,.0f} rows/sec | speedup: {row_time / vectorized_time:.0f}x"
+        
+        print(line)
+        del df, vectorized
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 10_000_000]
+    benchmark(sizes)
@@ -0,0 +1,31 @@
+"""Benchmark parallel CF scoring scaling. Run from the repository root: python -m testing.benchmark_parallel_scoring [rows]"""
+import os
+import sys
+import tempfile
+import pandas as pd
+from carbon_footprint_calculator import CarbonFootprintCalculator
+
+def benchmark(rows):
+    """Score the same CSV with 1..N worker processes and report rows/sec and speedup"""
+    calculator = CarbonFootprintCalculator()
+    source = pd.read_csv(os.path.join('datasets', 'data.csv'))
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'products.csv')
+        repeats = rows // len(source)
+        pd.concat([source] * repeats, ignore_index=True).to_csv(csv_path, index=False)
+        print(f"Benchmark file: {repeats * len(source):,} rows, {os.path.getsize(csv_path) / 2**20:.0f} MB")
+        
+        cpu_count = os.cpu_count() or 1
+        worker_counts = sorted({1, 2, 4, 8, cpu_count} & set(range(1, cpu_count + 1)))
+        baseline = None
+        for workers in worker_counts:
+            summary = calculator.process_dataset_parallel(
+                csv_path, os.path.join(tmp_dir, 'scored.csv'), workers=workers,
+                partition_bytes=16 * 2**20)
+            baseline = baseline or summary['rows_per_sec']
+            print(f"workers={workers:<3} {summary['rows_per_sec']:>12,.0f} rows/sec  "
+                  f"speedup: {summary['rows_per_sec'] / baseline:.2f}x")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000)
@@ -0,0 +1,66 @@
+"""Benchmark product store memory per record. Run from the repository root: python -m testing.benchmark_product_store [rows]"""
+import sys
+import gc
+import tracemalloc
+import numpy as np
+import pandas as pd
+from chroma_db_integration import ChromaDBManager, _normalize_brand
+
+from testing.test_cf_vectorized import make_products
+
+def make_catalog(n, seed=0):
+    """Processed-dataset-like rows: unique events, repeated products and users, low-cardinality attributes"""
+    rng = np.random.default_rng(seed)
+    df = make_products(n, seed)
+    df.insert(0, 'event_time', (pd.Timestamp('2020-04-24') + pd.to_timedelta(np.arange(n), unit='s')).astype(str))
+    df.insert(1, 'order_id', 2294359932054536986 + np.arange(n, dtype=np.int64))
+    df.insert(2, 'product_id', rng.integers(1_515_966_223_509_088_000, 1_515_966_223_509_188_000, n))
+    df.insert(5, 'price', rng.uniform(0.5, 2000, n).round(2))
+    df.insert(6, 'user_id', rng.integers(1_515_915_625_441_993_984, 1_515_915_625_442_993_984, n))
+    df['cf_score'] = rng.uniform(0, 100, n).round(1)
+    df['cf_category'] = pd.cut(df['cf_score'], bins=[-1, 40, 70, 101], labels=['Low CF', 'Medium CF', 'High CF']).astype(str)
+    return df
+
+def build_list_of_dicts(df):
+    """The previous layout: a dict per record, ID list and map, 10-float embedding lists and list-based indexes"""
+    records = df.to_dict(orient='records')
+    ids = [f"product_{i}" for i in range(len(records))]
+    id_index = {record_id: i for i, record_id in enumerate(ids)}
+    embeddings = [[0.0] * 10 for _ in range(len(records))]
+    brand_index, cf_category_index, category_pairs = {}, {}, {}
+    for row, record in enumerate(records):
+        brand_index.setdefault(_normalize_brand(record.get('brand', '')), []).append(row)
+        cf_category_index.setdefault(record.get('cf_category', ''), []).append(row)
+        category_pairs.setdefault(record['category_code'], []).append((record['cf_score'], row))
+    category_index = {}
+    for category, pairs in category_pairs.items():
+        pairs.sort(key=lambda pair: pair[0])
+        category_index[category] = ([score for score, _ in pairs], [row for _, row in pairs])
+    return records, ids, id_index, embeddings, brand_index, cf_category_index, category_index
+
+def build_columnar(df):
+    """The columnar store with its array-backed indexes"""
+    manager = ChromaDBManager()
+    manager.load_dataframe(df)
+    return manager
+
+def measure(build, df):
+    """Bytes allocated (and kept) by build(df)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build(df)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return current, peak
+
+def benchmark(rows):
+    df = make_catalog(rows)
+    print(f"{rows:,} records, {len(df.columns)} fields")
+    for name, build in [('list of dicts', build_list_of_dicts), ('columnar store', build_columnar)]:
+        current, peak = measure(build, df)
+        print(f"{name:<15} {current / rows:>8,.0f} bytes/record retained | peak while building: {peak / rows:>8,.0f} bytes/record")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,39 @@
+"""Benchmark purchase log throughput per fsync policy. Run from the repository root: python -m testing.benchmark_purchase_log [records]"""
+import sys
+import time
+import tempfile
+import threading
+from purchase_log import PurchaseLog
+
+POLICIES = [
+    ('fsync every record', 1, 0),
+    ('fsync every 64 records or 100 ms', 64, 100),
+    ('fsync every 100 ms', 0, 100),
+]
+
+def benchmark(records, writers=(1, 8)):
+    """Append purchase-sized records from several threads and report appends/sec and fsyncs"""
+    purchase = {'user_id': 'user_1', 'product_id': 'product_1', 'date': '2024-01-01', 'category_code': 'electronics.smartphone',
+                'brand': 'samsung', 'price': 499.99, 'cf_score': 42.5, 'cf_category': 'Medium CF', 'choice': 'ai_suggested'}
+    for name, every, interval_ms in POLICIES:
+        for threads in writers:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                log = PurchaseLog(tmp_dir, fsync_every_records=every, fsync_interval_ms=interval_ms)
+                
+                def write(count):
+                    for i in range(count):
+                        log.commit(log.append(f"purchase_{i}", purchase))
+                
+                start = time.perf_counter()
+                workers = [threading.Thread(target=write, args=(records // threads,)) for _ in range(threads)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+                fsyncs = log.fsync_count
+                log.close()
+                print(f"{name:<34} | {threads} writers | {records / elapsed:>10,.0f} appends/sec | {fsyncs:>6,} fsyncs")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,36 @@
+"""Benchmark similarity search recall and speed. Run from the repository root: python -m testing.benchmark_similarity_search [rows]"""
+import sys
+import time
+import numpy as np
+from columnar_store import ColumnarStore
+from product_embeddings import IVFIndex, embed_store, top_k
+
+from testing.benchmark_product_store import make_catalog
+
+def benchmark(rows, queries=500, k=10):
+    """Recall@k of the IVF index against exact batched search, for several probe counts"""
+    start = time.perf_counter()
+    matrix = embed_store(ColumnarStore.from_dataframe(make_catalog(rows)))
+    print(f"{rows:,} records embedded in {time.perf_counter() - start:.1f}s ({matrix.nbytes / rows:.0f} bytes/record)")
+
+    query_rows = np.random.default_rng(0).choice(rows, queries, replace=False)
+    start = time.perf_counter()
+    exact_rows, exact_scores = top_k(matrix, matrix[query_rows], k)
+    exact_time = time.perf_counter() - start
+    print(f"exact top-{k}: {queries / exact_time:>10,.0f} queries/sec (batched)")
+
+    start = time.perf_counter()
+    index = IVFIndex.build(matrix)
+    print(f"IVF index with {len(index.centroids)} buckets built in {time.perf_counter() - start:.1f}s")
+
+    # Many products share identical vectors, so count a hit when a result scores at least the exact k-th score
+    threshold = exact_scores[:, -1:] - 1e-6
+    for n_probe in [1, 2, 4, 8, 16, 32]:
+        start = time.perf_counter()
+        found = [index.search(matrix, matrix[row], k, n_probe=n_probe)[1] for row in query_rows]
+        ivf_time = time.perf_counter() - start
+        recall = np.mean([np.sum(scores >= threshold[i]) / k for i, scores in enumerate(found)])
+        print(f"IVF n_probe={n_probe:<3} recall@{k}: {recall:.3f} | {queries / ivf_time:>8,.0f} queries/sec")
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,34 @@
+"""Benchmark cold start from CSV vs snapshot. Run from the repository root: python -m testing.benchmark_snapshot_startup [rows]"""
+import os
+import sys
+import time
+import tempfile
+from chroma_db_integration import ChromaDBManager
+
+from testing.benchmark_product_store import make_catalog
+
+def benchmark(sizes):
+    """Time importing a scored CSV against loading the snapshot saved from it"""
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'products.csv')
+            make_catalog(rows).to_csv(csv_path, index=False)
+            
+            start = time.perf_counter()
+            ChromaDBManager(persistence_path=tmp_dir).load_or_build(csv_path, process_with_cf_calculator=False)
+            build_time = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            manager = ChromaDBManager(persistence_path=tmp_dir)
+            assert manager.load_or_build(csv_path, process_with_cf_calculator=False)
+            load_time = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            manager.get_similar_alternatives('product_0')
+            first_query_time = time.perf_counter() - start
+            
+            print(f"{rows:>10,} records | CSV import + snapshot: {build_time:7.2f}s | "
+                  f"snapshot load: {load_time * 1000:7.1f} ms | first query: {first_query_time * 1000:6.1f} ms")
+
+if __name__ == "__main__":
+    benchmark([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,48 @@
+"""Benchmark streak reads and updates against the JSON file rewrite. Run from the repository root: python -m testing.benchmark_streak_service [users]"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+from streak_service import StreakService
+
+def benchmark(users, operations=100_000):
+    """Time streak reads, updates and one write-behind flush with the given number of users"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, 'user_streaks.json')
+        with open(json_path, 'w') as f:
+            json.dump({f"user_{i}": i % 20 for i in range(users)}, f)
+        
+        start = time.perf_counter()
+        service = StreakService(json_path, flush_interval_s=0)
+        print(f"load {users:,} users:           {time.perf_counter() - start:8.3f} s")
+        
+        user_ids = [f"user_{random.randrange(users)}" for _ in range(operations)]
+        start = time.perf_counter()
+        for user_id in user_ids:
+            service.get(user_id)
+        print(f"read:                      {(time.perf_counter() - start) / operations * 1e6:8.2f} us/op")
+        
+        start = time.perf_counter()
+        for i, user_id in enumerate(user_ids):
+            service.record_choice(user_id, i % 7 != 0)
+        print(f"update:                    {(time.perf_counter() - start) / operations * 1e6:8.2f} us/op")
+        
+        start = time.perf_counter()
+        service.flush()
+        print(f"flush (background):        {time.perf_counter() - start:8.3f} s")
+        
+        # What every update used to cost: read, change and rewrite the whole file
+        start = time.perf_counter()
+        for user_id in user_ids[:3]:
+            with open(json_path) as f:
+                streaks = json.load(f)
+            streaks[user_id] = streaks.get(user_id, 0) + 1
+            with open(json_path, 'w') as f:
+                json.dump(streaks, f)
+        print(f"update by file rewrite:    {(time.perf_counter() - start) / 3 * 1e3:8.2f} ms/op")
+        service.close()
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
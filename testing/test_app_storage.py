@@ -0,0 +1,125 @@
+import csv
+import inspect
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from chroma_db_integration import ChromaDBManager
+from sqlite_store import SQLitePurchases, open_storage
+from user_history import open_user_history
+
+PRODUCT = {'category_code': 'electronics.smartphone', 'brand': 'apple', 'price': 999.0,
+           'packaging_material': 'cardboard', 'shipping_mode': 'air', 'usage_duration': '2 years',
+           'repairability_score': 4}
+
+def use_storage(monkeypatch, tmp_path, backend):
+    """Point the app at fresh storage and an empty catalog in tmp_path"""
+    (tmp_path / 'datasets').mkdir(exist_ok=True)
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'store.db'))
+    purchases, streaks = open_storage(str(tmp_path), app.PURCHASE_COLUMNS, backend=backend)
+    monkeypatch.setattr(app, 'purchase_backend', purchases)
+    monkeypatch.setattr(app, 'purchase_history', open_user_history(purchases))
+    monkeypatch.setattr(app, 'streak_service', streaks)
+    monkeypatch.setattr(app, 'db_manager', ChromaDBManager(persistence_path=str(tmp_path / 'db')))
+    return purchases, streaks
+
+def submit_choice(client):
+    response = client.post('/submit-purchase-choice', json={'user_id': 'u1', 'product_id': 'p1',
+                                                            'choice': 'ai_suggested'})
+    assert response.status_code == 200 and response.json()['streak'] == 1
+
+def test_storage_is_opened_at_startup_and_closed_at_shutdown(monkeypatch, tmp_path):
+    # Importing app opens nothing
+    assert app.purchase_backend is None and app.streak_service is None
+    monkeypatch.setenv('STORAGE_DIR', str(tmp_path))
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'store.db'))
+    monkeypatch.setattr(app, 'db_manager', ChromaDBManager(persistence_path=str(tmp_path / 'db')))
+    for name in ('purchase_backend', 'purchase_history', 'streak_service'):
+        monkeypatch.setattr(app, name, None)
+    with TestClient(app.app) as client:
+        assert isinstance(app.purchase_backend, SQLitePurchases)
+        submit_choice(client)
+    with pytest.raises(RuntimeError):
+        app.streak_service.get('u1')
+
+    reopened, reopened_streaks = open_storage(str(tmp_path), app.PURCHASE_COLUMNS, backend='sqlite')
+    assert [p['product_id'] for p in reopened.get_user_purchases('u1')] == ['p1']
+    reopened.close()
+
+def test_post_products_adds_to_the_catalog(monkeypatch, tmp_path):
+    purchases, streaks = use_storage(monkeypatch, tmp_path, 'files')
+    response = TestClient(app.app).post('/products', json=PRODUCT)
+    assert response.status_code == 200
+    product_id = response.json()['product_id']
+    assert app.db_manager.get_by_id(product_id)['brand'] == 'apple'
+    purchases.close()
+    streaks.close()
+
+def test_submitted_purchase_reaches_the_csv(monkeypatch, tmp_path):
+    purchases, streaks = use_storage(monkeypatch, tmp_path, 'files')
+    submit_choice(TestClient(app.app))
+    purchases.close()
+    streaks.close()
+
+    reopened, reopened_streaks = open_storage(str(tmp_path), app.PURCHASE_COLUMNS, backend='files')
+    reopened.compact()
+    with open(tmp_path / 'datasets' / 'df_2.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['user_id'], row['product_id'], row['choice']) for row in rows] == [('u1', 'p1', 'ai_suggested')]
+    assert reopened_streaks.get('u1') == 1
+    reopened.close()
+    reopened_streaks.close()
+
+def test_submitted_purchase_reaches_sqlite(monkeypatch, tmp_path):
+    purchases, _ = use_storage(monkeypatch, tmp_path, 'sqlite')
+    submit_choice(TestClient(app.app))
+    purchases.close()
+
+    reopened, reopened_streaks = open_storage(str(tmp_path), app.PURCHASE_COLUMNS, backend='sqlite')
+    history = reopened.get_user_purchases('u1')
+    assert [(p['product_id'], p['choice']) for p in history] == [('p1', 'ai_suggested')]
+    assert reopened_streaks.get('u1') == 1
+    reopened.close()
+
+def test_submitted_purchase_shows_in_user_history(monkeypatch, tmp_path):
+    purchases, streaks = use_storage(monkeypatch, tmp_path, 'sqlite')
+    client = TestClient(app.app)
+    assert client.get('/users/u1/history').json()['purchase_count'] == 0
+    submit_choice(client)
+
+    history = client.get('/users/u1/history').json()
+    assert history['purchase_count'] == 1 and [p['product_id'] for p in history['purchases']] == ['p1']
+    # The history reports the same streak as /user-streak
+    streaks.set('u1', 4)
+    assert client.get('/users/u1/history').json()['streak'] == client.get('/user-streak/u1').json()['streak'] == 4
+    purchases.close()
+
+def test_storage_handlers_run_off_the_event_loop():
+    # Handlers that write to storage block, so they must be plain functions FastAPI runs in its threadpool
+    for handler in (app.submit_purchase_choice, app.get_user_streak, app.update_streak, app.get_user_history):
+        assert not inspect.iscoroutinefunction(handler)
+
+def test_manager_forwards_purchases_to_its_backend(monkeypatch, tmp_path):
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'store.db'))
+    purchases, streaks = open_storage(str(tmp_path), app.PURCHASE_COLUMNS, backend='sqlite')
+    manager = ChromaDBManager(persistence_path=str(tmp_path / 'db'), purchase_backend=purchases)
+    purchase_id = manager.add_purchase_record({'user_id': 'u1', 'product_id': 'p1', 'date': '2025-01-01'})
+    manager.add_product(dict(PRODUCT, cf_score=50.0, cf_category='Medium CF'))
+
+    assert isinstance(purchases, SQLitePurchases)
+    assert [(p['purchase_id'], p['product_id']) for p in purchases.get_user_purchases('u1')] == [(purchase_id, 'p1')]
+    manager.close()
+    streaks.close()
+
+if __name__ == "__main__":
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for test in (test_storage_is_opened_at_startup_and_closed_at_shutdown, test_post_products_adds_to_the_catalog, test_submitted_purchase_reaches_the_csv,
+                     test_submitted_purchase_reaches_sqlite, test_submitted_purchase_shows_in_user_history,
+                     test_manager_forwards_purchases_to_its_backend):
+            with pytest.MonkeyPatch.context() as monkeypatch:
+                test(monkeypatch, pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    test_storage_handlers_run_off_the_event_loop()
+    print("All app storage tests passed")
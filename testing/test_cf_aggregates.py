@@ -0,0 +1,82 @@
+import numpy as np
+from chroma_db_integration import ChromaDBManager, _normalize_brand
+
+from testing.benchmark_product_store import make_catalog
+
+def reference_stats(records, field, normalize=lambda value: value):
+    """Statistics per key computed the way process_df2.py used to, with a pass over every record"""
+    stats = {}
+    for record in records:
+        key = record.get(field)
+        key = normalize(key) if isinstance(key, str) else None
+        if key is None:
+            continue
+        cf_score = record['cf_score']
+        entry = stats.setdefault(key, {'count': 0, 'sum': 0.0, 'min': cf_score, 'max': cf_score, 'histogram': [0] * 10})
+        entry['count'] += 1
+        entry['sum'] += cf_score
+        entry['min'] = min(entry['min'], cf_score)
+        entry['max'] = max(entry['max'], cf_score)
+        entry['histogram'][min(int(cf_score // 10), 9)] += 1
+    return stats
+
+def assert_stats_match(actual, expected):
+    assert {stats['key'] for stats in actual} == set(expected)
+    for stats in actual:
+        entry = expected[stats['key']]
+        assert stats['count'] == entry['count']
+        assert np.isclose(stats['sum'], entry['sum'])
+        assert np.isclose(stats['mean'], entry['sum'] / entry['count'])
+        assert (stats['min'], stats['max']) == (entry['min'], entry['max'])
+        assert stats['histogram'] == entry['histogram']
+
+def check_manager(manager):
+    records = list(manager.products_data)
+    brands = reference_stats(records, 'brand', lambda brand: _normalize_brand(brand) or None)
+    assert_stats_match([manager.get_brand_stats(brand.upper()) for brand in brands], brands)
+    category_stats = manager.get_category_stats()
+    assert_stats_match(category_stats['category_code'], reference_stats(records, 'category_code'))
+    assert_stats_match(category_stats['cf_category'], reference_stats(records, 'cf_category'))
+
+    means = sorted((entry['sum'] / entry['count'], brand) for brand, entry in brands.items() if entry['count'] >= 3)
+    leaders = manager.brand_leaderboard(5, min_products=3)
+    assert [stats['mean'] for stats in leaders] == [stats['mean'] for stats in sorted(leaders, key=lambda s: s['mean'])]
+    assert np.allclose([stats['mean'] for stats in leaders], [mean for mean, _ in means[:5]])
+    laggards = manager.brand_leaderboard(5, most_sustainable=False, min_products=3)
+    assert np.allclose([stats['mean'] for stats in laggards], [mean for mean, _ in means[::-1][:5]])
+
+def test_aggregates_match_a_full_scan(tmp_path):
+    """Bulk-built statistics, statistics updated by inserts and reloaded statistics all equal a rescan"""
+    csv_path = str(tmp_path / 'products.csv')
+    make_catalog(2000).to_csv(csv_path, index=False)
+    manager = ChromaDBManager(persistence_path=str(tmp_path / 'db'))
+    manager.load_or_build(csv_path, process_with_cf_calculator=False)
+    check_manager(manager)
+
+    first = manager.get_by_id('product_0')
+    new_ids = [manager.add_product(dict(first, brand='NewBrand', category_code='new.category', cf_score=5.0)),
+               manager.add_product(dict(first, cf_score=99.5, cf_category='High CF'))]
+    assert new_ids == ['product_2000', 'product_2001']
+    check_manager(manager)
+    assert manager.get_brand_stats('newbrand')['histogram'] == [1] + [0] * 9
+    # Purchases are not catalog products and leave the statistics alone
+    manager.add_purchase_record(dict(first, cf_score=50.0))
+    check_manager(manager)
+    manager.close()
+
+    restarted = ChromaDBManager(persistence_path=str(tmp_path / 'db'))
+    assert restarted.load_or_build(csv_path, process_with_cf_calculator=False) is True
+    assert restarted.get_by_id('product_2001')['cf_score'] == 99.5
+    check_manager(restarted)
+    restarted.compact()
+    restarted.add_product(dict(first, brand='newbrand', cf_score=15.0))
+    assert restarted.get_brand_stats('NewBrand')['count'] == 2
+    check_manager(restarted)
+    restarted.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_aggregates_match_a_full_scan(pathlib.Path(tmp_dir))
+    print("All CF aggregate tests passed")
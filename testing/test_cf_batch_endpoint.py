@@ -0,0 +1,35 @@
+from fastapi.testclient import TestClient
+
+import app
+
+PRODUCT = {'category_code': 'electronics.smartphone', 'brand': 'apple', 'price': 999.0,
+           'packaging_material': 'plastic', 'shipping_mode': 'air', 'usage_duration': '2 years',
+           'repairability_score': 4}
+
+def test_bad_item_does_not_fail_the_batch():
+    """An invalid product gets an error of its own while the others are still scored"""
+    products = [PRODUCT, dict(PRODUCT, repairability_score='lots'), dict(PRODUCT, brand='samsung')]
+    del products[1]['brand']
+    response = TestClient(app.app).post('/calculate-cf-batch', json=products)
+    assert response.status_code == 200
+    body = response.json()
+    assert body['count'] == 3 and body['error_count'] == 1
+
+    first, bad, last = body['results']
+    assert bad['index'] == 1 and 'cf_score' not in bad
+    assert sorted(tuple(error['loc']) for error in bad['error']) == [('brand',), ('repairability_score',)]
+    for index, result in ((0, first), (2, last)):
+        cf_score, cf_category = app.calculator.score_product(products[index])
+        assert result == {'index': index, 'cf_score': round(cf_score, 2), 'cf_category': cf_category}
+
+def test_oversized_batch_is_rejected(monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_SIZE', 2)
+    response = TestClient(app.app).post('/calculate-cf-batch', json=[PRODUCT] * 3)
+    assert response.status_code == 413
+
+if __name__ == "__main__":
+    import pytest
+    test_bad_item_does_not_fail_the_batch()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        test_oversized_batch_is_rejected(monkeypatch)
+    print("CF batch endpoint tests passed!")
@@ -0,0 +1,46 @@
+from carbon_footprint_calculator import CarbonFootprintCalculator
+
+PRODUCT = {'packaging_material': 'plastic', 'shipping_mode': 'air', 'usage_duration': '2 years',
+           'repairability_score': 4, 'brand': 'apple', 'category_code': 'electronics.smartphone'}
+
+def test_score_table_changes_invalidate_cached_scores():
+    """Every way of changing a score table must drop the cached results computed with it"""
+    mutations = [
+        lambda calculator: calculator.category_weights.__setitem__('electronics.smartphone', 0.5),
+        lambda calculator: calculator.packaging_material_scores.update({'plastic': 1}),
+        lambda calculator: calculator.brand_adjustments.pop('apple'),
+        lambda calculator: calculator.shipping_mode_scores.clear(),
+    ]
+    for mutate in mutations:
+        calculator = CarbonFootprintCalculator()
+        before = calculator.score_product(PRODUCT)
+        assert calculator.score_product(PRODUCT) == before and calculator.cache_stats()['hits'] == 1
+
+        mutate(calculator)
+        stats = calculator.cache_stats()
+        assert stats['invalidations'] == 1 and stats['size'] == 0
+        after = calculator.score_product(PRODUCT)
+        assert after != before
+        assert after[0] == calculator.calculate_cf_score(PRODUCT)
+
+def test_cache_evicts_least_recently_used():
+    calculator = CarbonFootprintCalculator(cache_size=2)
+    products = [dict(PRODUCT, brand=brand) for brand in ('apple', 'samsung', 'sony')]
+    calculator.score_product(products[0])
+    calculator.score_product(products[1])
+    # Using apple again makes samsung the least recently used
+    calculator.score_product(products[0])
+    calculator.score_product(products[2])
+
+    stats = calculator.cache_stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    calculator.score_product(products[0])
+    assert calculator.cache_stats()['hits'] == 2
+    calculator.score_product(products[1])
+    stats = calculator.cache_stats()
+    assert stats['misses'] == 4 and stats['evictions'] == 2 and stats['size'] == 2
+
+if __name__ == "__main__":
+    test_score_table_changes_invalidate_cached_scores()
+    test_cache_evicts_least_recently_used()
+    print("CF cache tests passed!")
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import carbon_footprint_calculator
+from carbon_footprint_calculator import CarbonFootprintCalculator, _ChunkSink, generate_sustainability_attributes
+
+def test_streaming_resumes_after_crash():
+    """An interrupted streaming run must resume and produce the same output as a full run"""
+    calculator = CarbonFootprintCalculator()
+    source = pd.read_csv(os.path.join('datasets', 'data.csv'))
+    products = pd.concat([source] * 50, ignore_index=True)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'products.csv')
+        output_path = os.path.join(tmp_dir, 'scored.csv')
+        products.to_csv(csv_path, index=False)
+        
+        # Fail while scoring the third chunk
+        score_dataframe = calculator.score_dataframe
+        calls = []
+        def crashing_score_dataframe(df):
+            calls.append(len(df))
+            if len(calls) == 3:
+                raise RuntimeError("simulated crash")
+            return score_dataframe(df)
+        
+        calculator.score_dataframe = crashing_score_dataframe
+        try:
+            calculator.process_dataset_streaming(csv_path, output_path, chunksize=120)
+        except RuntimeError:
+            pass
+        assert os.path.exists(output_path + '.checkpoint.json')
+        
+        calculator.score_dataframe = score_dataframe
+        summary = calculator.process_dataset_streaming(csv_path, output_path, chunksize=120)
+        
+        assert summary['rows'] == len(products)
+        assert not os.path.exists(output_path + '.checkpoint.json')
+        
+        scored = pd.read_csv(output_path)
+        expected = calculator.score_dataframe(products.copy())
+        assert np.array_equal(scored['cf_score'].to_numpy(), expected['cf_score'].to_numpy())
+        assert list(scored['order_id']) == list(expected['order_id'])
+
+def test_resume_starts_over_when_the_output_is_short():
+    """A checkpoint whose CSV output was lost or cut short must not be resumed"""
+    calculator = CarbonFootprintCalculator()
+    products = pd.concat([pd.read_csv(os.path.join('datasets', 'data.csv'))] * 20, ignore_index=True)
+    expected = calculator.score_dataframe(products.copy())
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'products.csv')
+        output_path = os.path.join(tmp_dir, 'scored.csv')
+        products.to_csv(csv_path, index=False)
+        
+        for damage in (lambda: os.truncate(output_path, os.path.getsize(output_path) // 2),
+                       lambda: os.remove(output_path)):
+            score_dataframe = calculator.score_dataframe
+            def crashing_score_dataframe(df):
+                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                    raise RuntimeError("simulated crash")
+                return score_dataframe(df)
+            calculator.score_dataframe = crashing_score_dataframe
+            try:
+                calculator.process_dataset_streaming(csv_path, output_path, chunksize=100)
+            except RuntimeError:
+                pass
+            calculator.score_dataframe = score_dataframe
+            damage()
+            
+            summary = calculator.process_dataset_streaming(csv_path, output_path, chunksize=100)
+            assert summary['rows'] == len(products)
+            scored = pd.read_csv(output_path)
+            assert list(scored['order_id']) == list(expected['order_id'])
+            assert np.array_equal(scored['cf_score'].to_numpy(), expected['cf_score'].to_numpy())
+            os.remove(output_path)
+
+def test_resume_only_removes_its_own_part_files():
+    """Resuming a parquet run drops the parts after the checkpoint and ignores other files"""
+    with tempfile.TemporaryDirectory() as output_path:
+        names = ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet', 'part-final.csv', 'part-1.parquet']
+        for name in names:
+            open(os.path.join(output_path, name), 'w').close()
+        
+        with _ChunkSink(output_path, 'parquet', {'chunks_done': 1, 'output_bytes': 0}):
+            pass
+        assert sorted(os.listdir(output_path)) == ['part-00000.parquet', 'part-1.parquet', 'part-final.csv']
+
+def test_parquet_output_without_an_engine_fails_before_scoring():
+    """Choosing parquet output without pyarrow or fastparquet must fail before any chunk is scored"""
+    calculator = CarbonFootprintCalculator()
+    engines = carbon_footprint_calculator.PARQUET_ENGINES
+    carbon_footprint_calculator.PARQUET_ENGINES = ('no_such_parquet_engine',)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'scored.parquet')
+            for process in (calculator.process_dataset_streaming, calculator.process_dataset_parallel):
+                try:
+                    process(os.path.join('datasets', 'data.csv'), output_path)
+                except ImportError as e:
+                    assert 'pyarrow' in str(e)
+                else:
+                    raise AssertionError("parquet output was accepted without an engine")
+            assert os.listdir(tmp_dir) == []
+    finally:
+        carbon_footprint_calculator.PARQUET_ENGINES = engines
+
+def test_generated_attributes_do_not_depend_on_chunking():
+    """The same seed must give the same attributes for a row however the dataset is chunked"""
+    whole = generate_sustainability_attributes(200000, seed=7)
+    
+    for start, size in [(0, 1), (65535, 2), (100000, 100000)]:
+        part = generate_sustainability_attributes(size, seed=7, start_row=start)
+        for column, values in part.items():
+            assert list(values) == list(whole[column][start:start + size])
+
+if __name__ == "__main__":
+    test_streaming_resumes_after_crash()
+    test_resume_starts_over_when_the_output_is_short()
+    test_resume_only_removes_its_own_part_files()
+    test_parquet_output_without_an_engine_fails_before_scoring()
+    test_generated_attributes_do_not_depend_on_chunking()
+    print("Streaming CF scoring tests passed!")
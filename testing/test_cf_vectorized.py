@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from carbon_footprint_calculator import CarbonFootprintCalculator
+
+def make_products(n, seed=0):
+    """Create a product frame covering known, unknown and odd attribute values"""
+    rng = np.random.default_rng(seed)
+    calculator = CarbonFootprintCalculator()
+    brands = list(calculator.brand_adjustments)[:50] + ['Apple', 'unknownbrand']
+    categories = list(calculator.category_weights) + ['sport.bicycle']
+    return pd.DataFrame({
+        'category_code': rng.choice(categories, n),
+        'brand': rng.choice(brands, n),
+        'packaging_material': rng.choice(['plastic', 'Cardboard', 'PAPER', 'glass', 'foam'], n),
+        'shipping_mode': rng.choice(['air', 'Road', 'rail', 'sea', 'local', 'drone'], n),
+        'usage_duration': rng.choice(['1 year', '3 years', '12 years', 'forever', '0 years'], n),
+        'repairability_score': rng.integers(-1, 13, n),
+    })
+
+def test_vectorized_scores_match_row_scores():
+    """calculate_cf_scores must give the same numbers as calculate_cf_score"""
+    calculator = CarbonFootprintCalculator()
+    df = make_products(2000)
+    
+    expected = df.apply(calculator.calculate_cf_score, axis=1).to_numpy()
+    actual = calculator.calculate_cf_scores(df)
+    
+    assert np.array_equal(expected, actual)
+
+def test_vectorized_categories_match_row_categories():
+    """classify_cf_scores must bin scores exactly like classify_cf_score"""
+    calculator = CarbonFootprintCalculator()
+    scores = np.array([0, 39.99, 40, 55, 69.99, 70, 100])
+    
+    expected = [calculator.classify_cf_score(s) for s in scores]
+    assert list(calculator.classify_cf_scores(scores)) == expected
+
+if __name__ == "__main__":
+    test_vectorized_scores_match_row_scores()
+    test_vectorized_categories_match_row_categories()
+    print("Vectorized CF scoring tests passed!")
@@ -0,0 +1,81 @@
+from chroma_db_integration import ChromaDBManager, _normalize_brand
+
+from testing.benchmark_product_store import make_catalog
+
+CATALOG_SIZE = 300
+
+# Products added after the catalog is built; the last one only reaches the purchase log before the restart
+NEW_PRODUCTS = [
+    {'category_code': 'electronics.smartphone', 'brand': 'SAMSUNG', 'cf_score': 0.5, 'cf_category': 'Low CF'},
+    {'category_code': 'toys.robot', 'brand': 'NewBrand', 'cf_score': 55.0, 'cf_category': 'Medium CF'},
+    {'category_code': 'toys.robot', 'brand': 'newbrand', 'cf_score': 12.0, 'cf_category': 'Low CF'},
+]
+
+def catalog_stages(tmp_path):
+    """The same catalog after products were added to it, then after a restart from its snapshot and log"""
+    csv_path = str(tmp_path / 'products.csv')
+    make_catalog(CATALOG_SIZE).to_csv(csv_path, index=False)
+    manager = ChromaDBManager(persistence_path=str(tmp_path / 'db'))
+    manager.load_or_build(csv_path, process_with_cf_calculator=False)
+    for product in NEW_PRODUCTS[:2]:
+        manager.add_product(product)
+    yield manager
+
+    manager.save_snapshot()
+    manager.add_product(NEW_PRODUCTS[2])
+    manager.close()
+    restarted = ChromaDBManager(persistence_path=str(tmp_path / 'db'))
+    assert restarted.load_or_build(csv_path, process_with_cf_calculator=False) is True
+    yield restarted
+    restarted.close()
+
+def test_id_lookups_after_adds_and_reload(tmp_path):
+    for manager, added in zip(catalog_stages(tmp_path), (2, 3)):
+        records = list(manager.products_data)
+        assert len(manager.ids) == len(records) == CATALOG_SIZE + added
+        for row in (0, 1, CATALOG_SIZE - 1):
+            assert manager.get_by_id(f"product_{row}") == records[row]
+        for offset in range(added):
+            assert manager.get_by_id(f"product_{CATALOG_SIZE + offset}") == NEW_PRODUCTS[offset]
+        assert manager.get_many(['product_0', f"product_{CATALOG_SIZE + added}", 'product_01', 'product_-1']) == \
+            [records[0], None, None, None]
+
+def test_brand_and_cf_category_postings_after_adds_and_reload(tmp_path):
+    for manager in catalog_stages(tmp_path):
+        records = list(manager.products_data)
+        everything = len(records)
+        for brand in ('samsung', 'SAMSUNG', 'NewBrand', records[0]['brand']):
+            expected = [record for record in records if _normalize_brand(record.get('brand')) == brand.lower()]
+            assert manager.query_by_brand(brand, limit=everything) == expected
+            assert [record for record, _ in manager.stream_by_brand(brand)] == expected
+        for cf_category in ('Low CF', 'Medium CF', 'High CF'):
+            expected = [record for record in records if record.get('cf_category') == cf_category]
+            assert manager.query_by_cf_category(cf_category, limit=everything) == expected
+        # Postings keep rows in insertion order, so a short page holds the earliest products
+        assert manager.query_by_brand('newbrand', limit=1) == [NEW_PRODUCTS[1]]
+
+def test_cf_sorted_alternatives_after_adds_and_reload(tmp_path):
+    for manager, added in zip(catalog_stages(tmp_path), (2, 3)):
+        records = list(manager.products_data)
+        new_ids = [f"product_{CATALOG_SIZE + offset}" for offset in range(added)]
+        smartphones = [row for row, record in enumerate(records) if record['category_code'] == 'electronics.smartphone']
+        top_smartphone = f"product_{max(smartphones, key=lambda row: records[row]['cf_score'])}"
+        for product_id in ['product_0', 'product_1', 'product_2', top_smartphone] + new_ids:
+            product = manager.get_by_id(product_id)
+            below = sorted((record['cf_score'], row) for row, record in enumerate(records)
+                           if record.get('category_code') == product['category_code']
+                           and record['cf_score'] < product['cf_score'])
+            for limit in (1, 5, len(records)):
+                assert manager.get_sustainable_alternatives(product_id, limit=limit) == \
+                    [records[row] for _, row in below[:limit]]
+        # The added smartphone is merged in among the bulk-built ones
+        assert NEW_PRODUCTS[0] in manager.get_sustainable_alternatives(top_smartphone, limit=len(records))
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_id_lookups_after_adds_and_reload(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_brand_and_cf_category_postings_after_adds_and_reload(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_cf_sorted_alternatives_after_adds_and_reload(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All ChromaDB index tests passed")
@@ -0,0 +1,68 @@
+import pytest
+from chroma_db_integration import ChromaDBManager
+from collection_pool import CollectionPool
+
+from testing.benchmark_product_store import make_catalog
+
+def make_pool(tmp_path, memory_budget_bytes):
+    """A pool hosting a default collection plus 'east' (with a snapshot) and 'west' (registered CSV)"""
+    persistence_path = str(tmp_path / 'db')
+    for name, rows in [('products', 100), ('east', 200), ('west', 300)]:
+        make_catalog(rows, seed=rows).to_csv(str(tmp_path / f"{name}.csv"), index=False)
+
+    default = ChromaDBManager(collection_name='products', persistence_path=persistence_path)
+    default.load_or_build(str(tmp_path / 'products.csv'), process_with_cf_calculator=False)
+    east = ChromaDBManager(collection_name='east', persistence_path=persistence_path)
+    east.load_or_build(str(tmp_path / 'east.csv'), process_with_cf_calculator=False)
+    east.close()
+
+    pool = CollectionPool(persistence_path, memory_budget_bytes)
+    pool.add(default, pinned=True)
+    pool.register('west', str(tmp_path / 'west.csv'), process_with_cf_calculator=False)
+    return pool
+
+def test_collections_load_lazily_and_evict_under_budget(tmp_path):
+    pool = make_pool(tmp_path, memory_budget_bytes=1)
+    assert pool.names() == ['east', 'products', 'west']
+    assert not pool.stats()['collections']['east']['resident']
+
+    with pool.collection('east') as east:
+        assert len(east.products_data) == 200
+        purchase_id = east.add_purchase_record({'brand': 'apple', 'user_id': 'u1', 'cf_score': 1.0})
+        # In use, so loading another collection over budget doesn't evict it
+        with pool.collection('west') as west:
+            assert len(west.products_data) == 300
+        assert pool.stats()['collections']['east']['resident']
+
+    # Using west again evicts the now idle east (least recently used); the pinned default stays
+    with pool.collection('west'):
+        pass
+    stats = pool.stats()['collections']
+    assert not stats['east']['resident'] and stats['east']['evictions'] == 1
+    assert stats['products']['resident'] and stats['products']['evictions'] == 0
+    assert (stats['west']['loads'], stats['west']['hits']) == (1, 1)
+
+    # Purchases logged before the eviction are replayed when the collection is loaded again
+    with pool.collection('east') as east:
+        assert east.get_by_id(purchase_id)['user_id'] == 'u1'
+    assert pool.stats()['collections']['east']['loads'] == 2
+    pool.close()
+
+def test_unknown_collections_are_rejected(tmp_path):
+    pool = make_pool(tmp_path, memory_budget_bytes=1 << 30)
+    with pytest.raises(KeyError):
+        with pool.collection('north'):
+            pass
+    with pytest.raises(ValueError):
+        with pool.collection('../products'):
+            pass
+    assert pool.evict('products') is False
+    pool.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_collections_load_lazily_and_evict_under_budget(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_unknown_collections_are_rejected(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All collection pool tests passed")
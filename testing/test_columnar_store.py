@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+from columnar_store import ColumnarStore
+from chroma_db_integration import ChromaDBManager
+from product_embeddings import EMBEDDING_DIM
+
+def make_frame():
+    return pd.DataFrame({
+        'event_time': ['2020-01-01 10:00:00', '2020-01-01 10:05:00', None, '2020-01-02 09:00:00'],
+        'brand': ['Apple', 'apple', None, 'Bosch'],
+        'category_code': ['electronics.laptop', 'electronics.laptop', 'appliances.kitchen', None],
+        'price': [1200.5, 999.0, np.nan, 45.25],
+        'repairability_score': [7, 5, 3, 9],
+        'cf_score': [67.8, 40.0, 12.5, 80.1],
+        'cf_category': ['Medium CF', 'Low CF', 'Low CF', 'High CF'],
+    })
+
+def test_records_round_trip():
+    """Stored records read back like df.to_dict(orient='records'), without the missing values"""
+    df = make_frame()
+    store = ColumnarStore.from_dataframe(df)
+
+    expected = [{key: value for key, value in record.items() if not pd.isna(value)}
+                for record in df.to_dict(orient='records')]
+    assert store.get_records(range(len(df))) == expected
+    assert type(store.get_record(0)['repairability_score']) is int
+    assert store.columns['category_code'].kind == 'dictionary'
+    assert store.columns['event_time'].kind == 'string'
+
+def test_append_widens_columns():
+    """Appended records can add keys, overflow integer types and put text in numeric columns"""
+    store = ColumnarStore.from_dataframe(make_frame())
+    store.append({'brand': 'Sony', 'repairability_score': 2**40, 'user_id': 17})
+    store.append({'repairability_score': 'n/a', 'event_time': '2020-01-03 08:00:00'})
+
+    assert store.get_record(4) == {'brand': 'Sony', 'repairability_score': 2**40, 'user_id': 17}
+    assert store.get_record(5) == {'event_time': '2020-01-03 08:00:00', 'repairability_score': 'n/a'}
+    assert store.get_record(0)['repairability_score'] == 7
+    assert 'user_id' not in store.get_record(0)
+
+def test_manager_queries_use_the_store():
+    manager = ChromaDBManager()
+    manager.load_dataframe(make_frame())
+    purchase_id = manager.add_purchase_record({'brand': 'APPLE', 'category_code': 'electronics.laptop',
+                                               'cf_score': 10.0, 'cf_category': 'Low CF', 'user_id': 1})
+
+    # Purchases are kept out of the catalog queries
+    assert list(manager.ids) == ['product_0', 'product_1', 'product_2', 'product_3']
+    assert purchase_id == 'purchase_0'
+    assert manager.get_by_id('product_1')['price'] == 999.0
+    assert manager.get_by_id('product_01') is None
+    assert [record['cf_score'] for record in manager.query_by_brand('apple')] == [67.8, 40.0]
+    assert [record['cf_score'] for record in manager.query_by_cf_category('Low CF', limit=2)] == [40.0, 12.5]
+    assert [record['cf_score'] for record in manager.get_sustainable_alternatives('product_0')] == [40.0]
+    assert manager.get_by_id(purchase_id)['user_id'] == 1
+    assert manager.embeddings.shape == (4, EMBEDDING_DIM)
+
+if __name__ == "__main__":
+    test_records_round_trip()
+    test_append_widens_columns()
+    test_manager_queries_use_the_store()
+    print("All columnar store tests passed")
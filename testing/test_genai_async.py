@@ -0,0 +1,80 @@
+import time
+import asyncio
+import genai_api
+from genai_api import GeminiInsightsGenerator, fallback_recommendations
+
+PRODUCT = {'category_code': 'electronics', 'brand': 'dell', 'price': 100.0, 'cf_score': 60}
+INSIGHTS = '{"product_assessment": "ok", "user_impact": "low"}'
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+class RateLimited(Exception):
+    code = 429
+
+class FakeModel:
+    """Async model that fails with the given errors first, then answers after delay_s"""
+
+    def __init__(self, errors=(), delay_s=0.0):
+        self.errors = list(errors)
+        self.delay_s = delay_s
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_s)
+            if self.errors:
+                raise self.errors.pop(0)
+            return Response(f"```json\n{INSIGHTS}\n```")
+        finally:
+            self.in_flight -= 1
+
+def make_generator(model):
+    generator = GeminiInsightsGenerator()
+    generator.get_model = lambda: model
+    return generator
+
+def test_retryable_errors_are_retried():
+    model = FakeModel(errors=[RateLimited("quota"), RateLimited("quota")])
+    generator = make_generator(model)
+    insights = asyncio.run(generator.generate_recommendations_async('u1', PRODUCT, deadline_s=10))
+    assert insights == {"product_assessment": "ok", "user_impact": "low"}
+    assert model.calls == 3 and generator.retry_count == 2
+
+def test_other_errors_are_not_retried():
+    model = FakeModel(errors=[ValueError("bad request")])
+    insights = asyncio.run(make_generator(model).generate_recommendations_async('u1', PRODUCT))
+    assert model.calls == 1 and insights['product_assessment'] == "Error: bad request"
+
+def test_deadline_returns_fallback_quickly():
+    generator = make_generator(FakeModel(delay_s=30))
+    started = time.monotonic()
+    insights = asyncio.run(generator.generate_recommendations_async('u1', PRODUCT, deadline_s=0.3,
+                                                                    attempt_timeout_s=0.2))
+    assert insights == fallback_recommendations()
+    assert time.monotonic() - started < 2 and generator.fallback_count == 1
+
+def test_in_flight_calls_are_capped():
+    model = FakeModel(delay_s=0.05)
+    generator = make_generator(model)
+
+    async def many_requests():
+        return await asyncio.gather(*(generator.generate_recommendations_async(f"u{n}", PRODUCT)
+                                      for n in range(3 * genai_api.MAX_CONCURRENT_REQUESTS)))
+
+    results = asyncio.run(many_requests())
+    assert all(result['product_assessment'] == "ok" for result in results)
+    assert model.max_in_flight == genai_api.MAX_CONCURRENT_REQUESTS
+
+if __name__ == "__main__":
+    test_retryable_errors_are_retried()
+    test_other_errors_are_not_retried()
+    test_deadline_returns_fallback_quickly()
+    test_in_flight_calls_are_capped()
+    print("All async Gemini tests passed")
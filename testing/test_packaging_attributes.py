@@ -0,0 +1,49 @@
+import warnings
+import numpy as np
+import pandas as pd
+from carbon_footprint_calculator import CarbonFootprintCalculator, generate_sustainability_attributes, \
+    load_packaging_attributes
+
+PACKAGING_CSV = (
+    "category_code,brand,Packaging Material,Shipping Mode,Usage Duration,Repairability Score\n"
+    "electronics.smartphone,Apple,Cardboard,Air,1,4\n"
+    "electronics.laptop,dell,Plastic,Road,3,7\n")
+
+def make_purchases():
+    return pd.DataFrame({
+        'order_id': [1, 2, 3, 4],
+        'category_code': ['electronics.smartphone', 'electronics.tablet', 'electronics.laptop', 'electronics.laptop'],
+        'brand': ['APPLE', 'apple', 'Dell', 'acer'],
+    })
+
+def test_unmatched_products_are_dropped_or_generated(tmp_path):
+    """Rows whose (category_code, brand) isn't in the table are removed or get seeded values, without warnings"""
+    csv_path = tmp_path / 'packaging.csv'
+    csv_path.write_text(PACKAGING_CSV)
+    attributes = load_packaging_attributes(str(csv_path))
+    calculator = CarbonFootprintCalculator()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.SettingWithCopyWarning)
+        dropped = calculator.add_sustainability_columns(make_purchases(), seed=3, packaging_attributes=attributes,
+                                                        fallback='drop')
+        generated = calculator.add_sustainability_columns(make_purchases(), seed=3, start_row=10,
+                                                          packaging_attributes=attributes)
+
+    assert list(dropped['order_id']) == [1, 3]
+    assert list(dropped['usage_duration']) == ['1 year', '3 years']
+    assert list(dropped['repairability_score']) == [4, 7] and dropped['repairability_score'].dtype == np.int64
+    assert dropped.loc[0, 'packaging_material'] == 'cardboard' and dropped.loc[2, 'shipping_mode'] == 'road'
+
+    assert list(generated['order_id']) == [1, 2, 3, 4]
+    expected = generate_sustainability_attributes(4, seed=3, start_row=10)
+    for column in ('packaging_material', 'shipping_mode', 'usage_duration', 'repairability_score'):
+        assert generated.loc[1, column] == expected[column][1] and generated.loc[3, column] == expected[column][3]
+        assert generated.loc[0, column] == dropped.loc[0, column]
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_unmatched_products_are_dropped_or_generated(pathlib.Path(tmp_dir))
+    print("Packaging attribute join tests passed!")
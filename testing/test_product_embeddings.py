@@ -0,0 +1,62 @@
+import numpy as np
+from columnar_store import ColumnarStore
+from chroma_db_integration import ChromaDBManager
+from product_embeddings import IVFIndex, embed_record, embed_store, top_k
+
+from testing.benchmark_product_store import make_catalog
+
+def test_record_and_store_embeddings_match():
+    """A record embedded on its own gets the same vector as in a bulk embedding"""
+    df = make_catalog(500)
+    df.loc[3, 'brand'] = None
+    store = ColumnarStore.from_dataframe(df)
+    matrix = embed_store(store)
+
+    assert matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1, atol=1e-5)
+    for row in [0, 3, 250, 499]:
+        assert np.allclose(embed_record(store.get_record(row)), matrix[row], atol=1e-6)
+
+def test_top_k_matches_full_sort():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((1000, 16)).astype(np.float32)
+    queries = rng.standard_normal((5, 16)).astype(np.float32)
+
+    rows, scores = top_k(matrix, queries, 10, block_rows=128)
+    expected = np.argsort(-(queries @ matrix.T), axis=1)[:, :10]
+    assert (rows == expected).all()
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+def test_ivf_probing_every_bucket_is_exact():
+    rng = np.random.default_rng(1)
+    matrix = rng.standard_normal((2000, 16)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    index = IVFIndex.build(matrix, n_lists=20)
+
+    for query in matrix[:20]:
+        rows, _ = index.search(matrix, query, 10, n_probe=20)
+        assert (rows == top_k(matrix, query, 10)[0][0]).all()
+
+def test_similar_alternatives_are_greener():
+    manager = ChromaDBManager(ann_min_records=1000)
+    manager.load_dataframe(make_catalog(3000))
+    purchase_id = manager.add_purchase_record(manager.get_by_id('product_0'))
+
+    cf_score = manager.get_by_id('product_0')['cf_score']
+    alternatives = manager.get_similar_alternatives('product_0', limit=5)
+    assert 0 < len(alternatives) <= 5
+    for alternative in alternatives:
+        assert alternative['cf_score'] < cf_score
+        assert alternative['cf_reduction'] == cf_score - alternative['cf_score']
+
+    # A purchase can be searched around too; the closest product is the one it was copied from
+    similar = manager.find_similar(purchase_id, limit=3)
+    assert similar[0] == dict(manager.get_by_id('product_0'), similarity=similar[0]['similarity'])
+    assert similar[0]['similarity'] > 0.99
+
+if __name__ == "__main__":
+    test_record_and_store_embeddings_match()
+    test_top_k_matches_full_sort()
+    test_ivf_probing_every_bucket_is_exact()
+    test_similar_alternatives_are_greener()
+    print("All embedding tests passed")
@@ -0,0 +1,118 @@
+import math
+import numpy as np
+import pytest
+from chroma_db_integration import ChromaDBManager
+
+from testing.benchmark_product_store import make_catalog
+
+def matches(record, where):
+    """Reference evaluation of a where clause on one record"""
+    if len(where) > 1:
+        # Several keys in one dictionary are an implicit $and (as in product_query.parse_where)
+        return all(matches(record, {key: spec}) for key, spec in where.items())
+    if '$and' in where:
+        return all(matches(record, clause) for clause in where['$and'])
+    if '$or' in where:
+        return any(matches(record, clause) for clause in where['$or'])
+    (field, spec), = where.items()
+    (op, operand), = spec.items() if isinstance(spec, dict) else [('$eq', spec)]
+    value = record.get(field)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return False
+    if op in ('$eq', '$ne', '$in', '$nin'):
+        found = value == operand if op in ('$eq', '$ne') else value in operand
+        return found if op in ('$eq', '$in') else not found
+    if isinstance(value, str):
+        return False
+    return {'$lt': value < operand, '$lte': value <= operand, '$gt': value > operand, '$gte': value >= operand}[op]
+
+def make_manager():
+    manager = ChromaDBManager()
+    df = make_catalog(3000)
+    df.loc[5, 'cf_score'] = np.nan
+    manager.load_dataframe(df)
+    first = manager.get_by_id('product_0')
+    manager.add_purchase_record(dict(first, brand=first['brand'].upper(), cf_score=0.5, price=None))
+    return manager
+
+def test_query_matches_reference():
+    manager = make_manager()
+    first = manager.get_by_id('product_0')
+    second = manager.get_by_id('product_1')
+    clauses = [
+        {'brand': first['brand']},
+        {'brand': {'$in': [first['brand'].upper(), second['brand']]}},
+        {'$and': [{'category_code': first['category_code']}, {'cf_score': {'$lt': 40}}]},
+        {'$and': [{'category_code': first['category_code']}, {'cf_score': {'$gte': 20}}, {'cf_score': {'$lte': 60}},
+                  {'price': {'$gt': 100}}]},
+        {'$or': [{'cf_category': 'Low CF'}, {'brand': second['brand']}]},
+        {'$or': [{'cf_category': 'Low CF'}, {'price': {'$lt': 10}}]},
+        {'packaging_material': {'$nin': ['plastic', 'foam']}, 'cf_score': {'$ne': 50.0}},
+        {'repairability_score': {'$in': [3, 4]}, 'brand': {'$ne': first['brand']}},
+    ]
+    records = list(manager.products_data)
+    for where in clauses:
+        expected = [record for record in records if matches(record, where)]
+        assert manager.query(where, limit=None) == expected
+        assert manager.query(where, limit=7) == expected[:7]
+
+        by_score = sorted(expected, key=lambda record: (0, record['cf_score']) if 'cf_score' in record else (1, 0))
+        assert manager.query(where, order_by='cf_score', limit=None) == by_score
+        by_price = sorted(expected, key=lambda record: -record['price'] if 'price' in record else math.inf)
+        assert manager.query(where, order_by='-price', limit=5) == by_price[:5]
+
+def test_explain_picks_the_most_selective_index():
+    manager = make_manager()
+    first = manager.get_by_id('product_0')
+    plan = manager.explain({'$and': [{'cf_category': 'High CF'}, {'brand': first['brand']}]})
+    assert (plan['access'], plan['index'], plan['keys']) == ('index', 'brand', [first['brand'].lower()])
+    assert plan['estimated_rows'] < plan['total_rows'] == 3000
+
+    plan = manager.explain({'category_code': first['category_code'], 'cf_score': {'$lt': 40}}, order_by='cf_score')
+    assert (plan['index'], plan['cf_score_range'], plan['sort']) == ('category_cf', '(-inf, 40.0)', 'index order')
+
+    assert manager.explain({'$or': [{'cf_category': 'Low CF'}, {'brand': 'apple'}]})['access'] == 'union'
+    assert manager.explain({'price': {'$lt': 10}}, order_by='-price')['access'] == 'scan'
+    assert manager.explain({'category_code': first['category_code']})['access'] == 'scan'
+
+def test_invalid_where_is_rejected():
+    manager = make_manager()
+    for where in [{'price': {'$lt': 'cheap'}}, {'brand': {'$like': 'a%'}}, {'$not': [{'brand': 'apple'}]},
+                  {'brand': {'$in': 'apple'}}, {'$and': []}]:
+        with pytest.raises(ValueError):
+            manager.query(where)
+
+def test_cursor_pages_and_streams():
+    manager = make_manager()
+    brand = manager.get_by_id('product_0')['brand']
+    expected = [record for record in manager.products_data
+                if isinstance(record.get('brand'), str) and record['brand'].lower() == brand.lower()]
+
+    pages = []
+    products, cursor = manager.page_by_brand(brand.upper(), limit=7)
+    while True:
+        pages.extend(products)
+        if cursor is None:
+            break
+        products, cursor = manager.page_by_brand(brand, limit=7, cursor=cursor)
+    assert pages == expected
+
+    streamed = list(manager.stream_by_cf_category('Low CF'))
+    assert [record for record, _ in streamed] == manager.query({'cf_category': 'Low CF'}, limit=None)
+    middle_cursor = streamed[9][1]
+    assert [record for record, _ in manager.stream_by_cf_category('Low CF', middle_cursor)] == \
+        [record for record, _ in streamed[10:]]
+    assert manager.page_by_cf_category('Low CF', limit=3, cursor=middle_cursor)[0] == \
+        [record for record, _ in streamed[10:13]]
+
+    with pytest.raises(ValueError):
+        manager.page_by_brand(brand, cursor=middle_cursor)
+    with pytest.raises(ValueError):
+        manager.stream_by_brand(brand, cursor='not-a-cursor')
+
+if __name__ == "__main__":
+    test_query_matches_reference()
+    test_explain_picks_the_most_selective_index()
+    test_invalid_where_is_rejected()
+    test_cursor_pages_and_streams()
+    print("All product query tests passed")
@@ -0,0 +1,70 @@
+import os
+import pytest
+from purchase_log import PurchaseLog
+
+def test_replay_after_reopen(tmp_path):
+    log = PurchaseLog(str(tmp_path), fsync_every_records=2, fsync_interval_ms=0)
+    assert log.append('purchase_0', {'brand': 'apple', 'cf_score': 12.5}) == 1
+    log.commit(1)
+    assert log.unsynced_count == 1
+    log.commit(log.append('purchase_1', {'brand': 'bosch', 'price': None}))
+    assert log.unsynced_count == 0 and log.fsync_count == 1
+    log.append('purchase_2', {'brand': 'sony'})
+    log.close()
+
+    reopened = PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    assert list(reopened.replay()) == [(1, 'purchase_0', {'brand': 'apple', 'cf_score': 12.5}),
+                                       (2, 'purchase_1', {'brand': 'bosch', 'price': None}),
+                                       (3, 'purchase_2', {'brand': 'sony'})]
+    assert [lsn for lsn, _, _ in reopened.replay(after_lsn=2)] == [3]
+    assert reopened.append('purchase_3', {}) == 4
+    reopened.close()
+
+def test_torn_tail_is_dropped(tmp_path):
+    log = PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    log.append('purchase_0', {'brand': 'apple'})
+    log.append('purchase_1', {'brand': 'bosch'})
+    log.close()
+    (path,) = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path) if name.endswith('.log')]
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 5)
+
+    reopened = PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    assert [record_id for _, record_id, _ in reopened.replay()] == ['purchase_0']
+    assert reopened.append('purchase_1', {'brand': 'bosch'}) == 2
+    reopened.close()
+
+def test_log_is_locked_while_open(tmp_path):
+    log = PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    with pytest.raises(RuntimeError):
+        PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    log.close()
+    PurchaseLog(str(tmp_path), fsync_interval_ms=0).close()
+
+def test_rotate_and_discard(tmp_path):
+    log = PurchaseLog(str(tmp_path), fsync_interval_ms=0, first_lsn=11)
+    log.append('purchase_0', {})
+    log.append('purchase_1', {})
+    assert log.rotate() == 12
+    log.append('purchase_2', {})
+
+    assert log.discard_through(12) == 1
+    assert sorted(os.listdir(tmp_path)) == ['LOCK', 'purchases-000000000013.log']
+    assert [lsn for lsn, _, _ in log.replay(after_lsn=12)] == [13]
+    log.close()
+
+    # An empty active segment keeps the numbering going after a restart
+    log = PurchaseLog(str(tmp_path), fsync_interval_ms=0)
+    log.rotate()
+    log.close()
+    assert PurchaseLog(str(tmp_path), fsync_interval_ms=0).last_lsn == 13
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_replay_after_reopen(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_torn_tail_is_dropped(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_log_is_locked_while_open(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_rotate_and_discard(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All purchase log tests passed")
@@ -0,0 +1,98 @@
+import csv
+import json
+import threading
+import pytest
+from purchase_sink import PurchaseSink
+
+COLUMNS = ['user_id', 'product_id', 'date', 'cf_score', 'choice']
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_concurrent_appends_are_all_merged(tmp_path):
+    csv_path = str(tmp_path / 'df_2.csv')
+    sink = PurchaseSink(csv_path, COLUMNS, rotate_bytes=2048, compact_interval_s=0)
+
+    def append_purchases(user):
+        for i in range(250):
+            sink.append({'user_id': user, 'product_id': f"p{i}", 'date': '2025-01-01', 'cf_score': i,
+                         'choice': 'ai_suggested', 'ignored': 'x'})
+
+    threads = [threading.Thread(target=append_purchases, args=(f"u{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sink.flush(timeout=10)
+    assert sink.written_count == 1000 and sink.batch_count <= 1000
+
+    assert len(sink.read_history()) == 1000
+    assert sink.compact() == 1000
+    rows = read_rows(csv_path)
+    assert len(rows) == 1000 and list(rows[0]) == COLUMNS
+    for n in range(4):
+        assert [row['product_id'] for row in rows if row['user_id'] == f"u{n}"] == [f"p{i}" for i in range(250)]
+    assert sink.compact() == 0
+    sink.close()
+
+def test_existing_history_gets_missing_columns(tmp_path):
+    csv_path = str(tmp_path / 'df_2.csv')
+    with open(csv_path, 'w') as f:
+        f.write("event_time,user_id,price\n2020-04-24 11:50:39,42,9.99\n")
+
+    sink = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    sink.append({'user_id': 'u1', 'product_id': 'p1', 'date': '2025-01-01', 'cf_score': 12.5, 'choice': 'original'})
+    sink.close()
+    # A new sink picks up the segments written by the previous one
+    reopened = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    assert reopened.compact() == 1
+    rows = read_rows(csv_path)
+    assert list(rows[0]) == ['event_time', 'user_id', 'price', 'product_id', 'date', 'cf_score', 'choice']
+    assert rows[0]['price'] == '9.99' and rows[0]['choice'] == ''
+    assert rows[1]['user_id'] == 'u1' and rows[1]['event_time'] == '' and rows[1]['cf_score'] == '12.5'
+    reopened.close()
+
+def test_interrupted_merge_is_redone_once(tmp_path):
+    csv_path = str(tmp_path / 'df_2.csv')
+    sink = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    sink.append({'user_id': 'u1', 'product_id': 'p1'})
+    sink.compact()
+    sink.append({'user_id': 'u2', 'product_id': 'p2'})
+    sink.close()
+
+    # Crash halfway through appending the second segment to the main CSV
+    with open(csv_path, 'rb') as f:
+        offset = len(f.read())
+    with open(csv_path, 'a') as f:
+        f.write("u2,p")
+    with open(sink.state_path) as f:
+        merged_through = json.load(f)['merged_through']
+    with open(sink.state_path, 'w') as f:
+        json.dump({'merged_through': merged_through, 'pending': {'offset': offset, 'through': merged_through + 2}}, f)
+
+    reopened = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    reopened.compact()
+    assert [row['product_id'] for row in read_rows(csv_path)] == ['p1', 'p2']
+    reopened.close()
+
+def test_sink_is_locked_while_open(tmp_path):
+    csv_path = str(tmp_path / 'df_2.csv')
+    sink = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    with pytest.raises(RuntimeError):
+        PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    sink.append({'user_id': 'u1', 'product_id': 'p1'})
+    sink.close()
+    reopened = PurchaseSink(csv_path, COLUMNS, compact_interval_s=0)
+    assert reopened.compact() == 1
+    reopened.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_concurrent_appends_are_all_merged(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_existing_history_gets_missing_columns(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_interrupted_merge_is_redone_once(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_sink_is_locked_while_open(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All purchase sink tests passed")
@@ -0,0 +1,44 @@
+from purchase_store import PurchaseStore
+
+def make_purchases():
+    purchases = PurchaseStore()
+    purchases.append('purchase_0', {'user_id': 'u1', 'product_id': 'product_3', 'date': '2024-01-01', 'choice': 'original'})
+    purchases.append('purchase_1', {'user_id': 7, 'product_id': 'product_5', 'date': '2024-01-02', 'choice': 'ai_suggested'})
+    purchases.append('purchase_2', {'user_id': 'u1', 'product_id': 'product_8', 'date': '2024-01-03', 'choice': 'ai_suggested'})
+    purchases.append('purchase_3', {'product_id': 'product_9', 'date': '2024-01-04'})
+    return purchases
+
+def test_user_history_newest_first():
+    purchases = make_purchases()
+
+    assert [p['purchase_id'] for p in purchases.get_user_purchases('u1')] == ['purchase_2', 'purchase_0']
+    assert [p['date'] for p in purchases.get_user_purchases('u1', newest_first=False)] == ['2024-01-01', '2024-01-03']
+    assert purchases.get_user_purchases('u1', limit=1)[0]['product_id'] == 'product_8'
+    # Numeric user IDs from CSV match the same ID sent as text
+    assert purchases.user_purchase_count('7') == purchases.user_purchase_count(7.0) == 1
+    assert purchases.get_user_purchases('nobody') == []
+    assert purchases.get_by_id('purchase_3') == {'product_id': 'product_9', 'date': '2024-01-04'}
+
+def test_next_id_skips_taken_ids():
+    purchases = PurchaseStore()
+    purchases.append('purchase_1', {'user_id': 'u1'})
+    assert purchases.next_id() == 'purchase_2'
+
+def test_save_and_load(tmp_path):
+    purchases = make_purchases()
+    entry = purchases.save(str(tmp_path / 'purchases'))
+    loaded = PurchaseStore.load(str(tmp_path / 'purchases'), entry)
+
+    assert loaded.ids == purchases.ids
+    assert list(loaded.records) == list(purchases.records)
+    loaded.append(loaded.next_id(), {'user_id': 'u1', 'date': '2024-01-05'})
+    assert [p['purchase_id'] for p in loaded.get_user_purchases('u1')] == ['purchase_4', 'purchase_2', 'purchase_0']
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_user_history_newest_first()
+    test_next_id_skips_taken_ids()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_save_and_load(pathlib.Path(tmp_dir))
+    print("All purchase store tests passed")
@@ -0,0 +1,95 @@
+import os
+import numpy as np
+from chroma_db_integration import ChromaDBManager
+
+from testing.benchmark_product_store import make_catalog
+
+def make_manager(tmp_path):
+    return ChromaDBManager(persistence_path=str(tmp_path / 'db'), ann_min_records=500)
+
+def test_snapshot_round_trip(tmp_path):
+    """A loaded snapshot answers queries exactly like the manager that saved it"""
+    csv_path = str(tmp_path / 'products.csv')
+    make_catalog(1000).to_csv(csv_path, index=False)
+
+    built = make_manager(tmp_path)
+    assert built.load_or_build(csv_path, process_with_cf_calculator=False) is False
+    built.add_purchase_record({'brand': 'samsung', 'category_code': 'electronics.smartphone', 'cf_score': 1.5})
+
+    built.save_snapshot()
+    # The restarted manager can only open the purchase log once this one has closed it
+    built.close()
+    loaded = make_manager(tmp_path)
+    assert loaded.load_or_build(csv_path, process_with_cf_calculator=False) is True
+    assert loaded.snapshot_version == 2
+    assert isinstance(loaded.embeddings, np.memmap)
+
+    assert list(loaded.ids) == list(built.ids)
+    assert list(loaded.products_data) == list(built.products_data)
+    assert np.array_equal(loaded.embeddings, built.embeddings)
+    for product_id in ['product_0', 'product_500', 'purchase_0']:
+        assert loaded.get_sustainable_alternatives(product_id) == built.get_sustainable_alternatives(product_id)
+        assert loaded.get_similar_alternatives(product_id) == built.get_similar_alternatives(product_id)
+    assert loaded.query_by_brand('SAMSUNG', limit=1000) == built.query_by_brand('SAMSUNG', limit=1000)
+
+    assert loaded.purchases.ids == built.purchases.ids
+    assert list(loaded.purchases.records) == list(built.purchases.records)
+
+    # Purchases can still be added to a memory-mapped store
+    purchase_id = loaded.add_purchase_record({'brand': 'apple', 'event_time': '2021-01-01 00:00:00', 'cf_score': 2.0})
+    assert loaded.get_by_id(purchase_id)['event_time'] == '2021-01-01 00:00:00'
+    assert purchase_id == 'purchase_1'
+
+def test_changed_csv_is_rebuilt(tmp_path):
+    csv_path = str(tmp_path / 'products.csv')
+    make_catalog(100).to_csv(csv_path, index=False)
+    first = make_manager(tmp_path)
+    first.load_or_build(csv_path, process_with_cf_calculator=False)
+    first.close()
+
+    make_catalog(120).to_csv(csv_path, index=False)
+    manager = make_manager(tmp_path)
+    assert manager.load_or_build(csv_path, process_with_cf_calculator=False) is False
+    assert len(manager.products_data) == 120
+    assert sorted(os.listdir(manager.snapshot_root)) == ['CURRENT', 'snapshot-000001', 'snapshot-000002']
+
+def test_purchases_survive_restart(tmp_path):
+    """Logged purchases are replayed on top of the snapshot, folded in by compaction and kept when the CSV changes"""
+    csv_path = str(tmp_path / 'products.csv')
+    make_catalog(100).to_csv(csv_path, index=False)
+
+    manager = make_manager(tmp_path)
+    manager.load_or_build(csv_path, process_with_cf_calculator=False)
+    first_id = manager.add_purchase_record({'brand': 'apple', 'user_id': 'u1', 'cf_score': 3.0})
+    manager.close()
+
+    restarted = make_manager(tmp_path)
+    assert restarted.load_or_build(csv_path, process_with_cf_calculator=False) is True
+    assert restarted.get_by_id(first_id) == {'brand': 'apple', 'user_id': 'u1', 'cf_score': 3.0}
+    second_id = restarted.add_purchase_record({'brand': 'bosch', 'user_id': 'u2', 'cf_score': 4.0})
+    restarted.compact()
+    restarted.close()
+    assert len([name for name in os.listdir(restarted.log_directory) if name.endswith('.log')]) == 1
+
+    compacted = make_manager(tmp_path)
+    assert compacted.load_or_build(csv_path, process_with_cf_calculator=False) is True
+    assert compacted.snapshot_version == 2
+    assert compacted.purchases.ids == [first_id, second_id]
+    assert [purchase['purchase_id'] for purchase in compacted.get_user_purchases('u2')] == [second_id]
+    compacted.close()
+
+    make_catalog(120).to_csv(csv_path, index=False)
+    rebuilt = make_manager(tmp_path)
+    assert rebuilt.load_or_build(csv_path, process_with_cf_calculator=False) is False
+    assert rebuilt.purchases.ids == [first_id, second_id]
+    assert rebuilt.get_by_id(second_id)['user_id'] == 'u2'
+    rebuilt.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_snapshot_round_trip(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_changed_csv_is_rebuilt(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_purchases_survive_restart(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All snapshot tests passed")
@@ -0,0 +1,78 @@
+import json
+import threading
+from sqlite_store import SQLiteDatabase, SQLitePurchases, SQLiteStreaks, open_streaks
+
+def test_purchases_are_read_per_user_newest_first(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'store.db'))
+    purchases = SQLitePurchases(database)
+    purchases.append({'user_id': 'u1', 'product_id': 'p1', 'date': '2025-01-02', 'cf_score': 10, 'choice': 'original'})
+    purchases.append({'user_id': 'u2', 'product_id': 'p2', 'date': '2025-01-01', 'cf_score': 20})
+    purchases.append({'user_id': 'u1', 'product_id': 'p3', 'date': '2025-01-03', 'cf_score': 30, 'note': 'gift'})
+    purchases.append({'user_id': 'u1', 'product_id': 'p4', 'date': '2025-01-01', 'cf_score': 40})
+
+    assert [p['product_id'] for p in purchases.get_user_purchases('u1')] == ['p3', 'p1', 'p4']
+    assert [p['product_id'] for p in purchases.get_user_purchases('u1', limit=2, newest_first=False)] == ['p4', 'p1']
+    latest = purchases.get_user_purchases('u1', limit=1)[0]
+    assert latest['cf_score'] == 30.0 and latest['note'] == 'gift' and 'choice' not in latest
+    assert purchases.get_user_purchases('nobody') == []
+    database.close()
+
+def test_concurrent_streak_updates_are_not_lost(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'store.db'))
+    streaks = SQLiteStreaks(database)
+
+    def choose_sustainably():
+        for _ in range(50):
+            streaks.record_choice('u1', True)
+
+    threads = [threading.Thread(target=choose_sustainably) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert streaks.get('u1') == 200
+    assert streaks.record_choice('u1', False) == 0 and streaks.get('u1') == 0
+    streaks.set('u2', 7)
+    assert streaks.get('u2') == 7 and streaks.get('u3') == 0
+    streaks.close()
+
+def test_flat_files_are_migrated_once(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'store.db'))
+    (tmp_path / 'datasets').mkdir()
+    (tmp_path / 'datasets' / 'df_2.csv').write_text(
+        "event_time,product_id,user_id,price,cf_score,choice,date\n"
+        "2020-04-24 11:50:39 UTC,1001,42,9.99,12.5,,\n"
+        ",1002,42,5.0,30,ai_suggested,2025-01-01\n")
+    (tmp_path / 'user_streaks.json').write_text(json.dumps({'45': 3, 'u1': 2}))
+    (tmp_path / 'user_streaks.txt').write_text("45,11\n46,4\n")
+
+    streaks = open_streaks(str(tmp_path), backend='sqlite')
+    # The JSON file is newer than the text file, so it wins for users in both
+    assert streaks.get('45') == 3 and streaks.get('46') == 4 and streaks.get('u1') == 2
+    assert streaks.record_choice('46', True) == 5
+    streaks.close()
+
+    database = SQLiteDatabase(str(tmp_path / 'store.db'))
+    purchases = SQLitePurchases(database)
+    history = purchases.get_user_purchases(42)
+    assert [p['product_id'] for p in history] == ['1002', '1001']
+    assert history[1]['date'] == '2020-04-24' and history[1]['event_time'] == '2020-04-24 11:50:39 UTC'
+    assert not database.migrate_from_files(str(tmp_path / 'datasets' / 'df_2.csv'))
+    assert len(purchases.get_user_purchases('42')) == 2
+    assert SQLiteStreaks(database).get('46') == 5
+    database.close()
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import pathlib
+
+    class _Env:
+        def setenv(self, name, value):
+            os.environ[name] = value
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_purchases_are_read_per_user_newest_first(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_concurrent_streak_updates_are_not_lost(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_flat_files_are_migrated_once(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)), _Env())
+    print("All SQLite store tests passed")
@@ -0,0 +1,68 @@
+import json
+import threading
+import pytest
+from streak_service import StreakService
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    json_path = str(tmp_path / 'user_streaks.json')
+    with open(json_path, 'w') as f:
+        json.dump({'u1': 3}, f)
+    service = StreakService(json_path, flush_interval_s=0)
+    assert service.get('u1') == 3 and service.get('unknown') == 0
+
+    def extend(count):
+        for _ in range(count):
+            service.record_choice('u1', True)
+
+    workers = [threading.Thread(target=extend, args=(500,)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert service.get('u1') == 4003
+    assert service.record_choice('u2', False) == 0
+
+    # Nothing reaches the file until a flush
+    with open(json_path) as f:
+        assert json.load(f) == {'u1': 3}
+    assert service.dirty_count == 2
+    assert service.flush() is True and service.flush() is False
+    service.close()
+    with open(json_path) as f:
+        assert json.load(f) == {'u1': 4003, 'u2': 0}
+    assert StreakService(json_path, flush_interval_s=0).get('u1') == 4003
+
+def test_dirty_threshold_wakes_the_flusher(tmp_path):
+    json_path = str(tmp_path / 'user_streaks.json')
+    service = StreakService(json_path, flush_interval_s=60, flush_dirty_users=3)
+    for user in ['a', 'b', 'c']:
+        service.record_choice(user, True)
+    for _ in range(200):
+        if service.flush_count:
+            break
+        threading.Event().wait(0.01)
+    assert service.flush_count == 1
+    service.record_choice('d', True)
+    service.close()
+    with open(json_path) as f:
+        assert json.load(f) == {'a': 1, 'b': 1, 'c': 1, 'd': 1}
+
+def test_streak_file_is_locked_while_open(tmp_path):
+    json_path = str(tmp_path / 'user_streaks.json')
+    service = StreakService(json_path, flush_interval_s=0)
+    with pytest.raises(RuntimeError):
+        StreakService(json_path, flush_interval_s=0)
+    service.record_choice('u1', True)
+    service.close()
+    reopened = StreakService(json_path, flush_interval_s=0)
+    assert reopened.get('u1') == 1
+    reopened.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_concurrent_updates_are_not_lost(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_dirty_threshold_wakes_the_flusher(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_streak_file_is_locked_while_open(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All streak service tests passed")
@@ -0,0 +1,89 @@
+from purchase_sink import PurchaseSink
+from sqlite_store import SQLiteDatabase, SQLitePurchases
+from user_history import IndexedPurchases, UserHistoryIndex, open_user_history
+
+RECORDS = [
+    {'user_id': 'u1', 'product_id': 'p1', 'date': '2025-01-01', 'cf_score': 10.0, 'choice': 'original'},
+    {'user_id': 'u1', 'product_id': 'p2', 'date': '2025-01-03', 'cf_score': 20.0, 'choice': 'ai_suggested'},
+    {'user_id': 7, 'product_id': 'p3', 'date': '2025-01-02', 'cf_score': 5.0, 'choice': 'ai_suggested'},
+    # Arrives late but belongs before p2
+    {'user_id': 'u1', 'product_id': 'p4', 'date': '2025-01-02', 'cf_score': 30.0, 'choice': 'ai_suggested'},
+]
+
+def make_index():
+    index = UserHistoryIndex()
+    for record in RECORDS:
+        index.add(record)
+    return index
+
+def test_latest_purchases_follow_dates():
+    index = make_index()
+
+    assert [p['product_id'] for p in index.last_purchases('u1')] == ['p2', 'p4', 'p1']
+    assert index.last_purchases('u1', limit=2) == [
+        {'product_id': 'p2', 'date': '2025-01-03', 'cf_score': 20.0, 'choice': 'ai_suggested'},
+        {'product_id': 'p4', 'date': '2025-01-02', 'cf_score': 30.0, 'choice': 'ai_suggested'}]
+    # Numeric user IDs from CSV match the same ID sent as text
+    assert index.purchase_count_of('7') == 1 and index.purchase_count_of(7.0) == 1
+    assert index.last_purchases('nobody') == [] and index.purchase_count_of('nobody') == 0
+
+def test_cf_total_over_a_window():
+    index = make_index()
+
+    assert index.cf_total('u1') == {'total': 60.0, 'count': 3, 'average': 20.0}
+    assert index.cf_total('u1', start='2025-01-02') == {'total': 50.0, 'count': 2, 'average': 25.0}
+    assert index.cf_total('u1', start='2025-01-02', end='2025-01-02')['total'] == 30.0
+    assert index.cf_total('u1', end='2024-12-31') == {'total': 0.0, 'count': 0, 'average': None}
+
+def test_chunked_load_merges_with_later_purchases(tmp_path):
+    csv_path = tmp_path / 'df_2.csv'
+    csv_path.write_text(
+        "event_time,product_id,user_id,price,cf_score,choice,date\n"
+        "2020-04-25 10:00:00 UTC,1001,42,9.99,12.5,,\n"
+        ",1002,42,5.0,30,ai_suggested,2025-01-01\n"
+        "2020-04-24 09:00:00 UTC,1003,42,1.0,1.5,,\n"
+        ",1004,,1.0,2.0,,2025-01-01\n"
+        ",1005,43,1.0,,original,2025-01-01\n")
+    sink = PurchaseSink(str(csv_path), ['user_id', 'product_id', 'date', 'cf_score', 'choice'], compact_interval_s=0)
+    # Written to a segment, not merged into the main CSV yet
+    sink.append({'user_id': 43, 'product_id': 1006, 'date': '2024-12-31', 'cf_score': 4.0})
+    purchases = IndexedPurchases(sink)
+    assert purchases.load(chunk_rows=2) == 5
+    index = purchases.index
+    assert len(index) == 2 and index.purchase_count == 5
+
+    assert [p['product_id'] for p in index.last_purchases('42')] == [1002, 1001, 1003]
+    assert index.last_purchases('42')[1] == {'product_id': 1001, 'date': '2020-04-25', 'cf_score': 12.5}
+    assert index.last_purchases(43) == [{'product_id': 1005, 'date': '2025-01-01', 'choice': 'original'},
+                                        {'product_id': 1006, 'date': '2024-12-31', 'cf_score': 4.0}]
+    purchases.append({'user_id': '42', 'product_id': 1007, 'date': '2020-04-26', 'cf_score': 3.0})
+    assert [p['product_id'] for p in index.last_purchases(42, limit=3)] == [1002, 1007, 1001]
+    assert index.purchase_count_of(42.0) == 4
+    assert index.cf_total('42', start='2020-04-25', end='2020-12-31') == {'total': 15.5, 'count': 2, 'average': 7.75}
+    purchases.close()
+
+def test_sqlite_history_matches_the_index(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'store.db'))
+    history = open_user_history(SQLitePurchases(database))
+    assert isinstance(history, SQLitePurchases)
+    for record in RECORDS + [{'user_id': 'u1', 'product_id': 'p5', 'cf_score': 1.0}]:
+        history.append(record)
+    index = make_index()
+    index.add({'user_id': 'u1', 'product_id': 'p5', 'cf_score': 1.0})
+
+    for user_id in ('u1', 7, 'nobody'):
+        assert history.purchase_count_of(user_id) == index.purchase_count_of(user_id)
+        assert history.last_purchases(user_id, limit=3) == index.last_purchases(user_id, limit=3)
+        for start, end in ((None, None), ('2025-01-02', None), (None, '2025-01-02'), ('2025-01-02', '2025-01-02')):
+            assert history.cf_total(user_id, start, end) == index.cf_total(user_id, start, end)
+    database.close()
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+    test_latest_purchases_follow_dates()
+    test_cf_total_over_a_window()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_chunked_load_merges_with_later_purchases(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+        test_sqlite_history_matches_the_index(pathlib.Path(tempfile.mkdtemp(dir=tmp_dir)))
+    print("All user history tests passed")
@@ -1,32 +1,21 @@
-import json
 import os
 
+from sqlite_store import open_streaks
+
 def update_streak(user_id, is_sustainable):
-    """Update user streak in the JSON file"""
-    json_path = 'user_streaks.json'
-    
+    """Update user streak in the configured streak storage (user_streaks.json or SQLite)"""
+    streaks = None
     try:
-        # Read current streaks
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                user_streaks = json.load(f)
-        else:
-            user_streaks = {}
-        
-        # Update streak
-        if is_sustainable:
-            user_streaks[user_id] = user_streaks.get(user_id, 0) + 1
-        else:
-            user_streaks[user_id] = 0
-        
-        # Write back to file
-        with open(json_path, 'w') as f:
-            json.dump(user_streaks, f)
-        
-        return user_streaks[user_id]
+        # Both backends share the StreakService interface
+        streaks = open_streaks(os.path.dirname(os.path.abspath(__file__)))
+        return streaks.record_choice(user_id, is_sustainable)
     except Exception as e:
         print(f"Error updating streak: {e}")
         return None
+    finally:
+        # Closing writes the change back (files backend) and releases the connections (SQLite backend)
+        if streaks is not None:
+            streaks.close()
 
 if __name__ == "__main__":
     import sys
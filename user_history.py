@@ -0,0 +1,304 @@
+import bisect
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from purchase_store import user_key
+from sqlite_store import SQLitePurchases
+
+# Columns of the stored history the index reads (the rest of each row is never loaded)
+HISTORY_COLUMNS = ['user_id', 'product_id', 'date', 'event_time', 'cf_score', 'choice']
+
+# Rows of the stored history read at a time when it is indexed at startup
+LOAD_CHUNK_ROWS = 100_000
+
+# Day number of purchases without a date (sorts before every real day)
+UNKNOWN_DAY = np.iinfo(np.int32).min
+
+_EPOCH = date(1970, 1, 1)
+
+
+def _day(value) -> int:
+    """Day number (days since 1970-01-01) of a date or timestamp string, UNKNOWN_DAY if it has none"""
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return (date.fromisoformat(value[:10]) - _EPOCH).days
+        except ValueError:
+            pass
+    return UNKNOWN_DAY
+
+
+def _day_text(day: int) -> Optional[str]:
+    return (_EPOCH + timedelta(days=int(day))).isoformat() if day != UNKNOWN_DAY else None
+
+
+def _chunk_days(chunk: pd.DataFrame) -> np.ndarray:
+    """Day numbers of a chunk's rows, from 'date' or else the start of 'event_time'"""
+    days = pd.Series(pd.NaT, index=chunk.index, dtype='datetime64[ns]')
+    for field in ('event_time', 'date'):
+        if field in chunk:
+            parsed = pd.to_datetime(chunk[field].astype(str).str[:10], format='%Y-%m-%d', errors='coerce')
+            days = parsed.where(parsed.notna(), days)
+    numbers = np.full(len(chunk), UNKNOWN_DAY, dtype=np.int32)
+    known = days.notna().to_numpy()
+    numbers[known] = days[known].to_numpy().astype('datetime64[D]').astype(np.int64)
+    return numbers
+
+
+def _plain(value):
+    """Python scalar for a NumPy one (so records serialize as JSON)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class _Tail:
+    """Purchases of one user recorded after the bulk load, sorted by day"""
+
+    __slots__ = ('days', 'rows')
+
+    def __init__(self):
+        self.days = []
+        self.rows = []
+
+    def insert(self, day: int, row: Tuple):
+        # Purchases almost always arrive in date order, so this is usually an append
+        position = bisect.bisect_right(self.days, day)
+        self.days.insert(position, day)
+        self.rows.insert(position, row)
+
+
+class UserHistoryIndex:
+    """
+    Per-user, date-ordered purchase index over the CSV purchase history
+
+    The stored history is loaded once in bulk into a few compact arrays (day, CF score,
+    choice code, product code), sorted by user and day, with the slice of each user.
+    Purchases recorded afterwards go to a small per-user tail. The last N purchases
+    and the CF total over a date window therefore cost time proportional to the
+    user's own history (the window is found by binary search).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ranges = {}
+        self._days = np.empty(0, dtype=np.int32)
+        self._cf_scores = np.empty(0, dtype=np.float32)
+        self._choices = np.empty(0, dtype=np.int8)
+        self._products = np.empty(0, dtype=np.int32)
+        self._product_values = np.empty(0, dtype=object)
+        # Code 0 means no choice recorded
+        self._choice_names = [None]
+        self._choice_codes = {}
+        self._tails = {}
+        self.purchase_count = 0
+
+    def __len__(self) -> int:
+        """Number of users with purchases"""
+        return len(self._ranges.keys() | self._tails.keys())
+
+    def _choice_code(self, choice) -> int:
+        if not isinstance(choice, str) or not choice:
+            return 0
+        code = self._choice_codes.get(choice)
+        if code is None:
+            code = self._choice_codes[choice] = len(self._choice_names)
+            self._choice_names.append(choice)
+        return code
+
+    def load_chunks(self, chunks: Iterable[pd.DataFrame]) -> int:
+        """
+        Bulk-load the stored history (call once, before add())
+
+        Args:
+            chunks: DataFrames with (some of) HISTORY_COLUMNS, oldest rows first
+
+        Returns:
+            Number of purchases indexed
+        """
+        keys, days, cf_scores, choices, products = [], [], [], [], []
+        for chunk in chunks:
+            if 'user_id' not in chunk or len(chunk) == 0:
+                continue
+            chunk_keys = chunk['user_id'].map(user_key)
+            chunk = chunk[chunk_keys.notna().to_numpy()]
+            keys.append(chunk_keys.dropna().to_numpy(dtype=object))
+            days.append(_chunk_days(chunk))
+            cf_scores.append(pd.to_numeric(chunk['cf_score'], errors='coerce').to_numpy(dtype=np.float32)
+                             if 'cf_score' in chunk else np.full(len(chunk), np.nan, dtype=np.float32))
+            if 'choice' in chunk:
+                names, codes = np.unique(chunk['choice'].fillna('').astype(str).to_numpy(), return_inverse=True)
+                choices.append(np.array([self._choice_code(name) for name in names], dtype=np.int8)[codes])
+            else:
+                choices.append(np.zeros(len(chunk), dtype=np.int8))
+            products.append(chunk['product_id'].to_numpy(dtype=object) if 'product_id' in chunk
+                            else np.full(len(chunk), None, dtype=object))
+        if not keys:
+            return 0
+
+        user_codes, users = pd.factorize(np.concatenate(keys))
+        days = np.concatenate(days)
+        # lexsort is stable, so purchases on the same day keep their arrival order
+        order = np.lexsort((days, user_codes))
+        user_codes = user_codes[order]
+        product_codes, product_values = pd.factorize(np.concatenate(products)[order], use_na_sentinel=True)
+        with self._lock:
+            self._days = days[order]
+            self._cf_scores = np.concatenate(cf_scores)[order]
+            self._choices = np.concatenate(choices)[order]
+            self._products = product_codes.astype(np.int32)
+            self._product_values = np.asarray(product_values, dtype=object)
+            starts = np.flatnonzero(np.r_[True, user_codes[1:] != user_codes[:-1]])
+            stops = np.r_[starts[1:], len(user_codes)]
+            self._ranges = {users[user_codes[start]]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+            self.purchase_count += len(user_codes)
+        return len(user_codes)
+
+    def add(self, record: Dict[str, Any]) -> bool:
+        """
+        Index a purchase record
+
+        Returns:
+            False if the record has no user ID (it isn't indexed)
+        """
+        key = user_key(record.get('user_id'))
+        if key is None:
+            return False
+        day = _day(record.get('date')) if record.get('date') else _day(record.get('event_time'))
+        try:
+            cf_score = float(record.get('cf_score'))
+        except (TypeError, ValueError):
+            cf_score = float('nan')
+        with self._lock:
+            row = (cf_score, self._choice_code(record.get('choice')), record.get('product_id'))
+            self._tails.setdefault(key, _Tail()).insert(day, row)
+            self.purchase_count += 1
+        return True
+
+    def _user_rows(self, user_id) -> Tuple[np.ndarray, np.ndarray, List[Tuple[int, Tuple]]]:
+        """(days, positions) of the user's bulk-loaded purchases and the (day, row) pairs of the later ones"""
+        key = user_key(user_id)
+        start, stop = self._ranges.get(key, (0, 0))
+        tail = self._tails.get(key)
+        tail_rows = list(zip(tail.days, tail.rows)) if tail is not None else []
+        return self._days[start:stop], np.arange(start, stop), tail_rows
+
+    def purchase_count_of(self, user_id) -> int:
+        days, _, tail_rows = self._user_rows(user_id)
+        return len(days) + len(tail_rows)
+
+    def _record(self, day: int, cf_score: float, choice: int, product) -> Dict[str, Any]:
+        record = {'product_id': _plain(product), 'date': _day_text(day),
+                  'cf_score': None if np.isnan(cf_score) else round(float(cf_score), 2),
+                  'choice': self._choice_names[choice]}
+        return {key: value for key, value in record.items() if value is not None}
+
+    def last_purchases(self, user_id, limit: int = 10) -> List[Dict[str, Any]]:
+        """The user's latest purchases, newest first (product_id, date, cf_score and choice of each)"""
+        if limit <= 0:
+            return []
+        with self._lock:
+            days, positions, tail_rows = self._user_rows(user_id)
+            # The newest purchases are among the last `limit` of each part
+            candidates = [(int(day), 0, int(position)) for day, position in zip(days[-limit:], positions[-limit:])]
+            candidates += [(day, 1, n) for n, (day, _) in enumerate(tail_rows[-limit:])]
+            tail_rows = tail_rows[-limit:]
+            records = []
+            # Later days first; on the same day later-recorded purchases first
+            for day, part, n in sorted(candidates, reverse=True)[:limit]:
+                if part == 0:
+                    product_code = self._products[n]
+                    product = self._product_values[product_code] if product_code >= 0 else None
+                    records.append(self._record(day, self._cf_scores[n], self._choices[n], product))
+                else:
+                    cf_score, choice, product = tail_rows[n][1]
+                    records.append(self._record(day, cf_score, choice, product))
+        return records
+
+    def cf_total(self, user_id, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sum of the CF scores of the user's purchases in a date window
+
+        Args:
+            user_id: ID of the user
+            start: First day of the window (YYYY-MM-DD, None for no lower bound)
+            end: Last day of the window, inclusive (YYYY-MM-DD, None for no upper bound)
+
+        Returns:
+            Dictionary with 'total', 'count' (purchases in the window) and 'average'
+        """
+        # Purchases without a date count only when the window is unbounded on both sides
+        low_day = _day(start) if start else (UNKNOWN_DAY + 1 if end else UNKNOWN_DAY)
+        high_day = _day(end) if end else np.iinfo(np.int32).max
+        with self._lock:
+            days, positions, tail_rows = self._user_rows(user_id)
+            low = int(np.searchsorted(days, low_day, side='left'))
+            high = int(np.searchsorted(days, high_day, side='right'))
+            scores = self._cf_scores[positions[low:high]]
+            total = float(np.nansum(scores, dtype=np.float64))
+            count = high - low
+            for day, (cf_score, _, _) in tail_rows:
+                if low_day <= day <= high_day:
+                    count += 1
+                    if not np.isnan(cf_score):
+                        total += cf_score
+        return {'total': round(total, 2), 'count': count, 'average': round(total / count, 2) if count else None}
+
+
+class IndexedPurchases:
+    """
+    PurchaseSink wrapper that also feeds a UserHistoryIndex
+
+    Every purchase appended to the sink is indexed at the same time, and history
+    queries (purchase_count_of, last_purchases, cf_total) are answered by the index.
+    """
+
+    def __init__(self, backend, index: Optional[UserHistoryIndex] = None):
+        self.backend = backend
+        self.index = index if index is not None else UserHistoryIndex()
+
+    def load(self, chunk_rows: int = LOAD_CHUNK_ROWS) -> int:
+        """
+        Index the purchases already in the sink (call once, before appending)
+
+        Only HISTORY_COLUMNS are read, chunk_rows rows at a time.
+
+        Returns:
+            Number of purchases indexed
+        """
+        return self.index.load_chunks(self.backend.iter_history(HISTORY_COLUMNS, chunk_rows))
+
+    def append(self, record: Dict[str, Any]):
+        result = self.backend.append(record)
+        self.index.add(record)
+        return result
+
+    def purchase_count_of(self, user_id) -> int:
+        return self.index.purchase_count_of(user_id)
+
+    def last_purchases(self, user_id, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.index.last_purchases(user_id, limit)
+
+    def cf_total(self, user_id, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+        return self.index.cf_total(user_id, start, end)
+
+    def read_history(self):
+        return self.backend.read_history()
+
+    def close(self):
+        self.backend.close()
+
+
+def open_user_history(backend):
+    """
+    Purchase history that answers per-user queries (purchase_count_of, last_purchases, cf_total)
+
+    SQLite already keeps a (user_id, date) index, so its purchases are queried directly;
+    a PurchaseSink gets an in-memory UserHistoryIndex, loaded here from the stored history.
+    """
+    if isinstance(backend, SQLitePurchases):
+        return backend
+    history = IndexedPurchases(backend)
+    count = history.load()
+    print(f"Indexed {count} purchases of {len(history.index)} users")
+    return history